@@ -0,0 +1,81 @@
+import numpy as np
+
+# Frames per block handed between render, cache, alignment and the encoder
+BLOCK_FRAMES = 65536
+
+
+def array_blocks(audio, block_frames=BLOCK_FRAMES):
+    """Yields consecutive views of an array with samples on axis 0; nothing is copied."""
+    for start in range(0, len(audio), block_frames):
+        yield audio[start:start + block_frames]
+
+
+def tone_blocks(duration, sample_rate, freq=440.0, gain=0.1, block_frames=BLOCK_FRAMES):
+    """
+    Block-wise version of `np.sin(2*pi*freq*np.linspace(0, duration, n)) * gain`,
+    producing exactly the same float32 samples.
+    """
+    frames = int(sample_rate * duration)
+    step = duration / (frames - 1) if frames > 1 else 0.0
+    for start in range(0, frames, block_frames):
+        end = min(start + block_frames, frames)
+        t = np.arange(start, end) * step
+        if end == frames:
+            # linspace pins the last sample to the endpoint exactly
+            t[-1] = duration
+        yield (np.sin(2 * np.pi * freq * t) * gain).astype(np.float32)
+
+
+def video_alignment(manifest, sample_rate):
+    """
+    Returns (start, length) in frames that line audio rendered from the
+    session start up with the first video frame and the video's length,
+    or None if the manifest has no usable video entry.
+    """
+    video = manifest.get("streams", {}).get("video") if manifest else None
+    if not video or not video.get("fps") or video.get("frames") is None:
+        return None
+    start = int(round(video.get("offset_seconds", 0.0) * sample_rate))
+    length = int(round(video["frames"] / video["fps"] * sample_rate))
+    return start, length
+
+
+def aligned_blocks(blocks, start, length, frame_shape, dtype=np.float32, block_frames=BLOCK_FRAMES):
+    """
+    Streams `blocks` trimmed/padded so the output begins `start` frames into
+    the input (negative: that many frames of leading silence) and is exactly
+    `length` frames long. Same samples as slicing/padding the whole array.
+    """
+    def silence(frames):
+        while frames > 0:
+            n = min(frames, block_frames)
+            yield np.zeros((n,) + frame_shape, dtype=dtype)
+            frames -= n
+
+    remaining = length
+    if start < 0:
+        lead = min(-start, remaining)
+        yield from silence(lead)
+        remaining -= lead
+    skip = max(start, 0)
+
+    for block in blocks:
+        if remaining <= 0:
+            # Keep pulling so upstream taps (e.g. the render cache writer) see the whole stream
+            continue
+        if skip:
+            dropped = min(skip, len(block))
+            block = block[dropped:]
+            skip -= dropped
+        block = block[:remaining]
+        if len(block):
+            yield block
+            remaining -= len(block)
+
+    yield from silence(remaining)
+
+
+def float32_blocks(blocks):
+    """Contiguous float32 copies of each block, ready for a raw PCM writer."""
+    for block in blocks:
+        yield np.ascontiguousarray(block, dtype=np.float32)
@@ -0,0 +1,258 @@
+import os
+
+from .lazy import LazyModule
+from .live_feed import LevelMeter
+from .peaks import to_float
+from .wav_writer import StreamingWavWriter, WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT
+
+np = LazyModule("numpy")
+pyaudio = LazyModule("pyaudio")
+
+# name -> (PyAudio format attribute, bytes per sample, WAV format tag)
+SAMPLE_FORMATS = {
+    "int16": ("paInt16", 2, WAVE_FORMAT_PCM),
+    "int24": ("paInt24", 3, WAVE_FORMAT_PCM),
+    "float32": ("paFloat32", 4, WAVE_FORMAT_IEEE_FLOAT),
+}
+PA_INPUT_OVERFLOW = 0x2 # paInputOverflow status flag passed to stream callbacks
+PA_CONTINUE = 0
+PRIMARY_STREAM = "audio" # Stream name of the first device; the others are audio_1, audio_2, ...
+
+
+class ClockFit:
+    """
+    Running least-squares fit of buffer arrival time against frames
+    delivered. The slope is how long one nominal second of the device's
+    audio takes on the session clock, i.e. the device's rate error; arrival
+    jitter averages out over the take.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self._x0 = None
+        self._y0 = None
+        self._sx = self._sy = self._sxx = self._sxy = 0.0
+
+    def add(self, nominal_seconds, arrival_seconds):
+        if self._x0 is None:
+            self._x0, self._y0 = nominal_seconds, arrival_seconds
+        # Relative to the first point so the sums stay well inside float64 precision
+        x = nominal_seconds - self._x0
+        y = arrival_seconds - self._y0
+        self.n += 1
+        self._sx += x
+        self._sy += y
+        self._sxx += x * x
+        self._sxy += x * y
+
+    def slope(self):
+        denominator = self.n * self._sxx - self._sx * self._sx
+        if self.n < 2 or denominator <= 0:
+            return None
+        return (self.n * self._sxy - self._sx * self._sy) / denominator
+
+
+class AudioInput:
+    """
+    One audio device recording in callback mode.
+
+    PortAudio calls _callback on its own thread per stream; the callback
+    only copies the buffer into this device's preallocated ring buffer
+    (StreamingWavWriter, drained to disk by its own thread) and never
+    blocks, so a slow device or disk cannot stall another device. Every
+    buffer's arrival on the session clock feeds a ClockFit, from which the
+    device's real sample rate and drift are reported when it closes.
+
+    Audio that never reaches the ring buffer, either lost by the driver
+    (an input overflow) or dropped because the ring was full, is replaced
+    by the same number of frames of silence as soon as there is room, so
+    every later sample stays at its true position on the session clock.
+    """
+
+    def __init__(self, device_index, stream_name, filename, clock, sample_format="int24", rate=44100,
+                 chunk=1024, buffer_seconds=10.0, metrics=None, live_feed=None):
+        self.device_index = device_index
+        self.stream_name = stream_name
+        self.filename = filename
+        self.clock = clock
+        self.sample_format = sample_format
+        self.rate = rate
+        self.chunk = chunk
+        self.buffer_seconds = buffer_seconds
+        self.metrics = metrics
+        self.live_feed = live_feed
+        self.channels = None
+        self.name = None
+        self.frames = 0 # Device timeline position, lost frames included
+        self.overruns = 0 # Driver reported lost input
+        self.frames_lost = 0 # Estimated frames behind those overruns
+        self.frames_dropped = 0 # Ring buffer full, disk fell behind
+        self._silence_owed = 0 # Frames of silence still to be written in place of lost or dropped audio
+        self._next_adc_time = None
+        self.fit = ClockFit()
+        self._p = None
+        self._stream = None
+        self._writer = None
+        self._meter = None
+        self._input_latency = 0.0
+
+    def open(self):
+        """
+        Opens the device at its full input channel count in the requested
+        format, falling back to fewer channels and then to 16-bit if the
+        driver refuses. Raises OSError if nothing works.
+        """
+        self._p = pyaudio.PyAudio()
+        try:
+            if self.device_index is None:
+                info = self._p.get_default_input_device_info()
+            else:
+                info = self._p.get_device_info_by_host_api_device_index(0, self.device_index)
+            max_channels = max(int(info.get('maxInputChannels')), 1)
+            self.name = info.get('name')
+        except Exception as e:
+            print(f"Error getting device info: {e}")
+            max_channels = 1
+
+        formats = [self.sample_format] + (["int16"] if self.sample_format != "int16" else [])
+        channel_options = sorted({max_channels, min(2, max_channels), 1}, reverse=True)
+        error = None
+        for sample_format in formats:
+            for channels in channel_options:
+                try:
+                    self._stream = self._p.open(format=getattr(pyaudio, SAMPLE_FORMATS[sample_format][0]),
+                                                channels=channels,
+                                                rate=self.rate,
+                                                input=True,
+                                                input_device_index=self.device_index,
+                                                frames_per_buffer=self.chunk,
+                                                stream_callback=self._callback,
+                                                start=False)
+                except OSError as e:
+                    error = e
+                    continue
+                if (sample_format, channels) != (self.sample_format, max_channels):
+                    print(f"Audio device {self.device_index}: recording {channels} channels as {sample_format}")
+                self.sample_format = sample_format
+                self.channels = channels
+                return self._start()
+        self._p.terminate()
+        raise OSError(f"Could not open audio device {self.device_index}: {error}")
+
+    def _start(self):
+        _, sample_width, format_tag = SAMPLE_FORMATS[self.sample_format]
+        self._writer = StreamingWavWriter(self.filename,
+                                          channels=self.channels,
+                                          sample_width=sample_width,
+                                          rate=self.rate,
+                                          buffer_seconds=self.buffer_seconds,
+                                          format_tag=format_tag)
+        if self.live_feed:
+            self._meter = LevelMeter(self.channels, self.rate,
+                                     dtype="int16" if self.sample_format == "int16" else "float32")
+        try:
+            self._input_latency = self._stream.get_input_latency()
+        except Exception:
+            self._input_latency = 0.0
+        self._stream.start_stream()
+        return self
+
+    def _lost_frames(self, frame_count, time_info):
+        """
+        Frames the driver discarded before this buffer: the gap between its
+        ADC timestamp and where the previous buffer ended, or one buffer's
+        worth when the host API does not report ADC times.
+        """
+        adc_time = (time_info or {}).get("input_buffer_adc_time") or None
+        lost = frame_count
+        if adc_time is not None and self._next_adc_time is not None:
+            lost = max(int(round((adc_time - self._next_adc_time) * self.rate)), 0)
+        return lost
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        arrived = self.clock.now_ns()
+        metrics = self.metrics
+        if status & PA_INPUT_OVERFLOW:
+            self.overruns += 1
+            if metrics:
+                metrics.audio_overruns.inc()
+            if self.frames:
+                # Before the first buffer there is no position to keep; the take simply starts later
+                lost = self._lost_frames(frame_count, time_info)
+                self.frames_lost += lost
+                self.frames += lost
+                self._silence_owed += lost
+        adc_time = (time_info or {}).get("input_buffer_adc_time")
+        self._next_adc_time = adc_time + frame_count / self.rate if adc_time else None
+
+        if self.frames == 0:
+            # The first sample of this buffer hit the converter one buffer (plus driver latency) ago
+            first_sample = arrived - int((frame_count / self.rate + self._input_latency) * 1e9)
+            self.clock.mark_first(self.stream_name, first_sample,
+                                  file=os.path.basename(self.filename),
+                                  device=self.name,
+                                  sample_rate=self.rate,
+                                  channels=self.channels,
+                                  sample_format=self.sample_format)
+        self.frames += frame_count
+        self.fit.add(self.frames / self.rate, self.clock.seconds(arrived))
+
+        if self._silence_owed:
+            self._silence_owed -= self._writer.try_write_silence(self._silence_owed)
+        # Never wait here: PortAudio's thread must get straight back to the driver
+        if self._silence_owed or not self._writer.try_write(in_data):
+            # Real audio only goes in once all the silence ahead of it has; until then it becomes silence too
+            self._silence_owed += frame_count
+            self.frames_dropped += frame_count
+            if metrics:
+                metrics.audio_frames_dropped.inc(frame_count)
+        if metrics:
+            metrics.audio_chunks.inc()
+            metrics.audio_buffered.set(self._writer.buffered_bytes)
+
+        live = self.live_feed
+        # Metering is skipped entirely while nobody is watching
+        if live and live.active:
+            data = in_data
+            if self.sample_format == "int24":
+                data = to_float(np.frombuffer(in_data, dtype=np.uint8).reshape(-1, self.channels, 3), 2 ** 23)
+            frame = self._meter.process(data)
+            if frame:
+                t = self.clock.seconds(arrived)
+                frame["t"] = round(t, 4)
+                if self.stream_name != PRIMARY_STREAM:
+                    frame["device"] = self.stream_name
+                live.publish(frame)
+                if self.stream_name == PRIMARY_STREAM:
+                    live.flush_midi(t)
+        return None, PA_CONTINUE
+
+    def measured_rate(self):
+        slope = self.fit.slope()
+        return self.rate / slope if slope else None
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+        if self._p is not None:
+            self._p.terminate()
+        if self._writer is None:
+            return
+        _, sample_width, _ = SAMPLE_FORMATS[self.sample_format]
+        if self._silence_owed:
+            # The stream has stopped, so this may block until the disk catches up
+            self._writer.write(bytes(self._silence_owed * self.channels * sample_width))
+            self._silence_owed = 0
+        self._writer.close()
+        if self.metrics:
+            self.metrics.audio_buffered.set(0)
+
+        info = {"frames": self._writer.bytes_written // (self.channels * sample_width),
+                "overruns": self.overruns, "frames_lost": self.frames_lost,
+                "frames_dropped": self.frames_dropped}
+        measured = self.measured_rate()
+        if measured:
+            info["measured_sample_rate"] = round(measured, 3)
+            info["drift_ppm"] = round((measured / self.rate - 1) * 1e6, 2)
+        self.clock.update(self.stream_name, **info)
@@ -0,0 +1,261 @@
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from . import metrics
+from .workers import RenderWorkers
+
+logger = logging.getLogger(__name__)
+
+
+def _render_item(session_id, vst_path, record_dir, output_name, cache_config, batch_id, cancel_flags):
+    # Runs inside a pool worker; only the render happens here, the mux is pipelined in the parent
+    from .renderer import render_audio
+    from .render_cache import RenderCache
+
+    start = time.perf_counter()
+    render = render_audio(session_id, vst_path, record_dir=record_dir, output_name=output_name,
+                          cancelled=lambda: cancel_flags.get(batch_id, False),
+                          cache=RenderCache(**cache_config) if cache_config else None)
+    render["render_seconds"] = time.perf_counter() - start
+    return render
+
+
+def plugin_slug(vst_path):
+    stem = os.path.splitext(os.path.basename(os.path.normpath(vst_path)))[0]
+    return re.sub(r"[^A-Za-z0-9]+", "-", stem).strip("-") or "plugin"
+
+
+class BatchExport:
+    def __init__(self, session_ids, vst_paths, concurrency):
+        self.id = uuid.uuid4().hex[:12]
+        self.concurrency = concurrency
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancelled = False
+        self.futures = []
+
+        # Repeats would render the same output twice, concurrently
+        session_ids = list(dict.fromkeys(session_ids))
+        vst_paths = list(dict.fromkeys(os.path.normpath(vst_path) for vst_path in vst_paths))
+
+        # Same-named plugins from different folders still need distinct outputs. Compared case-insensitively
+        # for macOS and Windows; "final" would overwrite the session's single export.
+        slugs = {}
+        taken = {"final"}
+        for vst_path in vst_paths:
+            slug = base = plugin_slug(vst_path)
+            n = 2
+            while slug.lower() in taken:
+                slug = f"{base}-{n}"
+                n += 1
+            taken.add(slug.lower())
+            slugs[vst_path] = slug
+
+        self.items = [
+            {
+                "session_id": session_id,
+                "vst_path": vst_path,
+                "output_name": f"{session_id}_{slugs[vst_path]}_export.mp4",
+                "status": "queued",
+                "output": None,
+                "message": None,
+                "duration": 0.0,
+                "render_seconds": None,
+                "mux_seconds": None,
+            }
+            for session_id in session_ids
+            for vst_path in vst_paths
+        ]
+
+    def to_dict(self):
+        done = [item for item in self.items if item["status"] == "done"]
+        audio_seconds = sum(item["duration"] for item in done)
+        end = self.finished or time.time()
+        elapsed = end - self.started if self.started else 0.0
+        return {
+            "id": self.id,
+            "status": self.status,
+            "concurrency": self.concurrency,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "total": len(self.items),
+            "completed": len(done),
+            "failed": sum(1 for item in self.items if item["status"] == "error"),
+            "audio_seconds": audio_seconds,
+            "elapsed_seconds": elapsed,
+            # Seconds of program rendered per wall-clock second across the whole batch
+            "real_time_factor": audio_seconds / elapsed if elapsed > 0 else None,
+            "items": self.items,
+        }
+
+
+class BatchExportManager:
+    """
+    Fans a sessions x plugins matrix of exports out over a process pool.
+
+    Renders run on `workers` (shared with single exports in the server, so
+    both draw on one worker and plugin-memory budget; a pool sized to the
+    machine otherwise), at most `concurrency` at a time per batch. As soon
+    as one finishes its slot is handed to the next render and the ffmpeg
+    mux runs on a small thread pool in this process, so muxing overlaps
+    with the renders still in flight. Finished batches are dropped
+    `retention` seconds after they end.
+    """
+
+    def __init__(self, record_dir="recordings", max_workers=None, mux_workers=2, cache_config=None,
+                 retention=24 * 3600, workers=None):
+        self.record_dir = record_dir
+        self.workers = workers or RenderWorkers(max_workers=max_workers or os.cpu_count() or 1)
+        self._owns_workers = workers is None
+        self.max_workers = self.workers.max_workers
+        self.mux_workers = mux_workers
+        self.cache_config = cache_config
+        self.retention = retention
+        self.batches = {}
+        self._lock = threading.Lock()
+        self._mux_pool = None
+        self._cancel_flags = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._mux_pool is None:
+                self._cancel_flags = self.workers.start().manager.dict()
+                self._mux_pool = ThreadPoolExecutor(max_workers=self.mux_workers)
+
+    def submit(self, session_ids, vst_paths, concurrency=None):
+        if not session_ids or not vst_paths:
+            raise ValueError("A batch needs at least one session and one plugin")
+        self.prune()
+        concurrency = max(1, min(concurrency or self.max_workers, self.max_workers))
+        batch = BatchExport(session_ids, vst_paths, concurrency)
+        outputs = {item["output_name"] for item in batch.items}
+        for other in list(self.batches.values()):
+            if other.finished is None and outputs & {item["output_name"] for item in other.items}:
+                raise ValueError(f"Batch {other.id} is already exporting some of these sessions and plugins")
+        self._ensure_started()
+        self.batches[batch.id] = batch
+        threading.Thread(target=self._run, args=(batch,), daemon=True).start()
+        return batch
+
+    def get(self, batch_id):
+        return self.batches.get(batch_id)
+
+    def prune(self):
+        """Forgets batches that finished more than `retention` seconds ago."""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            for batch in list(self.batches.values()):
+                if batch.finished is not None and batch.finished < cutoff:
+                    del self.batches[batch.id]
+
+    def cancel(self, batch_id):
+        """
+        Stops scheduling new renders and stops the ones in flight: queued
+        renders are dropped, running renders and muxes see the cancel flag
+        and stop, and their partial files are removed.
+        """
+        batch = self.batches.get(batch_id)
+        if batch is None or batch.finished is not None:
+            return batch
+        batch.cancelled = True
+        self._cancel_flags[batch.id] = True
+        for future in batch.futures:
+            future.cancel()
+        return batch
+
+    def shutdown(self):
+        if self._mux_pool is None:
+            return
+        for batch_id in list(self.batches):
+            self.cancel(batch_id)
+        if self._owns_workers:
+            self.workers.shutdown()
+        self._mux_pool.shutdown(wait=True)
+
+    def _run(self, batch):
+        slots = threading.BoundedSemaphore(batch.concurrency)
+        remaining = threading.Semaphore(0)
+        batch.status = "running"
+        batch.started = time.time()
+
+        scheduled = 0
+        for item in batch.items:
+            slots.acquire()
+            if batch.cancelled:
+                slots.release()
+                break
+            item["status"] = "rendering"
+            future = self.workers.submit(_render_item, item["session_id"], item["vst_path"], self.record_dir,
+                                         item["output_name"], self.cache_config, batch.id, self._cancel_flags)
+            batch.futures.append(future)
+            future.add_done_callback(lambda f, item=item: self._rendered(item, f, slots, remaining, batch))
+            scheduled += 1
+
+        for item in batch.items[scheduled:]:
+            item["status"] = "cancelled"
+        for _ in range(scheduled):
+            remaining.acquire()
+
+        batch.finished = time.time()
+        batch.status = "cancelled" if batch.cancelled else "done"
+        batch.futures = []
+        self._cancel_flags.pop(batch.id, None)
+        stats = batch.to_dict()
+        logger.info(f"Batch {batch.id}: {stats['completed']}/{stats['total']} exports, "
+                    f"real-time factor {stats['real_time_factor'] or 0:.1f}x")
+
+    def _rendered(self, item, future, slots, remaining, batch):
+        # Free the render slot first so the next render starts while this one muxes
+        from .renderer import ExportCancelled
+
+        slots.release()
+        try:
+            render = future.result()
+        except (CancelledError, ExportCancelled):
+            item["status"] = "cancelled"
+            remaining.release()
+            return
+        except Exception as e:
+            logger.error(f"Batch render of {item['output_name']} failed: {e}")
+            metrics.EXPORTS_FAILED.inc()
+            item["status"] = "error"
+            item["message"] = str(e)
+            remaining.release()
+            return
+        item["status"] = "muxing"
+        item["render_seconds"] = render["render_seconds"]
+        metrics.EXPORT_RENDER_SECONDS.observe(render["render_seconds"])
+        self._mux_pool.submit(self._mux, item, render, remaining, batch)
+
+    def _mux(self, item, render, remaining, batch):
+        from .renderer import ExportCancelled, mux_audio
+        from .render_cache import RenderCache
+
+        start = time.perf_counter()
+        try:
+            output = mux_audio(render, record_dir=self.record_dir, cancelled=lambda: batch.cancelled,
+                               cache=RenderCache(**self.cache_config) if self.cache_config else None)
+        except ExportCancelled:
+            item["status"] = "cancelled"
+        except Exception as e:
+            logger.error(f"Batch mux of {item['output_name']} failed: {e}")
+            metrics.EXPORTS_FAILED.inc()
+            item["status"] = "error"
+            item["message"] = str(e)
+        else:
+            item["mux_seconds"] = time.perf_counter() - start
+            metrics.EXPORT_MUX_SECONDS.observe(item["mux_seconds"])
+            metrics.EXPORTS_FINISHED.inc()
+            item["duration"] = render["duration"]
+            item["output"] = output
+            item["status"] = "done"
+        finally:
+            remaining.release()
@@ -0,0 +1,157 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# session_YYYYMMDD_HHMMSS_<kind>.<ext>
+SESSION_FILE_RE = re.compile(r"^(session_\d{8}_\d{6})_(.+)$")
+
+# Filename suffix -> catalog column
+FILE_KINDS = {
+    "video.mp4": "video",
+    "audio.wav": "audio",
+    "midi.mid": "midi",
+    "manifest.json": "manifest",
+    "final_export.mp4": "export",
+}
+
+SORT_COLUMNS = {
+    "timestamp": "video_mtime",
+    "size": "video_size",
+    "id": "id",
+}
+
+
+def parse_session_file(filename):
+    """Returns (session_id, column) for a recording file, or None for anything else."""
+    match = SESSION_FILE_RE.match(filename)
+    if not match:
+        return None
+    column = FILE_KINDS.get(match.group(2))
+    if column is None:
+        return None
+    return match.group(1), column
+
+
+class SessionCatalog:
+    """
+    SQLite index of the sessions in the recordings directory.
+
+    The recorder and renderer register files as they write them, and a
+    reconcile pass at startup picks up anything that changed while the
+    server was down, so queries never have to scan the filesystem.
+    `version` changes on every write and is what the endpoint ETags are
+    derived from.
+    """
+
+    def __init__(self, db_path, record_dir="recordings"):
+        self.record_dir = record_dir
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                video TEXT, audio TEXT, midi TEXT, manifest TEXT, export TEXT,
+                video_size INTEGER,
+                video_mtime REAL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_video_mtime ON sessions(video_mtime);
+            CREATE INDEX IF NOT EXISTS sessions_updated ON sessions(updated);
+        """)
+        # ETags must not repeat across restarts, so they combine a per-process epoch with the generation
+        self.epoch = time.time_ns()
+        self.generation = 0
+
+    @property
+    def version(self):
+        return f"{self.epoch:x}-{self.generation}"
+
+    def add_file(self, path):
+        """Registers (or refreshes) one file written into the recordings directory."""
+        parsed = parse_session_file(os.path.basename(path))
+        if parsed is None:
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self._lock:
+            self._upsert(parsed[0], parsed[1], os.path.basename(path), stat)
+            self._db.commit()
+            self.generation += 1
+
+    def add_session(self, session_id):
+        """Registers every file that currently exists for a session."""
+        for suffix in FILE_KINDS:
+            path = os.path.join(self.record_dir, f"{session_id}_{suffix}")
+            if os.path.exists(path):
+                self.add_file(path)
+
+    def reconcile(self):
+        """Brings the index in line with the directory contents. Run once at startup."""
+        found = {}
+        with os.scandir(self.record_dir) as entries:
+            for entry in entries:
+                parsed = parse_session_file(entry.name)
+                if parsed is None or not entry.is_file():
+                    continue
+                found.setdefault(parsed[0], []).append((parsed[1], entry.name, entry.stat()))
+
+        with self._lock:
+            known = {row["id"] for row in self._db.execute("SELECT id FROM sessions")}
+            for session_id in known - found.keys():
+                self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            for session_id, files in found.items():
+                # Clear columns first so files deleted while we were down drop out
+                self._db.execute(
+                    "INSERT INTO sessions (id, updated) VALUES (?, 0) ON CONFLICT(id) DO UPDATE SET "
+                    "video = NULL, audio = NULL, midi = NULL, manifest = NULL, export = NULL, "
+                    "video_size = NULL, video_mtime = NULL, updated = 0",
+                    (session_id,),
+                )
+                for column, name, stat in files:
+                    self._upsert(session_id, column, name, stat)
+            self._db.commit()
+            self.generation += 1
+
+    def list_sessions(self, offset=0, limit=None, sort="timestamp", descending=True):
+        """Returns (total, rows) for sessions with a video, sorted and paginated."""
+        column = SORT_COLUMNS.get(sort, "video_mtime")
+        direction = "DESC" if descending else "ASC"
+        with self._lock:
+            total = self._db.execute(
+                "SELECT COUNT(*) FROM sessions WHERE video IS NOT NULL").fetchone()[0]
+            rows = self._db.execute(
+                f"SELECT * FROM sessions WHERE video IS NOT NULL ORDER BY {column} {direction}, id {direction} "
+                "LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset),
+            ).fetchall()
+        return total, [dict(row) for row in rows]
+
+    def latest(self):
+        """Returns the most recently touched session, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM sessions ORDER BY updated DESC LIMIT 1").fetchone()
+        return dict(row) if row else None
+
+    def get(self, session_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _upsert(self, session_id, column, name, stat):
+        # `column` comes from FILE_KINDS, never from user input
+        self._db.execute(
+            f"INSERT INTO sessions (id, {column}, updated) VALUES (?, ?, ?) "
+            f"ON CONFLICT(id) DO UPDATE SET {column} = excluded.{column}, "
+            "updated = MAX(updated, excluded.updated)",
+            (session_id, name, stat.st_mtime),
+        )
+        if column == "video":
+            self._db.execute(
+                "UPDATE sessions SET video_size = ?, video_mtime = ? WHERE id = ?",
+                (stat.st_size, stat.st_mtime, session_id),
+            )
@@ -0,0 +1,221 @@
+import glob
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+from .lazy import LazyModule
+
+mido = LazyModule("mido")
+
+
+def list_audio_devices():
+    # Imported here so the registry module stays cheap to load
+    import pyaudio
+
+    p = pyaudio.PyAudio()
+    try:
+        info = p.get_host_api_info_by_index(0)
+        devices = []
+        for i in range(0, info.get('deviceCount')):
+            dev = p.get_device_info_by_host_api_device_index(0, i)
+            if dev.get('maxInputChannels') > 0:
+                devices.append({
+                    "index": i,
+                    "name": dev.get('name'),
+                    "channels": int(dev.get('maxInputChannels')),
+                    "default_sample_rate": dev.get('defaultSampleRate'),
+                })
+        return devices
+    finally:
+        p.terminate()
+
+
+def list_midi_ports():
+    return mido.get_input_names()
+
+
+def list_video_devices_v4l2():
+    """Linux: read camera names straight from sysfs, one entry per physical capture node."""
+    devices = []
+    for path in glob.glob("/sys/class/video4linux/video*"):
+        match = re.search(r"video(\d+)$", path)
+        if not match:
+            continue
+        # Cameras usually expose extra metadata nodes; only the first node of each device captures
+        try:
+            with open(os.path.join(path, "index")) as f:
+                if f.read().strip() != "0":
+                    continue
+        except OSError:
+            pass
+        try:
+            with open(os.path.join(path, "name")) as f:
+                name = f.read().strip()
+        except OSError:
+            name = f"Camera {match.group(1)}"
+        devices.append({"index": int(match.group(1)), "name": name})
+    return sorted(devices, key=lambda d: d["index"])
+
+
+def list_video_devices_avfoundation():
+    """macOS: ask ffmpeg's avfoundation input for its device list (printed on stderr)."""
+    cmd = ['ffmpeg', '-hide_banner', '-f', 'avfoundation', '-list_devices', 'true', '-i', '']
+    result = subprocess.run(cmd, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL, text=True)
+
+    devices = []
+    parsing_video = False
+    for line in result.stderr.split('\n'):
+        if "AVFoundation video devices:" in line:
+            parsing_video = True
+            continue
+        if "AVFoundation audio devices:" in line:
+            break
+        if parsing_video:
+            # Match pattern like: [AVFoundation indev @ 0x...] [0] FaceTime HD Camera
+            match = re.search(r'\[(\d+)\] (.*)', line)
+            if match:
+                devices.append({"index": int(match.group(1)), "name": match.group(2).strip()})
+    return devices
+
+
+def list_video_devices_probe(max_index=3):
+    """Last resort: try opening the first few OpenCV indices."""
+    import cv2
+
+    devices = []
+    for i in range(max_index):
+        cap = cv2.VideoCapture(i)
+        if cap.isOpened():
+            devices.append({"index": i, "name": f"Camera {i}"})
+            cap.release()
+    return devices
+
+
+def list_video_devices():
+    if sys.platform.startswith("linux") and os.path.isdir("/sys/class/video4linux"):
+        return list_video_devices_v4l2()
+    if sys.platform == "darwin":
+        try:
+            devices = list_video_devices_avfoundation()
+            if devices:
+                return devices
+        except Exception as e:
+            print(f"Error listing video devices: {e}")
+    return list_video_devices_probe()
+
+
+def hardware_signature():
+    """
+    Cheap fingerprint of attached audio/video hardware, or None where the OS
+    offers nothing cheaper than a full enumeration. On Linux it reads the
+    ALSA card list and the V4L2 device nodes, so plugging or unplugging an
+    interface or camera changes it.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    parts = []
+    try:
+        with open("/proc/asound/cards") as f:
+            parts.append(f.read())
+    except OSError:
+        pass
+    parts.append(",".join(sorted(glob.glob("/dev/video*"))))
+    return "\n".join(parts)
+
+
+class DeviceRegistry:
+    """
+    In-memory view of the audio, MIDI and video inputs, kept fresh by a
+    background thread so GET /ports never touches the hardware.
+
+    Every `poll_interval` seconds the thread compares a cheap hardware
+    signature (Linux) and the MIDI port names against the last scan and
+    re-enumerates only what changed; everything is re-enumerated at least
+    every `full_refresh_interval` seconds. Audio/video enumeration is held
+    off while `is_busy()` is true so it never competes with a recording.
+    """
+
+    def __init__(self, poll_interval=2.0, full_refresh_interval=60.0, is_busy=None):
+        self.poll_interval = poll_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.is_busy = is_busy or (lambda: False)
+
+        self._devices = {"audio_devices": [], "midi_ports": [], "video_devices": []}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._signature = None
+        self._last_full = 0.0
+        self._errors = {}
+        self.updated = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def ready(self):
+        """True once the first scan has finished."""
+        return self._ready.is_set()
+
+    def snapshot(self, timeout=10.0):
+        """Returns the current device lists; only the very first call can wait for the initial scan."""
+        self.start()
+        self._ready.wait(timeout)
+        with self._lock:
+            return {key: list(value) for key, value in self._devices.items()}
+
+    def request_refresh(self):
+        """Asks the background thread for a full re-scan as soon as possible."""
+        self._last_full = 0.0
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._poll()
+            self._ready.set()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _poll(self):
+        now = time.monotonic()
+        changes = {}
+
+        midi_ports = self._scan("midi_ports", list_midi_ports)
+        if midi_ports is not None and midi_ports != self._devices["midi_ports"]:
+            changes["midi_ports"] = midi_ports
+
+        signature = hardware_signature()
+        due = now - self._last_full >= self.full_refresh_interval
+        hardware_changed = signature is not None and signature != self._signature
+        if (due or hardware_changed) and not self.is_busy():
+            for key, scan in (("audio_devices", list_audio_devices), ("video_devices", list_video_devices)):
+                found = self._scan(key, scan)
+                if found is not None:
+                    changes[key] = found
+            self._signature = signature
+            self._last_full = now
+
+        if changes:
+            with self._lock:
+                self._devices.update(changes)
+                self.updated = time.time()
+
+    def _scan(self, key, scan):
+        # One broken backend (e.g. no MIDI driver) must not hide the other device kinds
+        try:
+            found = scan()
+        except Exception as e:
+            # Report each distinct failure once rather than on every poll
+            if self._errors.get(key) != str(e):
+                print(f"Error listing {key.replace('_', ' ')}: {e}")
+            self._errors[key] = str(e)
+            return None
+        self._errors.pop(key, None)
+        return found
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError
+
+from . import metrics
+from .workers import RenderWorkers
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = ("done", "error", "cancelled")
+PHASE_METRICS = {"render": metrics.EXPORT_RENDER_SECONDS, "mux": metrics.EXPORT_MUX_SECONDS}
+
+
+def _run_export(job_id, session_id, vst_path, record_dir, log_path, events, cancel_flags, cache_config):
+    # Runs inside a pool worker: everything goes back to the parent through `events`
+    from .renderer import render_project
+    from .render_cache import RenderCache
+
+    handler = logging.FileHandler(log_path)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    try:
+        events.put((job_id, "running", {}))
+        return render_project(
+            session_id,
+            vst_path,
+            record_dir=record_dir,
+            progress=lambda phase, fraction: events.put((job_id, "progress", {"phase": phase, "fraction": fraction})),
+            cancelled=lambda: cancel_flags.get(job_id, False),
+            log_path=log_path,
+            cache=RenderCache(**cache_config) if cache_config else None,
+        )
+    finally:
+        root.removeHandler(handler)
+        handler.close()
+
+
+class ExportJob:
+    def __init__(self, session_id, vst_path, log_dir):
+        self.id = uuid.uuid4().hex[:12]
+        self.session_id = session_id
+        self.vst_path = vst_path
+        self.log_path = os.path.join(log_dir, f"{self.id}.log")
+        self.status = "queued"
+        self.phase = None
+        self.progress = 0.0
+        self.message = None
+        self.output = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.phase_started = None
+        self.future = None
+        # Bumped on every change so event streams know when to push an update
+        self.version = 0
+
+    @property
+    def is_finished(self):
+        return self.status in TERMINAL_STATES
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "session_id": self.session_id,
+            "vst_path": self.vst_path,
+            "status": self.status,
+            "phase": self.phase,
+            "progress": self.progress,
+            "message": self.message,
+            "output": self.output,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class ExportJobManager:
+    """
+    Runs render_project jobs on a bounded process pool (a RenderWorkers,
+    possibly shared with batch exports).
+
+    Workers report progress through a manager queue that a listener thread
+    folds into the in-memory job table; cancellation is a shared flag the
+    renderer polls between blocks and while ffmpeg runs. Each job logs to
+    its own file under `log_dir`. Finished jobs and their logs are dropped
+    `retention` seconds after they end.
+
+    Only one export per session runs at a time: they all write the
+    session's `_final_export.mp4`.
+    """
+
+    def __init__(self, record_dir="recordings", log_dir="export_logs", max_workers=2, max_pending=16,
+                 on_done=None, cache_config=None, retention=24 * 3600, workers=None):
+        self.record_dir = record_dir
+        self.cache_config = cache_config # RenderCache kwargs, rebuilt inside each worker
+        self.log_dir = log_dir
+        self.workers = workers or RenderWorkers(max_workers=max_workers)
+        self._owns_workers = workers is None
+        self.max_pending = max_pending
+        self.on_done = on_done # Called with the job when a render finishes successfully
+        self.retention = retention
+
+        self.jobs = {}
+        self._cond = threading.Condition()
+        self._watchers = set() # (loop, asyncio.Event) of event streams waiting for a change
+        self._events = None
+        self._cancel_flags = None
+
+    def _ensure_started(self):
+        # The pool, manager process and listener are only spun up on the first export
+        if self._events is not None:
+            return
+        manager = self.workers.start().manager
+        self._events = manager.Queue()
+        self._cancel_flags = manager.dict()
+        threading.Thread(target=self._listen, daemon=True).start()
+
+    def submit(self, session_id, vst_path):
+        self.prune()
+        with self._cond:
+            pending = [job for job in self.jobs.values() if not job.is_finished]
+            if len(pending) >= self.max_pending:
+                raise RuntimeError(f"Too many exports in progress ({len(pending)})")
+            running = next((job for job in pending if job.session_id == session_id), None)
+            if running is not None:
+                raise RuntimeError(f"Session {session_id} is already being exported (job {running.id})")
+            self._ensure_started()
+
+            os.makedirs(self.log_dir, exist_ok=True)
+            job = ExportJob(session_id, vst_path, self.log_dir)
+            self.jobs[job.id] = job
+
+            job.future = self.workers.submit(
+                _run_export, job.id, session_id, vst_path, self.record_dir, job.log_path,
+                self._events, self._cancel_flags, self.cache_config,
+            )
+        job.future.add_done_callback(lambda future, job=job: self._finish(job, future))
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or job.is_finished:
+            return job
+        # A job still waiting in the pool never starts; a running one sees the flag and stops
+        if not job.future.cancel():
+            self._cancel_flags[job_id] = True
+        return job
+
+    async def wait_for_change(self, job, version, timeout=15.0):
+        """
+        Waits on the event loop until the job's version differs from
+        `version` (or timeout) and returns the new version. Holds no thread
+        while waiting, so open event streams cost nothing between updates.
+        """
+        changed = asyncio.Event()
+        watcher = (asyncio.get_running_loop(), changed)
+        with self._cond:
+            if job.version != version:
+                return job.version
+            self._watchers.add(watcher)
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._watchers.discard(watcher)
+        return job.version
+
+    def prune(self):
+        """Forgets jobs that finished more than `retention` seconds ago and deletes their logs."""
+        cutoff = time.time() - self.retention
+        with self._cond:
+            expired = [job for job in self.jobs.values() if job.is_finished and job.finished < cutoff]
+            for job in expired:
+                del self.jobs[job.id]
+            live_logs = {os.path.basename(job.log_path) for job in self.jobs.values()}
+        if not os.path.isdir(self.log_dir):
+            return
+        # Also catches logs left behind by jobs from before a restart
+        for name in os.listdir(self.log_dir):
+            path = os.path.join(self.log_dir, name)
+            try:
+                if name not in live_logs and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def read_log(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or not os.path.exists(job.log_path):
+            return None
+        with open(job.log_path, "r", errors="replace") as f:
+            return f.read()
+
+    def shutdown(self):
+        if self._events is None:
+            return
+        for job_id, job in list(self.jobs.items()):
+            if not job.is_finished:
+                self.cancel(job_id)
+        self._events.put(None)
+        if self._owns_workers:
+            self.workers.shutdown()
+
+    def _update(self, job, **fields):
+        with self._cond:
+            if job.is_finished:
+                return
+            for key, value in fields.items():
+                setattr(job, key, value)
+            job.version += 1
+            self._cond.notify_all()
+            for loop, changed in self._watchers:
+                loop.call_soon_threadsafe(changed.set)
+
+    def _listen(self):
+        while True:
+            try:
+                item = self._events.get()
+            except (EOFError, OSError):
+                return
+            if item is None:
+                return
+            job_id, kind, payload = item
+            job = self.jobs.get(job_id)
+            if job is None:
+                continue
+            if kind == "running":
+                now = time.time()
+                self._update(job, status="running", started=now, phase_started=now)
+            elif kind == "progress":
+                with self._cond:
+                    if payload["phase"] != job.phase and not job.is_finished:
+                        self._end_phase(job)
+                        job.phase_started = time.time()
+                self._update(job, phase=payload["phase"], progress=payload["fraction"])
+
+    def _end_phase(self, job):
+        # Phase durations are timed here from the progress events, so workers need not report them
+        histogram = PHASE_METRICS.get(job.phase)
+        if histogram is not None and job.phase_started is not None:
+            histogram.observe(time.time() - job.phase_started)
+
+    def _finish(self, job, future):
+        from .renderer import ExportCancelled
+
+        try:
+            output = future.result()
+        except (CancelledError, ExportCancelled):
+            self._update(job, status="cancelled", finished=time.time())
+        except Exception as e:
+            logger.error(f"Export {job.id} failed: {e}")
+            metrics.EXPORTS_FAILED.inc()
+            self._update(job, status="error", message=str(e), finished=time.time())
+        else:
+            with self._cond:
+                if not job.is_finished:
+                    self._end_phase(job)
+            metrics.EXPORTS_FINISHED.inc()
+            self._update(job, status="done", progress=1.0, output=output, finished=time.time())
+            if self.on_done:
+                self.on_done(job)
+        if self._cancel_flags is not None:
+            self._cancel_flags.pop(job.id, None)
@@ -0,0 +1,17 @@
+import threading
+
+
+class KeyedLocks:
+    """
+    One lock per key (a path, a session), created on first use. Concurrent
+    requests that would build the same file wait for one build instead of
+    racing each other.
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def get(self, key):
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
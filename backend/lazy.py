@@ -0,0 +1,58 @@
+import importlib
+import sys
+import threading
+
+# Heavy third-party modules per subsystem, imported on first use rather than at server start
+SUBSYSTEMS = {
+    "capture": ("cv2", "pyaudio", "mido"),
+    "analysis": ("numpy",),
+    "render": ("backend.renderer",),
+}
+
+
+class LazyModule:
+    """
+    Module-level stand-in for `import name`: the real import happens on
+    first attribute access, then every lookup goes straight to the module.
+    Keeps `cv2.VideoCapture`-style call sites (and tests that swap the
+    module attribute for a fake) unchanged.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def warm(subsystem):
+    """Imports a subsystem's modules now (e.g. from a background thread). Returns the ones that failed."""
+    failed = {}
+    for name in SUBSYSTEMS[subsystem]:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            failed[name] = str(e)
+    return failed
+
+
+def status():
+    """Which subsystems have all their modules imported."""
+    return {
+        subsystem: {"warm": all(name in sys.modules for name in names),
+                    "modules": {name: name in sys.modules for name in names}}
+        for subsystem, names in SUBSYSTEMS.items()
+    }
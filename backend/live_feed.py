@@ -0,0 +1,146 @@
+import asyncio
+import json
+import threading
+
+from .lazy import LazyModule
+
+np = LazyModule("numpy")
+
+
+class LiveFeed:
+    """
+    Fan-out of live recording data (meter frames, MIDI activity, status) to
+    any number of WebSocket viewers.
+
+    publish() is called from the capture threads and only hands the message
+    to the server's event loop, so its cost does not depend on how many
+    viewers are connected. Each viewer has a small queue of its own; a viewer
+    that falls behind loses its oldest frames instead of holding anyone up.
+    """
+
+    def __init__(self, queue_size=8, midi_flush_interval=1 / 30):
+        self.queue_size = queue_size
+        self.midi_flush_interval = midi_flush_interval
+        self._loop = None
+        self._subscribers = set()
+        self._midi_pending = []
+        self._midi_lock = threading.Lock()
+        self._last_midi_flush = 0.0
+
+    @property
+    def active(self):
+        return bool(self._subscribers)
+
+    def subscribe(self):
+        """Called on the event loop; returns the queue of serialized messages for one viewer."""
+        self._loop = asyncio.get_running_loop()
+        q = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        self._subscribers.discard(q)
+
+    def publish(self, message):
+        # Nobody watching: skip the hop to the event loop entirely
+        loop = self._loop
+        if loop is None or not self.active:
+            return
+        try:
+            loop.call_soon_threadsafe(self._fan_out, message)
+        except RuntimeError:
+            # Event loop already closed (server shutting down)
+            self._loop = None
+
+    def note_midi(self, seconds, msg):
+        """Queues a MIDI message for the activity feed; batches go out at most every `midi_flush_interval`."""
+        if not self.active or msg.is_realtime:
+            return
+        if msg.type == "sysex":
+            event = {"type": "sysex", "length": len(msg.data)}
+        else:
+            event = msg.dict()
+            event.pop("time", None)
+        event["t"] = round(seconds, 4)
+        with self._midi_lock:
+            self._midi_pending.append(event)
+            due = seconds - self._last_midi_flush >= self.midi_flush_interval
+        if due:
+            self.flush_midi(seconds)
+
+    def flush_midi(self, seconds):
+        with self._midi_lock:
+            events, self._midi_pending = self._midi_pending, []
+            self._last_midi_flush = seconds
+        if events:
+            self.publish({"type": "midi", "events": events})
+
+    def _fan_out(self, message):
+        # Runs on the event loop; serialize once for every viewer
+        text = json.dumps(message)
+        for q in list(self._subscribers):
+            if q.full():
+                q.get_nowait()
+            q.put_nowait(text)
+
+
+class LevelMeter:
+    """
+    Turns raw capture chunks into meter frames: per-channel peak and RMS plus
+    a min/max waveform decimated to `waveform_points` bins per frame, emitted
+    about `update_hz` times a second. Values are linear, 1.0 = full scale.
+    """
+
+    def __init__(self, channels, rate, dtype="int16", update_hz=30, waveform_points=64):
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        if self.dtype.kind == "f":
+            self.full_scale = 1.0
+        else:
+            self.full_scale = float(2 ** (8 * self.dtype.itemsize - 1))
+        self.frames_per_update = max(1, int(rate / update_hz))
+        self.bin_frames = max(1, self.frames_per_update // waveform_points)
+
+        self._tail = np.empty((0, channels), dtype=np.float32)
+        self._budget = 0 # Frames owed towards the next update; carries over so the average rate holds
+        self._reset()
+
+    def _reset(self):
+        self._frames = 0
+        self._peak = np.zeros(self.channels, dtype=np.float32)
+        self._sum_sq = np.zeros(self.channels, dtype=np.float64)
+        self._mins = []
+        self._maxs = []
+
+    def process(self, data):
+        """Feeds one chunk of interleaved samples; returns a meter frame when one is due, else None."""
+        x = np.frombuffer(data, dtype=self.dtype).reshape(-1, self.channels).astype(np.float32)
+        x /= self.full_scale
+
+        self._peak = np.maximum(self._peak, np.abs(x).max(axis=0))
+        self._sum_sq += np.einsum("ij,ij->j", x, x)
+        self._frames += len(x)
+        self._budget += len(x)
+
+        # Whole waveform bins only; the remainder waits for the next chunk
+        x = np.concatenate((self._tail, x))
+        usable = len(x) - len(x) % self.bin_frames
+        bins = x[:usable].reshape(-1, self.bin_frames, self.channels)
+        self._mins.append(bins.min(axis=1))
+        self._maxs.append(bins.max(axis=1))
+        self._tail = x[usable:]
+
+        if self._budget < self.frames_per_update:
+            return None
+        self._budget -= self.frames_per_update
+
+        frame = {
+            "type": "meter",
+            "peak": np.round(self._peak, 4).tolist(),
+            "rms": np.round(np.sqrt(self._sum_sq / self._frames), 4).tolist(),
+            # Channel-major so each list is one channel's waveform
+            "min": np.round(np.concatenate(self._mins).T, 4).tolist(),
+            "max": np.round(np.concatenate(self._maxs).T, 4).tolist(),
+        }
+        self._reset()
+        return frame
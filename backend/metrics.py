@@ -0,0 +1,244 @@
+import bisect
+import math
+import threading
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+DURATION_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+
+def _format(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, parent=None):
+        self.name = name
+        self.help = help_text
+        self._parent = parent
+        self._lock = threading.Lock()
+
+    def child(self):
+        """An unregistered copy for one recording/job; its updates also land in this metric."""
+        return type(self)(self.name, self.help, parent=self, **self._child_args())
+
+    def _child_args(self):
+        return {}
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, parent=None):
+        super().__init__(name, help_text, parent)
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+        if self._parent:
+            self._parent.inc(amount)
+
+    def samples(self):
+        return [f"{self.name} {_format(self.value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, parent=None, fn=None):
+        super().__init__(name, help_text, parent)
+        self.value = 0
+        self.max_value = 0
+        self._fn = fn # Read at scrape time instead of being set
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+            self.max_value = max(self.max_value, value)
+        if self._parent:
+            self._parent.set(value)
+
+    def set_function(self, fn):
+        self._fn = fn
+
+    def samples(self):
+        value = self._fn() if self._fn else self.value
+        return [f"{self.name} {_format(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, parent=None, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, parent)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def _child_args(self):
+        return {"buckets": self.buckets}
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+        if self._parent:
+            self._parent.observe(value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the observed max for the overflow bucket)."""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if seen >= rank:
+                    return min(bound, self.max)
+            return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max if self.count else None,
+        }
+
+    def samples(self):
+        with self._lock:
+            lines = []
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), self.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{le="{_format(bound)}"}} {cumulative}')
+            lines.append(f"{self.name}_sum {_format(self.sum)}")
+            lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text):
+        return self.register(Counter(name, help_text))
+
+    def gauge(self, name, help_text, fn=None):
+        return self.register(Gauge(name, help_text, fn=fn))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, buckets=buckets))
+
+    def render(self):
+        """Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Recorder
+AUDIO_CHUNKS = REGISTRY.counter("recorder_audio_chunks_total", "Audio chunks read from the input stream")
+AUDIO_OVERRUNS = REGISTRY.counter("recorder_audio_overruns_total",
+                                  "Input overflows reported by the audio driver; the lost frames become silence")
+AUDIO_FRAMES_DROPPED = REGISTRY.counter("recorder_audio_frames_dropped_total",
+                                        "Audio frames that did not fit in the ring buffer; written as silence")
+AUDIO_BUFFERED = REGISTRY.gauge("recorder_audio_buffered_bytes",
+                                "Audio waiting in the ring buffer between capture and disk")
+VIDEO_FRAMES = REGISTRY.counter("recorder_video_frames_captured_total", "Frames returned by cap.read()")
+VIDEO_CAPTURE_FAILURES = REGISTRY.counter("recorder_video_capture_failures_total",
+                                          "cap.read() calls that returned no frame and ended the video track")
+VIDEO_CAPTURE_SECONDS = REGISTRY.histogram("recorder_video_capture_seconds", "Time spent in cap.read()")
+VIDEO_ENCODE_SECONDS = REGISTRY.histogram("recorder_video_encode_seconds", "Time to encode and write one frame")
+VIDEO_QUEUE_DEPTH = REGISTRY.gauge("recorder_video_queue_depth", "Frames waiting between capture and encoder")
+VIDEO_DROPPED = REGISTRY.counter("recorder_video_frames_dropped_total",
+                                 "Frames dropped because the encoder was behind or they arrived early")
+VIDEO_DUPLICATED = REGISTRY.counter("recorder_video_frames_duplicated_total",
+                                    "Frames repeated to fill gaps and hold a constant frame rate")
+MIDI_EVENTS = REGISTRY.counter("recorder_midi_events_total", "MIDI messages received")
+
+# Exports
+EXPORT_RENDER_SECONDS = REGISTRY.histogram("export_render_seconds", "Audio render phase of an export",
+                                           buckets=DURATION_BUCKETS)
+EXPORT_MUX_SECONDS = REGISTRY.histogram("export_mux_seconds", "ffmpeg mux phase of an export",
+                                        buckets=DURATION_BUCKETS)
+EXPORTS_FINISHED = REGISTRY.counter("export_finished_total", "Exports that completed successfully")
+EXPORTS_FAILED = REGISTRY.counter("export_failed_total", "Exports that ended in an error")
+
+# Scrub previews
+PREVIEW_SECONDS = REGISTRY.histogram("preview_request_seconds", "Time to answer a preview request, render included",
+                                     buckets=LATENCY_BUCKETS + (2.5, 5.0, 10.0))
+PREVIEW_RENDERS = REGISTRY.counter("preview_renders_total", "Previews rendered on a cache miss")
+PREVIEW_CACHE_HITS = REGISTRY.counter("preview_cache_hits_total", "Previews served from the cache")
+
+
+class RecordingMetrics:
+    """
+    Per-take view of the recorder metrics. Every update also counts towards
+    the process-wide metrics above; summary() is what gets saved with the take.
+    """
+
+    def __init__(self):
+        self.audio_chunks = AUDIO_CHUNKS.child()
+        self.audio_overruns = AUDIO_OVERRUNS.child()
+        self.audio_frames_dropped = AUDIO_FRAMES_DROPPED.child()
+        self.audio_buffered = AUDIO_BUFFERED.child()
+        self.video_frames = VIDEO_FRAMES.child()
+        self.video_capture_failures = VIDEO_CAPTURE_FAILURES.child()
+        self.video_capture_seconds = VIDEO_CAPTURE_SECONDS.child()
+        self.video_encode_seconds = VIDEO_ENCODE_SECONDS.child()
+        self.video_queue_depth = VIDEO_QUEUE_DEPTH.child()
+        self.video_dropped = VIDEO_DROPPED.child()
+        self.video_duplicated = VIDEO_DUPLICATED.child()
+        self.midi_events = MIDI_EVENTS.child()
+
+    def summary(self, seconds):
+        return {
+            "duration_seconds": seconds,
+            "audio": {
+                "chunks": self.audio_chunks.value,
+                "overruns": self.audio_overruns.value,
+                "frames_dropped": self.audio_frames_dropped.value,
+                "buffered_bytes_peak": self.audio_buffered.max_value,
+            },
+            "video": {
+                "frames_captured": self.video_frames.value,
+                "capture_failures": self.video_capture_failures.value,
+                "frames_dropped": self.video_dropped.value,
+                "frames_duplicated": self.video_duplicated.value,
+                "queue_depth_peak": self.video_queue_depth.max_value,
+                "capture_seconds": self.video_capture_seconds.summary(),
+                "encode_seconds": self.video_encode_seconds.summary(),
+            },
+            "midi": {
+                "events": self.midi_events.value,
+                "events_per_second": self.midi_events.value / seconds if seconds else None,
+            },
+        }
@@ -0,0 +1,48 @@
+from array import array
+
+
+class MidiEventBuffer:
+    """
+    Append-only store for timestamped MIDI messages.
+
+    Timestamps live in a preallocated int64 array and messages in a
+    preallocated list, so appending from the MIDI callback is a pair of
+    index assignments with no allocation until the capacity is exhausted
+    (at which point both grow by `capacity` slots at once).
+    """
+
+    def __init__(self, capacity=65536):
+        self._grow_by = capacity
+        self._times = array('q', bytes(8 * capacity))
+        self._messages = [None] * capacity
+        self._count = 0
+
+    def append(self, timestamp_ns, msg):
+        i = self._count
+        if i == len(self._messages):
+            self._times.extend(array('q', bytes(8 * self._grow_by)))
+            self._messages.extend([None] * self._grow_by)
+        self._times[i] = timestamp_ns
+        self._messages[i] = msg
+        self._count = i + 1
+
+    def clear(self):
+        for i in range(self._count):
+            self._messages[i] = None
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def since(self, start):
+        """Yields (timestamp_ns, msg) for events appended at or after index `start`."""
+        # Snapshot the count so a concurrent append can't expose a half-written slot
+        count = self._count
+        for i in range(start, count):
+            yield self._times[i], self._messages[i]
+
+    def __iter__(self):
+        return self.since(0)
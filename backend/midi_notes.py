@@ -0,0 +1,200 @@
+import os
+import threading
+from collections import OrderedDict
+
+from .lazy import LazyModule
+
+mido = LazyModule("mido")
+np = LazyModule("numpy")
+
+SUSTAIN_CC = 64
+
+
+class NoteTable:
+    """
+    Columnar notes of one MIDI file, sorted by start time.
+
+    `release` is when the key went up; `end` is when the note stops
+    sounding once the sustain pedal is taken into account. `max_end` is the
+    running maximum of `end`, which turns "notes overlapping [t0, t1)" into
+    two binary searches plus a mask over the candidates between them.
+    `pedal` holds the sustain pedal events as (time, channel, value) columns.
+    """
+
+    def __init__(self, start, end, release, pitch, velocity, channel, duration, pedal=None):
+        order = np.argsort(start, kind="stable")
+        self.start = start[order]
+        self.end = end[order]
+        self.release = release[order]
+        self.pitch = pitch[order]
+        self.velocity = velocity[order]
+        self.channel = channel[order]
+        self.duration = duration
+        self.max_end = np.maximum.accumulate(self.end) if len(self.end) else self.end
+        if pedal is None:
+            pedal = (np.zeros(0), np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=np.uint8))
+        self.pedal_time, self.pedal_channel, self.pedal_value = pedal
+
+    def __len__(self):
+        return len(self.start)
+
+    def query(self, t0, t1, sustain=True):
+        """Indices of the notes sounding at some point in [t0, t1)."""
+        ends = self.end if sustain else self.release
+        max_end = self.max_end if sustain else np.maximum.accumulate(ends) if len(ends) else ends
+        hi = np.searchsorted(self.start, t1, side="left")
+        lo = np.searchsorted(max_end, t0, side="right")
+        candidates = np.arange(lo, max(hi, lo))
+        return candidates[ends[candidates] > t0]
+
+    def pedal_state(self, t):
+        """{channel: value} of the last sustain pedal event at or before t, for channels that have one."""
+        n = np.searchsorted(self.pedal_time, t, side="right")
+        return {int(ch): int(value) for ch, value in zip(self.pedal_channel[:n], self.pedal_value[:n])}
+
+    def pedal_events(self, t0, t1):
+        """Indices of the sustain pedal events in (t0, t1)."""
+        return np.arange(np.searchsorted(self.pedal_time, t0, side="right"),
+                         np.searchsorted(self.pedal_time, t1, side="left"))
+
+
+def _ticks_to_seconds(ticks, tempo_ticks, tempos, ticks_per_beat):
+    """Vectorized tick -> seconds conversion through a piecewise-constant tempo map."""
+    order = np.argsort(tempo_ticks, kind="stable")
+    tempo_ticks = np.concatenate(([0], np.asarray(tempo_ticks, dtype=np.int64)[order]))
+    tempos = np.concatenate(([500000], np.asarray(tempos, dtype=np.float64)[order])) # SMF default: 120 BPM
+    seconds_per_tick = tempos / (1e6 * ticks_per_beat)
+    segment_start = np.concatenate(([0.0], np.cumsum(np.diff(tempo_ticks) * seconds_per_tick[:-1])))
+    segment = np.searchsorted(tempo_ticks, ticks, side="right") - 1
+    return segment_start[segment] + (ticks - tempo_ticks[segment]) * seconds_per_tick[segment]
+
+
+def _read_events(path):
+    """
+    One pass over every track collecting note and sustain events as parallel
+    arrays in absolute ticks; the tempo map is applied afterwards in bulk,
+    which is much cheaper than letting mido merge and convert message by message.
+    """
+    mid = mido.MidiFile(path)
+    ticks, kinds, channels, data1, data2 = [], [], [], [], []
+    tempo_ticks, tempos = [], []
+    last_tick = 0
+    for track in mid.tracks:
+        tick = 0
+        for msg in track:
+            tick += msg.time
+            if msg.type == "note_on" or msg.type == "note_off":
+                on = msg.type == "note_on" and msg.velocity > 0
+                kinds.append(1 if on else 0)
+                data1.append(msg.note)
+                data2.append(msg.velocity)
+            elif msg.type == "control_change" and msg.control == SUSTAIN_CC:
+                kinds.append(2)
+                data1.append(SUSTAIN_CC)
+                data2.append(msg.value)
+            else:
+                if msg.type == "set_tempo":
+                    tempo_ticks.append(tick)
+                    tempos.append(msg.tempo)
+                continue
+            ticks.append(tick)
+            channels.append(msg.channel)
+        last_tick = max(last_tick, tick)
+
+    # Tracks were read one after another; put everything on one timeline, keeping file order on ties
+    ticks = np.array(ticks, dtype=np.int64)
+    order = np.argsort(ticks, kind="stable")
+    times = _ticks_to_seconds(ticks[order], tempo_ticks, tempos, mid.ticks_per_beat)
+    duration = float(_ticks_to_seconds(np.array([last_tick]), tempo_ticks, tempos, mid.ticks_per_beat)[0])
+    return (times, np.array(kinds, dtype=np.int8)[order], np.array(channels, dtype=np.int8)[order],
+            np.array(data1, dtype=np.int16)[order], np.array(data2, dtype=np.int16)[order], duration)
+
+
+def _pair_notes(times, kinds, channels, pitches, velocities, duration):
+    """
+    Pairs note-ons with the next event on the same channel and key: its
+    note-off, or a re-strike, which cuts the ringing note. Unterminated
+    notes run to the end of the file. Returns the note columns plus, per
+    note, the time of the next note-on of its key (inf if none).
+    """
+    notes = kinds <= 1
+    t, k, c, p, v = times[notes], kinds[notes], channels[notes], pitches[notes], velocities[notes]
+    key = c.astype(np.int32) * 128 + p
+    # File order breaks ties, so an off and an on at the same instant stay in that order
+    order = np.lexsort((np.arange(len(t)), t, key))
+    t, k, c, p, v, key = t[order], k[order], c[order], p[order], v[order], key[order]
+
+    same_key_next = np.zeros(len(t), dtype=bool)
+    same_key_next[:-1] = key[1:] == key[:-1]
+    next_time = np.full(len(t), duration)
+    next_time[:-1] = t[1:]
+    release = np.where(same_key_next, next_time, duration)
+
+    ons = np.flatnonzero(k == 1)
+    # The next note-on of the same key is simply the next on in key order, if the key matches
+    next_on = np.full(len(ons), np.inf)
+    if len(ons) > 1:
+        same_key = key[ons[1:]] == key[ons[:-1]]
+        next_on[:-1] = np.where(same_key, t[ons[1:]], np.inf)
+    return t[ons], release[ons], p[ons], v[ons], c[ons], next_on
+
+
+def _sustained_ends(release, channel, next_on, times, kinds, channels, values):
+    """Extends each release that lands while the channel's pedal is down to the pedal lift (or a re-strike)."""
+    end = release.copy()
+    pedal = kinds == 2
+    for ch in np.unique(channels[pedal]):
+        mask = pedal & (channels == ch)
+        pedal_times = times[mask]
+        down = values[mask] >= 64
+        # For every pedal event, when the pedal next comes up (inf if it never does)
+        up_times = np.where(~down, pedal_times, np.inf)
+        next_up = np.minimum.accumulate(up_times[::-1])[::-1]
+
+        notes = channel == ch
+        # Last pedal event at or before each release decides whether the pedal is held
+        idx = np.searchsorted(pedal_times, release[notes], side="right") - 1
+        held = (idx >= 0) & down[np.maximum(idx, 0)]
+        lift = next_up[np.maximum(idx, 0)]
+        extended = np.minimum(lift, next_on[notes])
+        end[notes] = np.where(held, np.maximum(extended, release[notes]), release[notes])
+    return end
+
+
+def build_note_table(path):
+    times, kinds, channels, data1, data2, duration = _read_events(path)
+    start, release, pitch, velocity, channel, next_on = _pair_notes(times, kinds, channels, data1, data2,
+                                                                    duration)
+    end = _sustained_ends(release, channel, next_on, times, kinds, channels, data2)
+    # A pedal that is never lifted lets notes ring to the end of the file
+    end = np.minimum(end, duration)
+    pedal = kinds == 2
+    return NoteTable(start, end, release, pitch.astype(np.uint8), velocity.astype(np.uint8),
+                     channel.astype(np.uint8), duration,
+                     pedal=(times[pedal], channels[pedal].astype(np.uint8), data2[pedal].astype(np.uint8)))
+
+
+class NoteTableCache:
+    """Parsed note tables keyed by path, reused until the file's mtime or size changes."""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._tables.get(path)
+            if cached is not None and cached[0] == stamp:
+                self._tables.move_to_end(path)
+                return cached[1]
+
+        table = build_note_table(path)
+        with self._lock:
+            self._tables[path] = (stamp, table)
+            self._tables.move_to_end(path)
+            while len(self._tables) > self.max_entries:
+                self._tables.popitem(last=False)
+        return table
@@ -0,0 +1,109 @@
+import os
+import struct
+import threading
+
+END_OF_TRACK = b"\x00\xff\x2f\x00"
+
+
+def _varlen(value):
+    out = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        out.insert(0, (value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(out)
+
+
+def _event_bytes(msg):
+    # Only channel messages and sysex are valid inside an SMF track
+    if msg.type == 'sysex':
+        payload = bytes(msg.data) + b"\xf7"
+        return b"\xf0" + _varlen(len(payload)) + payload
+    if msg.is_realtime or msg.bytes()[0] >= 0xF0:
+        return None
+    return bytes(msg.bytes())
+
+
+class StreamingMidiWriter:
+    """
+    Writes a type-0 Standard MIDI File incrementally while recording.
+
+    Event times are converted from absolute session seconds to absolute ticks
+    against an explicit tempo and resolution, and deltas are taken between
+    rounded absolute ticks, so rounding error never accumulates. A background
+    thread appends new events from a MidiEventBuffer every
+    `checkpoint_interval` seconds and leaves a complete, valid file (End of
+    Track + patched chunk length) on disk after each append.
+    """
+
+    def __init__(self, filename, events, to_seconds, ticks_per_beat=480, tempo=500000,
+                 checkpoint_interval=2.0):
+        self.filename = filename
+        self.ticks_per_beat = ticks_per_beat
+        self.tempo = tempo # microseconds per beat
+        self.checkpoint_interval = checkpoint_interval
+
+        self._events = events
+        self._to_seconds = to_seconds
+        self._next_index = 0
+        self._last_tick = 0
+        self._file = None
+        self._track_start = 0
+        self._track_end = 0 # Offset of the End of Track marker
+        self.events_written = 0
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def seconds_to_ticks(self, seconds):
+        return int(round(seconds * 1e6 / self.tempo * self.ticks_per_beat))
+
+    def close(self):
+        """Writes any remaining events and leaves a finalized file (none if nothing was recorded)."""
+        self._stop.set()
+        self._thread.join()
+        return self.events_written
+
+    def _run(self):
+        while not self._stop.wait(self.checkpoint_interval):
+            self._checkpoint()
+        self._checkpoint()
+        if self._file:
+            self._file.close()
+
+    def _open(self):
+        self._file = open(self.filename, "wb")
+        self._file.write(b"MThd" + struct.pack(">IHHH", 6, 0, 1, self.ticks_per_beat))
+        self._file.write(b"MTrk" + struct.pack(">I", 0))
+        self._track_start = self._file.tell()
+        tempo = struct.pack(">I", self.tempo)[1:]
+        self._file.write(b"\x00\xff\x51\x03" + tempo)
+        self._track_end = self._file.tell()
+
+    def _checkpoint(self):
+        chunk = bytearray()
+        for timestamp, msg in self._events.since(self._next_index):
+            self._next_index += 1
+            data = _event_bytes(msg)
+            if data is None:
+                continue
+            tick = max(self.seconds_to_ticks(self._to_seconds(timestamp)), self._last_tick)
+            chunk += _varlen(tick - self._last_tick) + data
+            self._last_tick = tick
+            self.events_written += 1
+
+        if not chunk:
+            return
+        if self._file is None:
+            self._open()
+
+        # New events replace the previous End of Track marker, then the track is closed again
+        self._file.seek(self._track_end)
+        self._file.write(chunk)
+        self._track_end = self._file.tell()
+        self._file.write(END_OF_TRACK)
+        self._file.seek(self._track_start - 4)
+        self._file.write(struct.pack(">I", self._track_end + len(END_OF_TRACK) - self._track_start))
+        self._file.flush()
+        os.fsync(self._file.fileno())
@@ -0,0 +1,201 @@
+import json
+import os
+import struct
+
+from .keyed_locks import KeyedLocks
+from .lazy import LazyModule
+
+np = LazyModule("numpy")
+
+# Samples per bin for each level of the pyramid, finest first; each divides the next
+PEAK_LEVELS = (256, 1024, 4096, 16384)
+PEAKS_MAGIC = b"DAWPEAK1"
+# Raw audio frames reduced per pass; a multiple of the coarsest level so bins never straddle passes
+READ_BLOCK_FRAMES = 16384 * 64
+
+_build_locks = KeyedLocks()
+
+
+def peaks_path(record_dir, session_id):
+    return os.path.join(record_dir, f"{session_id}_peaks.bin")
+
+
+def wav_samples(path):
+    """
+    Memory-maps the sample data of a PCM or float WAV file. Returns
+    (samples, rate, full_scale) where samples has shape (frames, channels);
+    24-bit files come back as (frames, channels, 3) raw bytes, see `to_float`.
+    """
+    with open(path, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError(f"{path} is not a WAV file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(size - 16 + (size & 1), os.SEEK_CUR)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+        file_size = os.fstat(f.fileno()).st_size
+
+    if fmt is None:
+        raise ValueError(f"{path} has no fmt chunk")
+    format_tag, channels, rate, _, _, bits = fmt
+    width = bits // 8
+    # A crashed take may claim more data than is on disk; trust the file size
+    frames = min(size, file_size - offset) // (channels * width)
+    if frames == 0:
+        return np.zeros((0, channels), dtype=np.float32), rate, 1.0
+
+    if format_tag == 3:
+        dtype, full_scale = {4: "<f4", 8: "<f8"}[width], 1.0
+    elif width == 3:
+        data = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(frames, channels, 3))
+        return data, rate, float(2 ** 23)
+    else:
+        dtype, full_scale = {1: "u1", 2: "<i2", 4: "<i4"}[width], float(2 ** (bits - 1))
+    data = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(frames, channels))
+    return data, rate, full_scale
+
+
+def to_float(block, full_scale):
+    """Converts samples (or bins) from `wav_samples` to float32 in -1..1."""
+    if block.ndim == 3:
+        # Little-endian 24-bit: shift into the top of an int32 so the sign comes along
+        b = block.astype(np.int32)
+        block = (b[..., 0] << 8 | b[..., 1] << 16 | b[..., 2] << 24) >> 8
+    elif block.dtype == np.uint8:
+        block = block.astype(np.int16) - 128
+    x = block.astype(np.float32)
+    if full_scale != 1.0:
+        x /= full_scale
+    return x
+
+
+def _reduce(mins, maxs, factor):
+    # Edge padding repeats a value already in the last bin, so its min/max are unchanged
+    pad = -len(mins) % factor
+    if pad:
+        mins = np.pad(mins, ((0, pad), (0, 0)), mode="edge")
+        maxs = np.pad(maxs, ((0, pad), (0, 0)), mode="edge")
+    channels = mins.shape[1]
+    # Reducing along a contiguous axis is far faster than across interleaved channels
+    mins = np.ascontiguousarray(mins.T).reshape(channels, -1, factor).min(axis=2).T
+    maxs = np.ascontiguousarray(maxs.T).reshape(channels, -1, factor).max(axis=2).T
+    return mins, maxs
+
+
+def build_peaks(wav_path, out_path, levels=PEAK_LEVELS):
+    """
+    Writes the min/max pyramid of a WAV file to `out_path`.
+
+    Layout: magic, u32 header length, JSON header, then per level an int16
+    array of shape (bins, channels, 2) holding (min, max) scaled to 32767.
+    The finest level is reduced from the memory-mapped samples a block at a
+    time; every coarser level is reduced from the one below it.
+    """
+    samples, rate, full_scale = wav_samples(wav_path)
+    frames, channels = samples.shape[:2]
+    per_level = {level: ([], []) for level in levels}
+
+    for start in range(0, frames, READ_BLOCK_FRAMES):
+        block = samples[start:start + READ_BLOCK_FRAMES]
+        if block.ndim == 3:
+            # Packed 24-bit has to be unpacked before it can be compared
+            block = to_float(block, full_scale)
+            mins, maxs = _reduce(block, block, levels[0])
+        else:
+            # Scaling is monotonic, so reduce the raw samples and convert only the bins
+            mins, maxs = _reduce(block, block, levels[0])
+            mins, maxs = to_float(mins, full_scale), to_float(maxs, full_scale)
+        per_level[levels[0]][0].append(mins)
+        per_level[levels[0]][1].append(maxs)
+        for finer, level in zip(levels, levels[1:]):
+            mins, maxs = _reduce(mins, maxs, level // finer)
+            per_level[level][0].append(mins)
+            per_level[level][1].append(maxs)
+
+    header = {"sample_rate": rate, "channels": channels, "frames": frames, "levels": []}
+    arrays = []
+    offset = 0
+    for level in levels:
+        mins, maxs = per_level[level]
+        if mins:
+            pairs = np.stack((np.concatenate(mins), np.concatenate(maxs)), axis=-1)
+        else:
+            pairs = np.zeros((0, channels, 2), dtype=np.float32)
+        pairs = np.round(np.clip(pairs, -1.0, 1.0) * 32767).astype("<i2")
+        header["levels"].append({"samples_per_bin": level, "bins": len(pairs), "offset": offset})
+        arrays.append(pairs)
+        offset += pairs.nbytes
+
+    header_bytes = json.dumps(header).encode()
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PEAKS_MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes)
+        for pairs in arrays:
+            f.write(pairs.tobytes())
+    os.replace(tmp_path, out_path)
+    return header
+
+
+class PeakFile:
+    """Read side of a peaks file; levels are memory-mapped so a query touches only its bins."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if f.read(len(PEAKS_MAGIC)) != PEAKS_MAGIC:
+                raise ValueError(f"{path} is not a peaks file")
+            (length,) = struct.unpack("<I", f.read(4))
+            self.header = json.loads(f.read(length))
+        data_offset = len(PEAKS_MAGIC) + 4 + length
+        self.sample_rate = self.header["sample_rate"]
+        self.channels = self.header["channels"]
+        self.frames = self.header["frames"]
+        self.levels = {}
+        for level in self.header["levels"]:
+            if level["bins"]:
+                self.levels[level["samples_per_bin"]] = np.memmap(
+                    path, dtype="<i2", mode="r", offset=data_offset + level["offset"],
+                    shape=(level["bins"], self.channels, 2))
+            else:
+                self.levels[level["samples_per_bin"]] = np.zeros((0, self.channels, 2), dtype="<i2")
+
+    def pick_level(self, start_frame, end_frame, width):
+        """Coarsest level that still gives at least `width` bins over the range."""
+        span = max(end_frame - start_frame, 1)
+        fitting = [level for level in self.levels if span / level >= width]
+        return max(fitting) if fitting else min(self.levels)
+
+    def query(self, start_frame, end_frame, samples_per_bin):
+        """Returns (first_bin, mins, maxs) for the bins covering [start_frame, end_frame), channel-major."""
+        pairs = self.levels[samples_per_bin]
+        first = max(start_frame // samples_per_bin, 0)
+        last = min(-(-end_frame // samples_per_bin), len(pairs))
+        window = np.asarray(pairs[first:max(last, first)], dtype=np.float32) / 32767
+        return first, window[..., 0].T, window[..., 1].T
+
+
+def ensure_peaks(session_id, record_dir="recordings"):
+    """
+    Returns the path of the session's peaks file, building it first if it is
+    missing or older than the WAV. None if the session has no audio.
+    """
+    wav_path = os.path.join(record_dir, f"{session_id}_audio.wav")
+    out_path = peaks_path(record_dir, session_id)
+    if not os.path.exists(wav_path):
+        return None
+
+    # Concurrent requests for the same session wait for one build instead of racing
+    with _build_locks.get(out_path):
+        if not os.path.exists(out_path) or os.path.getmtime(out_path) < os.path.getmtime(wav_path):
+            build_peaks(wav_path, out_path)
+    return out_path
@@ -0,0 +1,158 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from .render_cache import plugin_fingerprint
+
+logger = logging.getLogger(__name__)
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def _rss_bytes():
+    """Current resident set size of this process, or None if it can't be read."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _PooledEngine:
+    def __init__(self, key, engine, synth, fingerprint, size):
+        self.key = key
+        self.engine = engine
+        self.synth = synth
+        self.fingerprint = fingerprint
+        self.size = size # Estimated resident memory attributable to the plugin
+        self.in_use = False
+        self.last_used = time.monotonic()
+
+
+class PluginHostPool:
+    """
+    Keeps DawDreamer render engines with their plugin already loaded, keyed by
+    (vst_path, sample_rate, block_size), so repeat renders with the same
+    instrument skip the plugin load.
+
+    Engines idle for longer than `idle_timeout` seconds are dropped by a
+    background sweeper, and least recently used idle engines are evicted
+    before a new load whenever the estimated plugin memory would exceed
+    `max_bytes` or the pool would hold more than `max_engines`.
+    """
+
+    def __init__(self, daw, idle_timeout=600.0, max_bytes=2 * 1024 ** 3, max_engines=4):
+        self.daw = daw
+        self.idle_timeout = idle_timeout
+        self.max_bytes = max_bytes
+        self.max_engines = max_engines
+        self._entries = []
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self.loads = 0
+        self.reuses = 0
+
+    @contextmanager
+    def acquire(self, vst_path, sample_rate, block_size):
+        """Yields (engine, synth) for exclusive use; the plugin has no MIDI loaded."""
+        entry = self._checkout((os.path.abspath(vst_path), sample_rate, block_size))
+        try:
+            yield entry.engine, entry.synth
+        except Exception:
+            # A plugin that blew up mid-render is not trusted for the next job
+            self._discard(entry)
+            raise
+        else:
+            entry.synth.clear_midi()
+            with self._lock:
+                entry.in_use = False
+                entry.last_used = time.monotonic()
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            stale = [e for e in self._entries if not e.in_use and now - e.last_used > self.idle_timeout]
+            for entry in stale:
+                self._entries.remove(entry)
+        for entry in stale:
+            logger.info(f"Unloading idle plugin {entry.key[0]}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "engines": len(self._entries),
+                "in_use": sum(1 for e in self._entries if e.in_use),
+                "bytes": sum(e.size for e in self._entries),
+                "loads": self.loads,
+                "reuses": self.reuses,
+            }
+
+    def _checkout(self, key):
+        fingerprint = plugin_fingerprint(key[0])
+        with self._lock:
+            for entry in self._entries:
+                if entry.key == key and not entry.in_use:
+                    if entry.fingerprint != fingerprint:
+                        # Plugin changed on disk since it was loaded
+                        self._entries.remove(entry)
+                        break
+                    entry.in_use = True
+                    self.reuses += 1
+                    return entry
+            self._make_room()
+
+        entry = self._load(key, fingerprint)
+        with self._lock:
+            self._entries.append(entry)
+            self.loads += 1
+        self._start_sweeper()
+        return entry
+
+    def _load(self, key, fingerprint):
+        vst_path, sample_rate, block_size = key
+        before = _rss_bytes()
+        engine = self.daw.RenderEngine(sample_rate=sample_rate, block_size=block_size)
+        try:
+            synth = engine.make_plugin_processor("synth", vst_path)
+        except Exception as e:
+            logger.error(f"Failed to load VST: {e}")
+            raise RuntimeError(f"Could not load VST plugin at {vst_path}. Ensure it is a valid VST3/AU/VST2.")
+        after = _rss_bytes()
+        size = max(after - before, 0) if before is not None and after is not None else 0
+        logger.info(f"Loaded plugin {vst_path} ({size / (1024*1024):.0f} MB resident)")
+
+        entry = _PooledEngine(key, engine, synth, fingerprint, size)
+        entry.in_use = True
+        return entry
+
+    def _make_room(self):
+        # Called with the lock held; only idle engines can go
+        idle = sorted((e for e in self._entries if not e.in_use), key=lambda e: e.last_used)
+        while idle and (len(self._entries) >= self.max_engines
+                        or sum(e.size for e in self._entries) >= self.max_bytes):
+            self._entries.remove(idle.pop(0))
+
+    def _discard(self, entry):
+        with self._lock:
+            if entry in self._entries:
+                self._entries.remove(entry)
+
+    def _start_sweeper(self):
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(target=self._sweep, daemon=True)
+        self._sweeper.start()
+
+    def _sweep(self):
+        interval = max(self.idle_timeout / 4, 1.0)
+        while True:
+            time.sleep(interval)
+            self.evict_idle()
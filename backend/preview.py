@@ -0,0 +1,279 @@
+import logging
+import math
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from . import metrics
+from .lazy import LazyModule
+from .midi_notes import NoteTableCache, SUSTAIN_CC
+from .render_cache import RENDER_CACHE_VERSION, cache_key, file_digest, plugin_fingerprint
+from .workers import init_worker
+
+mido = LazyModule("mido")
+np = LazyModule("numpy")
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_GRID = 0.5 # Windows snap outwards to this grid so nearby scrub positions share a cache entry
+MAX_PREVIEW_SECONDS = 30.0
+MIN_PREROLL = 0.5 # Lets the plugin settle (and reverb tails build) before the window starts
+MAX_PREROLL = 4.0 # Notes struck earlier than this are re-struck at the pre-roll start
+RELEASE_TAIL = 1.0 # Notes released this long before t0 still ring into the window
+FADE_SECONDS = 0.005 # Keeps the cut edges from clicking
+TICKS_PER_BEAT = 480
+TEMPO = 500000 # 120 BPM, so one tick is 1/960 s
+AAC_BITRATE = "192k"
+
+# Parsed in whichever process renders, reused while the MIDI file is unchanged
+_note_tables = NoteTableCache(max_entries=8)
+
+
+def snap_window(t0, t1, grid=PREVIEW_GRID):
+    """[t0, t1) widened to the grid; raises ValueError for empty or overlong windows."""
+    t0 = max(math.floor(t0 / grid) * grid, 0.0)
+    t1 = math.ceil(t1 / grid) * grid
+    if t1 <= t0:
+        raise ValueError("Preview window is empty")
+    if t1 - t0 > MAX_PREVIEW_SECONDS:
+        raise ValueError(f"Preview window is longer than {MAX_PREVIEW_SECONDS:g} seconds")
+    return t0, t1
+
+
+def preview_cache_key(midi_path, vst_path, t0, t1, sample_rate, block_size, engine="dawdreamer"):
+    """Identifies the compressed preview of one window; any edit to the MIDI or plugin misses."""
+    return cache_key("preview", RENDER_CACHE_VERSION, engine, file_digest(midi_path), plugin_fingerprint(vst_path),
+                sample_rate, block_size, f"{t0:.3f}", f"{t1:.3f}", MAX_PREROLL, RELEASE_TAIL)
+
+
+def preview_events(table, t0, t1):
+    """
+    What has to be played to hear [t0, t1) as it sounds in the full render.
+
+    The render starts at the earliest onset among the notes still sounding
+    (or ringing out) at t0, including ones held by the sustain pedal, so
+    their attacks and decays are real, but never more than MAX_PREROLL
+    before t0; older notes are struck again at the pre-roll start. Each
+    channel's pedal state as of the pre-roll start is replayed first.
+    Returns (preroll_start, events) with events as (seconds, message)
+    pairs relative to the pre-roll start, in playing order.
+    """
+    idx = table.query(max(t0 - RELEASE_TAIL, 0.0), t1, sustain=True)
+    earliest = float(table.start[idx].min()) if len(idx) else t0
+    preroll_start = max(min(earliest, t0 - MIN_PREROLL), t0 - MAX_PREROLL, 0.0)
+
+    # Same-instant order: pedal first, then note-offs, then note-ons
+    events = [(0.0, 0, mido.Message("control_change", channel=ch, control=SUSTAIN_CC, value=value))
+              for ch, value in sorted(table.pedal_state(preroll_start).items())]
+    for i in table.pedal_events(preroll_start, t1):
+        events.append((float(table.pedal_time[i]) - preroll_start, 0,
+                       mido.Message("control_change", channel=int(table.pedal_channel[i]), control=SUSTAIN_CC,
+                                    value=int(table.pedal_value[i]))))
+    for i in idx:
+        on = max(float(table.start[i]), preroll_start)
+        # A key already up under a held pedal still needs its note-off; the pedal keeps it ringing
+        off = min(max(float(table.release[i]), on + 0.001), t1)
+        channel, pitch = int(table.channel[i]), int(table.pitch[i])
+        events.append((on - preroll_start, 2,
+                       mido.Message("note_on", channel=channel, note=pitch, velocity=int(table.velocity[i]))))
+        events.append((off - preroll_start, 1, mido.Message("note_off", channel=channel, note=pitch, velocity=0)))
+    events.sort(key=lambda event: event[:2])
+    return preroll_start, [(seconds, msg) for seconds, _, msg in events]
+
+
+def write_preview_midi(events, path):
+    mid = mido.MidiFile(ticks_per_beat=TICKS_PER_BEAT)
+    track = mido.MidiTrack()
+    mid.tracks.append(track)
+    track.append(mido.MetaMessage("set_tempo", tempo=TEMPO, time=0))
+    ticks_per_second = TICKS_PER_BEAT * 1e6 / TEMPO
+    last_tick = 0
+    for seconds, msg in events:
+        tick = int(round(seconds * ticks_per_second))
+        track.append(msg.copy(time=tick - last_tick))
+        last_tick = tick
+    mid.save(path)
+
+
+def encode_aac(audio, sample_rate, path):
+    """Encodes frames x channels float32 audio to an AAC .m4a that can start playing before it has fully loaded."""
+    channels = audio.shape[1] if audio.ndim > 1 else 1
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "f32le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0",
+        # The fast coder is several times quicker than the default two-loop search at preview bitrates
+        "-c:a", "aac", "-aac_coder", "fast", "-b:a", AAC_BITRATE, "-movflags", "+faststart", "-f", "mp4", path,
+    ]
+    try:
+        result = subprocess.run(cmd, input=np.ascontiguousarray(audio, dtype=np.float32).tobytes(),
+                                capture_output=True)
+    except OSError as e:
+        # Usually ffmpeg missing from PATH; a FileNotFoundError here would read as a missing session
+        raise RuntimeError(f"Could not run ffmpeg: {e}")
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to encode preview: {result.stderr.decode(errors='replace').strip()}")
+
+
+def render_preview(session_id, vst_path, t0, t1, output_path, record_dir="recordings"):
+    """
+    Renders [t0, t1) seconds of the session with the plugin and writes it
+    to `output_path` as AAC. Uses the renderer's pooled engines, so only
+    the first preview with a plugin pays for loading it. Returns timings.
+    """
+    from . import renderer
+
+    midi_path = os.path.join(record_dir, f"{session_id}_midi.mid")
+    started = time.perf_counter()
+    table = _note_tables.get(midi_path)
+    preroll_start, events = preview_events(table, t0, t1)
+    skip = int(round((t0 - preroll_start) * renderer.SAMPLE_RATE))
+    frames = int(round((t1 - t0) * renderer.SAMPLE_RATE))
+
+    if not renderer.DAW_AVAILABLE:
+        logger.warning("Rendering preview with DUMMY audio (DawDreamer missing)")
+        audio = np.concatenate(list(renderer.tone_blocks(t1 - t0, renderer.SAMPLE_RATE)))[:, None]
+    else:
+        midi_tmp = f"{output_path}.mid"
+        write_preview_midi(events, midi_tmp)
+        try:
+            pool = renderer.plugin_pool
+            with pool.acquire(vst_path, renderer.SAMPLE_RATE, renderer.BUFFER_SIZE) as (engine, synth):
+                engine.load_midi(midi_tmp, clear_previous=True, map_to_processor="synth")
+                engine.load_graph([(synth, [])])
+                # Rendering from time zero is all DawDreamer offers; the pre-roll is cut off below
+                engine.render((skip + frames) / renderer.SAMPLE_RATE)
+                audio = engine.get_audio()[:, skip:skip + frames].T
+        finally:
+            os.remove(midi_tmp)
+    rendered = time.perf_counter()
+
+    fade = min(int(FADE_SECONDS * renderer.SAMPLE_RATE), len(audio) // 2)
+    if fade:
+        audio = audio.astype(np.float32, copy=True)
+        ramp = np.linspace(0.0, 1.0, fade, dtype=np.float32)[:, None]
+        audio[:fade] *= ramp
+        audio[-fade:] *= ramp[::-1]
+    encode_aac(audio, renderer.SAMPLE_RATE, output_path)
+    return {
+        "preroll": round(t0 - preroll_start, 3),
+        "render_seconds": round(rendered - started, 4),
+        "encode_seconds": round(time.perf_counter() - rendered, 4),
+    }
+
+
+class PreviewRenderer:
+    """
+    Serves short compressed renders of a time window for scrubbing.
+
+    Finished previews live in a RenderCache keyed by window, MIDI contents
+    and plugin, so going back over a stretch already heard is a cache read.
+    Misses render on a single long-lived worker process that keeps its
+    plugin engines warm between requests; a plugin crash takes down the
+    worker, not the server. Identical requests arriving while a render is
+    in flight wait for that render instead of starting another.
+    """
+
+    def __init__(self, record_dir="recordings", cache=None, timeout=60.0, plugin_max_bytes=1024 ** 3):
+        self.record_dir = record_dir
+        self.cache = cache
+        self.timeout = timeout
+        self.plugin_max_bytes = plugin_max_bytes # The worker's plugins, on top of the RenderWorkers budget
+        self._executor = None
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=init_worker, initargs=(self.plugin_max_bytes,))
+            return self._executor
+
+    def get(self, session_id, vst_path, t0, t1):
+        """
+        Returns {"path", "key", "start", "end", "cached"} for the window
+        [t0, t1) snapped to PREVIEW_GRID. Raises FileNotFoundError for a
+        missing session or plugin and ValueError for a bad window.
+        """
+        from .renderer import BUFFER_SIZE, DAW_AVAILABLE, SAMPLE_RATE
+
+        midi_path = os.path.join(self.record_dir, f"{session_id}_midi.mid")
+        if not os.path.exists(midi_path):
+            raise FileNotFoundError(f"MIDI file not found: {midi_path}")
+        if not os.path.exists(vst_path):
+            raise FileNotFoundError(f"VST plugin not found: {vst_path}")
+        t0, t1 = snap_window(t0, t1)
+
+        started = time.perf_counter()
+        key = preview_cache_key(midi_path, vst_path, t0, t1, SAMPLE_RATE, BUFFER_SIZE,
+                                engine="dawdreamer" if DAW_AVAILABLE else "dummy")
+        preview = {"key": key, "start": t0, "end": t1, "cached": True}
+        path = self.cache.get(key)
+        if path is None:
+            preview["cached"] = False
+            path = self._render(key, session_id, vst_path, t0, t1)
+            metrics.PREVIEW_RENDERS.inc()
+        else:
+            metrics.PREVIEW_CACHE_HITS.inc()
+        metrics.PREVIEW_SECONDS.observe(time.perf_counter() - started)
+        preview["path"] = path
+        return preview
+
+    def _render(self, key, session_id, vst_path, t0, t1):
+        with self._lock:
+            waiting = self._in_flight.get(key)
+            if waiting is None:
+                self._in_flight[key] = done = Future()
+        if waiting is not None:
+            return waiting.result(timeout=self.timeout)
+
+        output_path = self.cache.temp_path(".m4a")
+        executor = self._ensure_started()
+        future = executor.submit(render_preview, session_id, vst_path, t0, t1, output_path, self.record_dir)
+        try:
+            info = future.result(timeout=self.timeout)
+            logger.info(f"Preview {session_id} [{t0:g}, {t1:g}) rendered: {info}")
+            path = self.cache.put(key, output_path, ".m4a")
+        except Exception as e:
+            if isinstance(e, TimeoutError) and not future.cancel():
+                # The worker is stuck in this render: it is killed so it stops holding a CPU and its plugins,
+                # anything it wrote is removed once the pool notices, and later requests get a fresh worker
+                future.add_done_callback(lambda _: _remove_file(output_path))
+                self._reset(executor)
+            elif isinstance(e, BrokenProcessPool):
+                # The plugin took the worker down; the next request starts a fresh one
+                self._reset(executor)
+            _remove_file(output_path)
+            done.set_exception(e)
+            raise
+        else:
+            done.set_result(path)
+            return path
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        # shutdown() alone would leave a stuck worker running; the executor has no public way to stop one
+        processes = list((executor._processes or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.kill()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
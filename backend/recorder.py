@@ -1,52 +1,77 @@
-import cv2
-import pyaudio
-import wave
-import mido
 import threading
+import queue
 import time
 import os
-import subprocess
-import re
+import json
 from datetime import datetime
+from . import devices
+from .lazy import LazyModule
+from .audio_capture import AudioInput, PRIMARY_STREAM
+from .midi_buffer import MidiEventBuffer
+from .midi_writer import StreamingMidiWriter
+from .session_clock import SessionClock
+from .peaks import ensure_peaks
+from .thumbnails import ensure_thumbnails
+from .metrics import RecordingMetrics
+from .video_encoders import DEFAULT_SETTINGS, open_video_encoder
+
+# Capture libraries load on the first take, not when the server starts
+cv2 = LazyModule("cv2")
+mido = LazyModule("mido")
 
 class MultiTrackRecorder:
-    def __init__(self, recordings_dir="recordings"):
+    def __init__(self, recordings_dir="recordings", catalog=None, live_feed=None):
         self.recordings_dir = recordings_dir
+        self.catalog = catalog # Optional SessionCatalog to register finished takes with
+        self.live_feed = live_feed # Optional LiveFeed for meters and MIDI activity while recording
         if not os.path.exists(self.recordings_dir):
             os.makedirs(self.recordings_dir)
             
         self.is_recording = False
         self.start_time = None
+        self.clock = SessionClock() # Shared time base for every stream of a take
+        self.stop_event = threading.Event()
         
         # Audio config
         self.chunk = 1024
-        self.format = pyaudio.paInt16
-        self.channels = 2 # Will be updated based on device cap
+        self.audio_format = "int24" # "int16", "int24" or "float32"; falls back to int16 per device
         self.rate = 44100
-        self.audio_frames = []
+        self.audio_buffer_seconds = 10.0 # Ring buffer between capture and disk, per device
+        self.audio_inputs = []
         
         # Video config
         self.video_cap = None
         self.video_writer = None
+        self.video_queue_size = 60 # ~2s of frames between capture and encoder
+        self.video_encoder = dict(DEFAULT_SETTINGS) # See video_encoders.encoder_settings
+        self.video_stats = {}
+        self.metrics = RecordingMetrics()
         
         # MIDI config
         self.midi_input = None
-        self.midi_messages = []
+        self.midi_mode = "callback" # "callback" (event-driven) or "poll" (legacy)
+        self.midi_messages = MidiEventBuffer()
+        self.midi_writer = None
+        self.midi_ticks_per_beat = 480
+        self.midi_tempo = 500000 # 120 BPM, so one beat is 0.5s
         
         self.threads = []
 
-    def start_recording(self, video_device_index=0, audio_device_index=None, midi_port_name=None):
+    def start_recording(self, video_device_index=0, audio_device_index=None, midi_port_name=None,
+                        audio_device_indices=None):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.session_id = f"session_{timestamp}"
         
         self.is_recording = True
+        self.stop_event.clear()
         self.start_time = time.time()
-        self.audio_frames = []
-        self.midi_messages = []
+        self.clock.start()
+        self.midi_messages.clear()
+        self.video_stats = {}
+        self.metrics = RecordingMetrics()
         
-        # Start Audio Thread
-        self.audio_thread = threading.Thread(target=self._record_audio, args=(audio_device_index,))
-        self.audio_thread.start()
+        # Audio devices run in callback mode on PortAudio's threads, one stream each
+        self._open_audio(audio_device_indices or [audio_device_index])
         
         # Start Video Thread
         self.video_thread = threading.Thread(target=self._record_video, args=(video_device_index,))
@@ -54,82 +79,97 @@ class MultiTrackRecorder:
         
         # Start MIDI Thread (if port provided)
         if midi_port_name:
+            # Events are appended to disk while recording, so stopping costs the same for any take length
+            self.midi_writer = StreamingMidiWriter(self._midi_filename(),
+                                                   self.midi_messages,
+                                                   self.clock.seconds,
+                                                   ticks_per_beat=self.midi_ticks_per_beat,
+                                                   tempo=self.midi_tempo)
             self.midi_thread = threading.Thread(target=self._record_midi, args=(midi_port_name,))
             self.midi_thread.start()
             
+        if self.live_feed:
+            self.live_feed.flush_midi(0.0) # MIDI batching restarts on the new session clock
+            self.live_feed.publish({"type": "status", "recording": True, "session_id": self.session_id})
         print(f"Recording started: {self.session_id}")
 
     def stop_recording(self):
         self.is_recording = False
+        self.stop_event.set()
         
-        if hasattr(self, 'audio_thread'):
-            self.audio_thread.join()
+        self._close_audio()
         if hasattr(self, 'video_thread'):
             self.video_thread.join()
         if hasattr(self, 'midi_thread'):
             self.midi_thread.join()
             
-        self._save_midi()
+        self._finish_midi()
+        self.clock.write_manifest(self.recordings_dir, self.session_id)
+        self._write_metrics()
+        if self.catalog:
+            self.catalog.add_session(self.session_id)
+        if self.live_feed:
+            self.live_feed.publish({"type": "status", "recording": False, "session_id": self.session_id})
+        # Derived files are built off the request path; readers build them on demand if they get there first
+        threading.Thread(target=self._post_process, args=(self.session_id,), daemon=True).start()
+        if self.video_stats:
+            print(f"Video: {self.video_stats['frames_written']} frames @ {self.video_stats['fps']} fps, "
+                  f"{self.video_stats['frames_dropped']} dropped, {self.video_stats['frames_duplicated']} duplicated")
         print(f"Recording stopped: {self.session_id}")
         return self.session_id
 
-    def _record_audio(self, device_index):
-        p = pyaudio.PyAudio()
-        
-        # Determine channels for this device
+    def _write_metrics(self):
+        summary = self.metrics.summary(round(time.time() - self.start_time, 3))
+        summary["session_id"] = self.session_id
+        path = os.path.join(self.recordings_dir, f"{self.session_id}_metrics.json")
+        try:
+            with open(path, "w") as f:
+                json.dump(summary, f, indent=2)
+        except OSError as e:
+            print(f"Error writing metrics for {self.session_id}: {e}")
+
+    def _post_process(self, session_id):
         try:
-            dev_info = p.get_device_info_by_host_api_device_index(0, device_index)
-            max_channels = int(dev_info.get('maxInputChannels'))
-            # Use 2 if available, otherwise mono
-            channels = min(2, max_channels)
-            if channels < 1: channels = 1 # Fallback
+            ensure_peaks(session_id, self.recordings_dir)
         except Exception as e:
-            print(f"Error getting device info: {e}")
-            channels = 1
-            
-        self.channels = channels # Update class var for saving later
-        
+            print(f"Error building waveform peaks for {session_id}: {e}")
         try:
-            # Try preferred channels first
-            try:
-                stream = p.open(format=self.format,
-                                channels=self.channels,
-                                rate=self.rate,
-                                input=True,
-                                input_device_index=device_index,
-                                frames_per_buffer=self.chunk)
-            except OSError:
-                # Fallback to mono if stereo fails (or vice versa)
-                print("Fallback to mono recording")
-                self.channels = 1
-                stream = p.open(format=self.format,
-                                channels=self.channels,
-                                rate=self.rate,
-                                input=True,
-                                input_device_index=device_index,
-                                frames_per_buffer=self.chunk)
+            ensure_thumbnails(session_id, self.recordings_dir)
         except Exception as e:
-            print(f"Error opening audio stream: {e}")
-            p.terminate()
+            print(f"Error building video thumbnails for {session_id}: {e}")
+
+    def _open_audio(self, device_indices):
+        self.audio_inputs = []
+        for device_index in device_indices:
+            # Named by open order, so the first device that works always lands in {session}_audio.wav
+            n = len(self.audio_inputs)
+            stream_name = PRIMARY_STREAM if n == 0 else f"{PRIMARY_STREAM}_{n}"
+            audio_input = AudioInput(device_index, stream_name,
+                                     os.path.join(self.recordings_dir, f"{self.session_id}_{stream_name}.wav"),
+                                     self.clock,
+                                     sample_format=self.audio_format,
+                                     rate=self.rate,
+                                     chunk=self.chunk,
+                                     buffer_seconds=self.audio_buffer_seconds,
+                                     metrics=self.metrics,
+                                     live_feed=self.live_feed)
+            try:
+                self.audio_inputs.append(audio_input.open())
+            except Exception as e:
+                print(f"Error opening audio stream: {e}")
+
+    def _close_audio(self):
+        for audio_input in self.audio_inputs:
+            audio_input.close()
+        if len(self.audio_inputs) < 2:
             return
-        
-        
-        while self.is_recording:
-            data = stream.read(self.chunk)
-            self.audio_frames.append(data)
-            
-        stream.stop_stream()
-        stream.close()
-        p.terminate()
-        
-        # Save Audio
-        filename = os.path.join(self.recordings_dir, f"{self.session_id}_audio.wav")
-        wf = wave.open(filename, 'wb')
-        wf.setnchannels(self.channels)
-        wf.setsampwidth(p.get_sample_size(self.format))
-        wf.setframerate(self.rate)
-        wf.writeframes(b''.join(self.audio_frames))
-        wf.close()
+        # Drift of each extra device against the first, the same clock error the renderer would have to correct
+        reference = self.audio_inputs[0].measured_rate()
+        for audio_input in self.audio_inputs[1:]:
+            measured = audio_input.measured_rate()
+            if reference and measured:
+                self.clock.update(audio_input.stream_name, reference_stream=PRIMARY_STREAM,
+                                  relative_drift_ppm=round((measured / reference - 1) * 1e6, 2))
 
     def _record_video(self, device_index):
         cap = cv2.VideoCapture(device_index)
@@ -139,118 +179,157 @@ class MultiTrackRecorder:
             print("Error: Could not open video device.")
             return
 
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
         filename = os.path.join(self.recordings_dir, f"{self.session_id}_video.mp4")
         
         # Default resolution - might need adjustment based on camera
         width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = 30.0 # Standard FPS
+        # Use the rate the camera reports; some drivers return 0
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if not fps or fps <= 0 or fps > 240:
+            fps = 30.0
         
-        out = cv2.VideoWriter(filename, fourcc, fps, (width, height))
+        try:
+            out = open_video_encoder(filename, fps, width, height, self.video_encoder)
+        except Exception as e:
+            print(f"Error opening video encoder: {e}")
+            cap.release()
+            return
         
-        while self.is_recording:
-            ret, frame = cap.read()
-            if ret:
-                out.write(frame)
-            else:
+        # Capture and encode run on separate threads so a slow encode never stalls the camera
+        frames = queue.Queue(maxsize=self.video_queue_size)
+        stats = {"fps": fps, "frames_captured": 0, "frames_written": 0,
+                 "frames_dropped": 0, "frames_duplicated": 0}
+        encoder = threading.Thread(target=self._encode_video, args=(frames, out, fps, stats))
+        encoder.start()
+        
+        metrics = self.metrics
+        try:
+            while self.is_recording:
+                read_start = time.perf_counter()
+                ret, frame = cap.read()
+                metrics.video_capture_seconds.observe(time.perf_counter() - read_start)
+                if not ret:
+                    metrics.video_capture_failures.inc()
+                    print("Error: Video capture failed, stopping video track.")
+                    break
+                stats["frames_captured"] += 1
+                metrics.video_frames.inc()
+                ts = self.clock.now_ns()
+                if stats["frames_captured"] == 1:
+                    self.clock.mark_first("video", ts, file=os.path.basename(filename), fps=fps)
+                try:
+                    frames.put_nowait((ts, frame))
+                except queue.Full:
+                    # Encoder is behind; the gap is filled by duplication on the other side
+                    stats["frames_dropped"] += 1
+                    metrics.video_dropped.inc()
+                metrics.video_queue_depth.set(frames.qsize())
+        finally:
+            cap.release()
+            frames.put(None)
+            encoder.join()
+            try:
+                out.close()
+            except Exception as e:
+                print(f"Error finishing video: {e}")
+            metrics.video_queue_depth.set(0)
+            self.video_stats = stats
+            self.clock.update("video", frames=stats["frames_written"], **out.describe())
+
+    def _encode_video(self, frames, out, fps, stats):
+        # Holds a constant output rate: output frame N belongs at first_ts + N / fps.
+        # Late frames repeat the previous image, early ones are dropped.
+        first_ts = None
+        last_frame = None
+        next_index = 0
+        dropped = 0
+        failed = False
+        metrics = self.metrics
+        
+        while True:
+            item = frames.get()
+            if item is None:
                 break
+            if failed:
+                # Keep draining so the capture thread never blocks on a full queue
+                dropped += 1
+                continue
+            ts, frame = item
+            if first_ts is None:
+                first_ts = ts
+            target = int(round((ts - first_ts) / 1e9 * fps))
+            
+            if target < next_index:
+                dropped += 1
+                metrics.video_dropped.inc()
+                continue
+            
+            try:
+                while last_frame is not None and next_index < target:
+                    out.write(last_frame)
+                    next_index += 1
+                    stats["frames_duplicated"] += 1
+                    metrics.video_duplicated.inc()
                 
-        cap.release()
-        out.release()
+                encode_start = time.perf_counter()
+                out.write(frame)
+                metrics.video_encode_seconds.observe(time.perf_counter() - encode_start)
+            except Exception as e:
+                print(f"Error encoding video, dropping the rest of the take: {e}")
+                failed = True
+                continue
+            next_index += 1
+            last_frame = frame
+        
+        # Capture side is finished by now, so the shared counter is safe to touch
+        stats["frames_dropped"] += dropped
+        stats["frames_written"] = next_index
 
     def _record_midi(self, port_name):
         try:
-            with mido.open_input(port_name) as inport:
-                while self.is_recording:
-                    for msg in inport.iter_pending():
-                        # Calculate delta time relative to start
-                        current_time = time.time()
-                        delta = current_time - self.start_time
-                        self.midi_messages.append((delta, msg))
-                    time.sleep(0.001) # Small sleep to prevent busy loop
+            if self.midi_mode == "poll":
+                self._poll_midi(port_name)
+                return
+            # The backend delivers messages on its own thread; stamp them the moment they arrive
+            with mido.open_input(port_name, callback=self._on_midi_message):
+                self.stop_event.wait()
         except Exception as e:
             print(f"MIDI Error: {e}")
 
-    def _save_midi(self):
-        if not self.midi_messages:
+    def _on_midi_message(self, msg):
+        ts = self.clock.now_ns()
+        self.midi_messages.append(ts, msg)
+        self.metrics.midi_events.inc()
+        if self.live_feed:
+            self.live_feed.note_midi(self.clock.seconds(ts), msg)
+
+    def _poll_midi(self, port_name):
+        with mido.open_input(port_name) as inport:
+            while self.is_recording:
+                for msg in inport.iter_pending():
+                    self._on_midi_message(msg)
+                time.sleep(0.001) # Small sleep to prevent busy loop
+
+    def _finish_midi(self):
+        if self.midi_writer is None:
             return
-            
-        filename = os.path.join(self.recordings_dir, f"{self.session_id}_midi.mid")
-        mid = mido.MidiFile()
-        track = mido.MidiTrack()
-        mid.tracks.append(track)
-        
-        last_time = 0
-        ticks_per_second = 480 # Standard resolution
-        
-        for delta_time, msg in self.midi_messages:
-            # Convert time headers to ticks
-            # This is a simplified conversion
-            ticks = int((delta_time - last_time) * ticks_per_second)
-            last_time = delta_time
-            
-            msg.time = ticks
-            track.append(msg)
-            
-        mid.save(filename)
+        events = self.midi_writer.close()
+        self.midi_writer = None
+        if not events:
+            return
+        # Tick 0 of the file is the session start itself
+        self.clock.update("midi", file=os.path.basename(self._midi_filename()), offset_seconds=0.0,
+                          events=events, ticks_per_beat=self.midi_ticks_per_beat, tempo=self.midi_tempo)
+
+    def _midi_filename(self):
+        return os.path.join(self.recordings_dir, f"{self.session_id}_midi.mid")
 
     def get_audio_devices(self):
-        p = pyaudio.PyAudio()
-        info = p.get_host_api_info_by_index(0)
-        numdevices = info.get('deviceCount')
-        devices = []
-        for i in range(0, numdevices):
-            if (p.get_device_info_by_host_api_device_index(0, i).get('maxInputChannels')) > 0:
-                devices.append({
-                    "index": i,
-                    "name": p.get_device_info_by_host_api_device_index(0, i).get('name')
-                })
-        p.terminate()
-        return devices
+        return devices.list_audio_devices()
 
     def get_midi_ports(self):
-        return mido.get_input_names()
+        return devices.list_midi_ports()
 
     def get_video_devices(self):
-        devices = []
-        try:
-            # Run ffmpeg command to list devices
-            # ffmpeg writes to stderr
-            cmd = ['ffmpeg', '-f', 'avfoundation', '-list_devices', 'true', '-i', '']
-            result = subprocess.run(cmd, stderr=subprocess.PIPE, text=True)
-            output = result.stderr
-            
-            lines = output.split('\n')
-            parsing_video = False
-            
-            for line in lines:
-                if "AVFoundation video devices:" in line:
-                    parsing_video = True
-                    continue
-                if "AVFoundation audio devices:" in line:
-                    parsing_video = False
-                    break
-                    
-                if parsing_video:
-                    # Match pattern like: [AVFoundation indev @ 0x...] [0] FaceTime HD Camera
-                    # or just: [0] FaceTime HD Camera depending on version/output
-                    # Regex to find [N] Some Name
-                    match = re.search(r'\[(\d+)\] (.*)', line)
-                    if match:
-                        index = int(match.group(1))
-                        name = match.group(2).strip()
-                        # Verify this index works with cv2? 
-                        # Usually AVFoundation index maps to cv2 index on mac if using avfoundation backend
-                        devices.append({"index": index, "name": name})
-                        
-        except Exception as e:
-            print(f"Error listing video devices: {e}")
-            # Fallback
-            for i in range(3):
-                cap = cv2.VideoCapture(i)
-                if cap.isOpened():
-                    devices.append({"index": i, "name": f"Camera {i}"})
-                    cap.release()
-                    
-        return devices
+        return devices.list_video_devices()
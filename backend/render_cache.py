@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+# Bump when a change to the renderer would make previously cached audio wrong
+RENDER_CACHE_VERSION = 1
+
+
+# Digests and fingerprints are reused while the file's path, mtime and size are unchanged
+_MEMO_ENTRIES = 256
+BUNDLE_RECHECK_SECONDS = 5.0 # Replacing a file inside a bundle need not touch the bundle's own mtime
+_digests = {}
+_fingerprints = {}
+_memo_lock = threading.Lock()
+
+
+def _memoized(memo, key, compute):
+    with _memo_lock:
+        if key in memo:
+            return memo[key]
+    value = compute()
+    with _memo_lock:
+        if len(memo) >= _MEMO_ENTRIES:
+            memo.pop(next(iter(memo)))
+        memo[key] = value
+    return value
+
+
+def file_digest(path, chunk_size=1 << 20):
+    stat = os.stat(path)
+
+    def digest():
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(chunk_size), b""):
+                h.update(block)
+        return h.hexdigest()
+    return _memoized(_digests, (os.path.abspath(path), stat.st_mtime_ns, stat.st_size), digest)
+
+
+def plugin_fingerprint(vst_path):
+    """
+    Cheap identity for a plugin: size and mtime of the file, or of every file
+    inside a .vst3/.component bundle, so replacing the binary invalidates it.
+    A bundle is re-walked at most every BUNDLE_RECHECK_SECONDS.
+    """
+    stat = os.stat(vst_path)
+    if not os.path.isdir(vst_path):
+        return f"{os.path.abspath(vst_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    window = int(time.monotonic() // BUNDLE_RECHECK_SECONDS)
+    return _memoized(_fingerprints, (os.path.abspath(vst_path), stat.st_mtime_ns, stat.st_size, window),
+                     lambda: _bundle_fingerprint(vst_path))
+
+
+def _bundle_fingerprint(vst_path):
+    h = hashlib.sha256(os.path.abspath(vst_path).encode())
+    for root, dirs, files in os.walk(vst_path):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            h.update(f"{os.path.relpath(path, vst_path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def cache_key(*parts):
+    """Hashes the parts that identify a cache entry; the first should name the kind of entry."""
+    return hashlib.sha256("\0".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def audio_cache_key(midi_path, vst_path, sample_rate, block_size, plugin_state=None, engine="dawdreamer"):
+    """Identifies a rendered (pre-alignment) audio buffer."""
+    state = hashlib.sha256(plugin_state).hexdigest() if plugin_state else "default"
+    return cache_key("audio", RENDER_CACHE_VERSION, engine, file_digest(midi_path),
+                plugin_fingerprint(vst_path), state, sample_rate, block_size)
+
+
+def export_cache_key(audio_key, video_path, manifest=None):
+    """Identifies a finished export: rendered audio + the video it was muxed onto + alignment."""
+    stat = os.stat(video_path)
+    manifest_part = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest() if manifest else "none"
+    return cache_key("export", RENDER_CACHE_VERSION, audio_key, stat.st_size, stat.st_mtime_ns, manifest_part)
+
+
+class RenderCache:
+    """
+    Content-addressed, size-bounded store for rendered audio and finished exports.
+
+    Entries are plain files in `cache_dir`; a SQLite index tracks their size
+    and last use so the least recently used ones are evicted once the total
+    exceeds `max_bytes`. The index also keeps hit/miss counters, which makes
+    the cache safe to share between export worker processes; within one
+    process, request threads take turns on its connection.
+    """
+
+    def __init__(self, cache_dir="render_cache", max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, "index.db"), timeout=30, check_same_thread=False)
+        # One connection serves every request thread, and their transactions must not interleave on it
+        self._lock = threading.Lock()
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used);
+            CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        """)
+
+    def get(self, key):
+        """Returns the cached file for `key` (marking it recently used), or None."""
+        with self._lock, self._db:
+            row = self._db.execute("SELECT filename FROM entries WHERE key = ?", (key,)).fetchone()
+            path = os.path.join(self.cache_dir, row[0]) if row else None
+            if path and os.path.exists(path):
+                self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._count("hits")
+                return path
+            if row:
+                # File vanished underneath us
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._count("misses")
+            return None
+
+    def put(self, key, src_path, ext, move=True):
+        """Adds a file to the cache (moved by default, hardlinked/copied otherwise) and returns its cached path."""
+        filename = f"{key}{ext}"
+        dest = os.path.join(self.cache_dir, filename)
+        if move:
+            shutil.move(src_path, dest)
+        else:
+            link_or_copy(src_path, dest)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, filename, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, filename, os.path.getsize(dest), time.time()),
+            )
+        self.evict()
+        return dest
+
+    def temp_path(self, ext):
+        return os.path.join(self.cache_dir, f"tmp_{os.getpid()}_{time.time_ns()}{ext}")
+
+    def evict(self):
+        with self._lock, self._db:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, filename, size in self._db.execute(
+                    "SELECT key, filename, size FROM entries ORDER BY last_used ASC").fetchall():
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, filename))
+                except FileNotFoundError:
+                    pass
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._count("evictions")
+                total -= size
+
+    def stats(self):
+        with self._lock, self._db:
+            counters = dict(self._db.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _count(self, name):
+        self._db.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+
+def link_or_copy(src, dest):
+    # Hardlinks make cache hits free when both paths are on the same filesystem
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
@@ -1,11 +1,17 @@
 import os
 import subprocess
+import tempfile
+import threading
 import logging
-from scipy.io import wavfile
 import numpy as np
+from .session_clock import load_manifest
+from .render_cache import audio_cache_key, export_cache_key, link_or_copy
+from .plugin_pool import PluginHostPool
+from .wav_writer import FloatWavWriter
+from .audio_blocks import (array_blocks, tone_blocks, video_alignment, aligned_blocks,
+                           float32_blocks)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Handlers are set up by the entry point (server main, export workers), not on import
 logger = logging.getLogger(__name__)
 
 # Try to import dawdreamer, fallback if not available
@@ -16,15 +22,222 @@ except ImportError:
     DAW_AVAILABLE = False
     logger.warning("DawDreamer not available. Offline rendering will be mocked.")
 
-def render_project(session_id: str, vst_path: str, record_dir: str = "recordings"):
+SAMPLE_RATE = 44100
+BUFFER_SIZE = 512
+
+# Loaded plugins stay resident between exports in this process
+plugin_pool = PluginHostPool(daw) if DAW_AVAILABLE else None
+
+class ExportCancelled(Exception):
+    pass
+
+def _read_progress(stdout, duration, on_progress):
+    for line in stdout:
+        key, _, value = line.decode(errors="replace").strip().partition("=")
+        if key == "out_time_us" and on_progress and duration > 0 and value.isdigit():
+            on_progress(min(int(value) / 1e6 / duration, 1.0))
+
+def run_ffmpeg(cmd, duration, on_progress=None, check_cancelled=None, log_path=None, stdin_blocks=None):
+    """
+    Runs an ffmpeg command that was given `-progress pipe:1`, reporting the
+    fraction of `duration` (seconds) written so far. If `stdin_blocks` is
+    given, each bytes-like block is written to ffmpeg's stdin as it is
+    produced. Kills ffmpeg if check_cancelled raises.
+    """
+    stderr = open(log_path, "ab+") if log_path else tempfile.TemporaryFile()
+    try:
+        proc = subprocess.Popen(cmd,
+                                stdin=subprocess.PIPE if stdin_blocks is not None else subprocess.DEVNULL,
+                                stdout=subprocess.PIPE, stderr=stderr)
+        # Progress is read on its own thread so a full stdout pipe never stalls our writes
+        reader = threading.Thread(target=_read_progress, args=(proc.stdout, duration, on_progress), daemon=True)
+        reader.start()
+        try:
+            if stdin_blocks is not None:
+                try:
+                    for block in stdin_blocks:
+                        if check_cancelled:
+                            check_cancelled()
+                        proc.stdin.write(block)
+                except BrokenPipeError:
+                    pass # ffmpeg exited early; its return code says why
+                finally:
+                    try:
+                        proc.stdin.close()
+                    except BrokenPipeError:
+                        pass
+            while True:
+                try:
+                    returncode = proc.wait(timeout=0.25)
+                    break
+                except subprocess.TimeoutExpired:
+                    if check_cancelled:
+                        check_cancelled()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            reader.join()
+
+        if returncode != 0:
+            stderr.seek(0, os.SEEK_END)
+            stderr.seek(max(stderr.tell() - 4096, 0))
+            logger.error(f"FFmpeg failed: {stderr.read().decode(errors='replace')}")
+            raise RuntimeError("Failed to merge video/audio with FFmpeg")
+    finally:
+        stderr.close()
+
+def pcm_bytes(blocks):
+    """Raw interleaved float32 PCM for ffmpeg's f32le demuxer, one block at a time."""
+    for block in blocks:
+        yield memoryview(block).cast("B")
+
+def mux_command(video_path, audio_args, aligned, output_video_path):
+    # ffmpeg -i video.mp4 -i audio.wav -c:v copy -c:a aac -map 0:v:0 -map 1:a:0 output.mp4
+    # We replace audio of original video
+    cmd = [
+        "ffmpeg",
+        "-y", # Overwrite
+        "-i", video_path,
+        *audio_args,
+        "-c:v", "copy", # Copy video stream without re-encoding
+        "-c:a", "aac",  # Encode audio to AAC
+        "-map", "0:v:0", # Use video from first input
+        "-map", "1:a:0", # Use audio from second input
+    ]
+    if not aligned:
+        # No manifest (older takes): fall back to ending at the shorter stream
+        cmd.append("-shortest")
+    # Machine-readable progress on stdout, diagnostics on stderr
+    cmd += ["-progress", "pipe:1", "-nostats", output_video_path]
+    return cmd
+
+def _export_hooks(session_id, progress, cancelled):
+    def report(phase, fraction):
+        if progress:
+            progress(phase, fraction)
+
+    def check_cancelled():
+        if cancelled and cancelled():
+            raise ExportCancelled(f"Export of {session_id} cancelled")
+
+    return report, check_cancelled
+
+def render_project(session_id: str, vst_path: str, record_dir: str = "recordings", catalog=None,
+                   progress=None, cancelled=None, log_path=None, cache=None, output_name=None,
+                   pipe_audio=True):
     """
     Renders a session's MIDI file through a VST plugin and merges it with the video.
     Returns the path to the final output video.
+
+    `progress(phase, fraction)` is called as the "render" and "mux" phases
+    advance, `cancelled()` is polled and raises ExportCancelled when it
+    returns True, and ffmpeg's own output is appended to `log_path` if given.
+    With a RenderCache, unchanged exports are served from the cache and
+    unchanged renders skip straight to the mux. By default the audio is
+    piped into ffmpeg as raw float32; `pipe_audio=False` goes through a
+    temporary WAV instead.
+    """
+    if not pipe_audio:
+        render = render_audio(session_id, vst_path, record_dir=record_dir, output_name=output_name,
+                              progress=progress, cancelled=cancelled, cache=cache)
+        return mux_audio(render, record_dir=record_dir, progress=progress, cancelled=cancelled,
+                         log_path=log_path, cache=cache, catalog=catalog)
+
+    report, check_cancelled = _export_hooks(session_id, progress, cancelled)
+    render, blocks = _render_aligned(session_id, vst_path, record_dir, output_name, report, check_cancelled, cache)
+    if blocks is not None:
+        cmd = mux_command(render["video_path"],
+                          ["-f", "f32le", "-ar", str(SAMPLE_RATE), "-ac", str(render["channels"]), "-i", "pipe:0"],
+                          render["aligned"], render["output_path"])
+
+        logger.info("Merging with FFmpeg (piped audio)...")
+        report("mux", 0.0)
+        _remove_output(render["output_path"])
+        try:
+            run_ffmpeg(cmd, render["duration"], lambda f: report("mux", f), check_cancelled, log_path,
+                       stdin_blocks=pcm_bytes(blocks))
+        except BaseException:
+            # Never leave a half-written export where a finished one is expected
+            _remove_output(render["output_path"])
+            raise
+        report("mux", 1.0)
+    else:
+        report("mux", 1.0)
+    return _finish_export(render, cache, catalog)
+
+def render_audio(session_id: str, vst_path: str, record_dir: str = "recordings", output_name=None,
+                 progress=None, cancelled=None, cache=None):
+    """
+    First half of a file-based export: renders the MIDI (or takes it from
+    the cache), aligns it to the video and writes it to a temp WAV for
+    mux_audio(). Returns a picklable dict describing the pending mux; its
+    "output" is already set if the finished export came straight from the cache.
     """
+    report, check_cancelled = _export_hooks(session_id, progress, cancelled)
+    render, blocks = _render_aligned(session_id, vst_path, record_dir, output_name, report, check_cancelled, cache)
+    if blocks is not None:
+        # 8. Save Audio
+        writer = FloatWavWriter(render["audio_path"], render["channels"], SAMPLE_RATE)
+        try:
+            for block in blocks:
+                check_cancelled()
+                writer.write(block)
+        except BaseException:
+            writer.close()
+            # A cancelled or failed render leaves nothing for mux_audio, so nothing to keep
+            os.remove(render["audio_path"])
+            raise
+        writer.close()
+        logger.info(f"Audio rendered to {render['audio_path']}")
+    return render
+
+def mux_audio(render, record_dir: str = "recordings", progress=None, cancelled=None, log_path=None,
+              cache=None, catalog=None):
+    """
+    Second half of a file-based export: merges the WAV from render_audio()
+    onto the session video with ffmpeg. Returns the output filename.
+    """
+    report, check_cancelled = _export_hooks(render["session_id"], progress, cancelled)
+
+    if render["output"]:
+        # Served from the export cache, nothing left to do
+        report("mux", 1.0)
+        return _finish_export(render, cache, catalog)
+
+    # 9. Merge with Video using FFmpeg
+    temp_audio_path = render["audio_path"]
+    cmd = mux_command(render["video_path"], ["-i", temp_audio_path], render["aligned"], render["output_path"])
+
+    logger.info("Merging with FFmpeg...")
+    report("mux", 0.0)
+    _remove_output(render["output_path"])
+    try:
+        run_ffmpeg(cmd, render["duration"], lambda f: report("mux", f), check_cancelled, log_path)
+    except BaseException:
+        # Never leave a half-written export where a finished one is expected
+        _remove_output(render["output_path"])
+        raise
+    finally:
+        # Cleanup temp audio
+        if os.path.exists(temp_audio_path):
+            os.remove(temp_audio_path)
+    report("mux", 1.0)
+    return _finish_export(render, cache, catalog)
+
+def _render_aligned(session_id, vst_path, record_dir, output_name, report, check_cancelled, cache):
+    """
+    Sets up the session's audio as a stream of float32 blocks, aligned to
+    the video. Returns (render, blocks); blocks is None when the finished
+    export was served from the cache. Everything after the engine (cache
+    write, alignment, encoder feed) holds one block at a time.
+    """
+    output_name = output_name or f"{session_id}_final_export.mp4"
     midi_path = os.path.join(record_dir, f"{session_id}_midi.mid")
     video_path = os.path.join(record_dir, f"{session_id}_video.mp4")
-    temp_audio_path = os.path.join(record_dir, f"{session_id}_export_temp.wav")
-    output_video_path = os.path.join(record_dir, f"{session_id}_final_export.mp4")
+    temp_audio_path = os.path.join(record_dir, f"{os.path.splitext(output_name)[0]}_temp.wav")
+    output_video_path = os.path.join(record_dir, output_name)
 
     # 1. Validation
     if not os.path.exists(midi_path):
@@ -36,78 +249,127 @@ def render_project(session_id: str, vst_path: str, record_dir: str = "recordings
 
     logger.info(f"Starting render for Session: {session_id}")
     logger.info(f"VST Path: {vst_path}")
+    report("render", 0.0)
+
+    render = {
+        "session_id": session_id,
+        "vst_path": vst_path,
+        "video_path": video_path,
+        "audio_path": temp_audio_path,
+        "output_path": output_video_path,
+        "output": None,
+        "aligned": False,
+        "duration": 0.0,
+        "channels": 1,
+        "export_key": None,
+    }
+
+    manifest = load_manifest(session_id, record_dir)
+    audio_key = cached_audio = None
+    if cache:
+        audio_key = audio_cache_key(midi_path, vst_path, SAMPLE_RATE, BUFFER_SIZE,
+                                    engine="dawdreamer" if DAW_AVAILABLE else "dummy")
+        render["export_key"] = export_cache_key(audio_key, video_path, manifest)
+        cached_export = cache.get(render["export_key"])
+        if cached_export:
+            logger.info("Export cache hit, reusing finished file")
+            link_or_copy(cached_export, output_video_path)
+            report("render", 1.0)
+            render["output"] = output_name
+            return render, None
+        cached_audio = cache.get(audio_key)
 
-    if not DAW_AVAILABLE:
+    if cached_audio:
+        from scipy.io import wavfile
+
+        logger.info("Render cache hit, skipping straight to the mux")
+        # Memory-mapped, so blocks are paged in from disk as they are consumed
+        _, audio = wavfile.read(cached_audio, mmap=True)
+        frames, frame_shape = len(audio), audio.shape[1:]
+        source = array_blocks(audio)
+    elif not DAW_AVAILABLE:
         # Create silent/dummy audio if dawdreamer is missing
         logger.warning("Rendering with DUMMY audio (DawDreamer missing)")
         duration = 5 # Mock duration
-        SAMPLE_RATE = 44100
-        # Generate 5 seconds of silence or simple tone
-        t = np.linspace(0, duration, int(SAMPLE_RATE * duration))
-        audio = np.sin(2 * np.pi * 440 * t) * 0.1 # A440 tone
-        wavfile.write(temp_audio_path, SAMPLE_RATE, audio.astype(np.float32))
+        # 5 seconds of A440 tone, generated a block at a time
+        frames, frame_shape = int(SAMPLE_RATE * duration), ()
+        source = tone_blocks(duration, SAMPLE_RATE)
     else:
-        # 2. Initialize DawDreamer
-        SAMPLE_RATE = 44100
-        BUFFER_SIZE = 512
-        engine = daw.RenderEngine(sample_rate=SAMPLE_RATE, block_size=BUFFER_SIZE)
+        # 2-3. Check out a warm engine with the VST already loaded (loads it on first use)
+        with plugin_pool.acquire(vst_path, SAMPLE_RATE, BUFFER_SIZE) as (engine, synth):
+            # 4. Load MIDI
+            try:
+                engine.load_midi(midi_path, clear_previous=True, map_to_processor="synth")
+            except Exception as e:
+                logger.error(f"Failed to load MIDI: {e}")
+                raise
 
-        # 3. Load VST
-        try:
-            synth = engine.make_plugin_processor("synth", vst_path)
-        except Exception as e:
-            logger.error(f"Failed to load VST: {e}")
-            raise RuntimeError(f"Could not load VST plugin at {vst_path}. Ensure it is a valid VST3/AU/VST2.")
+            # 5. Connect to Graph
+            engine.load_graph([(synth, [])])
 
-        # 4. Load MIDI
-        try:
-            engine.load_midi(midi_path, clear_previous=True, map_to_processor="synth") 
-        except Exception as e:
-            logger.error(f"Failed to load MIDI: {e}")
-            raise
+            # 6. Render
+            import mido
+            mid = mido.MidiFile(midi_path)
+            duration = mid.length
 
-        # 5. Connect to Graph
-        engine.load_graph([(synth, [])])
+            logger.info(f"Rendering {duration} seconds...")
+            # DawDreamer can only render a graph from time zero in one call, so the
+            # engine's own output buffer is the one full-length copy we keep
+            engine.render(duration + 1.0) # Add 1s tail
+            audio = engine.get_audio()
+        frames, frame_shape = audio.shape[1], (audio.shape[0],)
+        # Channels-first from the engine; the transposed blocks are views, copied one at a time below
+        source = array_blocks(audio.T)
 
-        # 6. Render
-        import mido
-        mid = mido.MidiFile(midi_path)
-        duration = mid.length
-        
-        logger.info(f"Rendering {duration} seconds...")
-        engine.render(duration + 1.0) # Add 1s tail
-        audio = engine.get_audio()
+    check_cancelled()
+    report("render", 1.0)
+    render["channels"] = frame_shape[0] if frame_shape else 1
+    blocks = float32_blocks(source)
 
-        # 7. Save Audio
-        wavfile.write(temp_audio_path, SAMPLE_RATE, audio.transpose())
-        logger.info(f"Audio rendered to {temp_audio_path}")
+    if cache and not cached_audio:
+        # Keep the unaligned render so a different alignment or video can reuse it
+        blocks = _cache_blocks(blocks, cache, audio_key, render["channels"])
 
-    # 8. Merge with Video using FFmpeg
-    # ffmpeg -i video.mp4 -i audio.wav -c:v copy -c:a aac -map 0:v:0 -map 1:a:0 output.mp4
-    # We replace audio of original video
-    cmd = [
-        "ffmpeg",
-        "-y", # Overwrite
-        "-i", video_path,
-        "-i", temp_audio_path,
-        "-c:v", "copy", # Copy video stream without re-encoding
-        "-c:a", "aac",  # Encode audio to AAC
-        "-map", "0:v:0", # Use video from first input
-        "-map", "1:a:0", # Use audio from second input
-        "-shortest",    # End when shortest stream ends
-        output_video_path
-    ]
-    
-    logger.info("Merging with FFmpeg...")
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    
-    if result.returncode != 0:
-        logger.error(f"FFmpeg failed: {result.stderr.decode()}")
-        raise RuntimeError("Failed to merge video/audio with FFmpeg")
-
-    # Cleanup temp audio
-    if os.path.exists(temp_audio_path):
-        os.remove(temp_audio_path)
+    # 7. Align to the video using the session's sync manifest
+    alignment = video_alignment(manifest, SAMPLE_RATE)
+    if alignment is not None:
+        logger.info("Aligning audio to video using sync manifest")
+        start, frames = alignment
+        blocks = aligned_blocks(blocks, start, frames, frame_shape)
+        render["aligned"] = True
+
+    render["duration"] = frames / SAMPLE_RATE
+    return render, blocks
+
+def _cache_blocks(blocks, cache, key, channels):
+    """Passes blocks through while writing them to a cache entry, stored once the stream completes."""
+    tmp = cache.temp_path(".wav")
+    writer = FloatWavWriter(tmp, channels, SAMPLE_RATE)
+    complete = False
+    try:
+        for block in blocks:
+            writer.write(block)
+            yield block
+        complete = True
+    finally:
+        writer.close()
+        if complete:
+            cache.put(key, tmp, ".wav")
+        elif os.path.exists(tmp):
+            os.remove(tmp)
+
+def _remove_output(output_video_path):
+    # The previous export may be a hardlink into the cache; never truncate it in place
+    if os.path.exists(output_video_path):
+        os.remove(output_video_path)
+
+def _finish_export(render, cache, catalog):
+    output_video_path = render["output_path"]
+    if cache and render["export_key"] and not render["output"]:
+        cache.put(render["export_key"], output_video_path, ".mp4", move=False)
+
+    if catalog:
+        catalog.add_file(output_video_path)
 
     logger.info(f"Export Success: {output_video_path}")
     return os.path.basename(output_video_path)
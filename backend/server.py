@@ -1,15 +1,32 @@
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, Request, Response, WebSocket
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+import asyncio
+import logging
 import os
-import glob
+import threading
 import uvicorn
 import json
+from .lazy import LazyModule
+from . import lazy
 from .recorder import MultiTrackRecorder
+from .audio_capture import SAMPLE_FORMATS
+from .video_encoders import VIDEO_ENCODERS, X264_PRESETS, encoder_settings
+from .catalog import SessionCatalog
+from .devices import DeviceRegistry
+from .live_feed import LiveFeed
+from .peaks import PeakFile, ensure_peaks
+from .thumbnails import ensure_thumbnails, thumbnails_dir, thumbnails_in_range
+from .midi_notes import NoteTableCache
+from . import metrics
+
+np = LazyModule("numpy")
 
 CONFIG_FILE = "config.json"
+CATALOG_FILE = "catalog.db"
 
 def load_config():
     if os.path.exists(CONFIG_FILE):
@@ -33,6 +50,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Total-Count", "X-Preview-Start", "X-Preview-End"],
 )
 
 # Mount recordings directory
@@ -40,84 +58,223 @@ if not os.path.exists("recordings"):
     os.makedirs("recordings")
 app.mount("/files", StaticFiles(directory="recordings"), name="recordings")
 
-recorder = MultiTrackRecorder()
+# Session index; the startup handler picks up anything that changed on disk while the server was down
+catalog = SessionCatalog(CATALOG_FILE, record_dir="recordings")
+
+live_feed = LiveFeed()
+recorder = MultiTrackRecorder(catalog=catalog, live_feed=live_feed)
+
+# Parsed MIDI note tables, reparsed only when a file changes
+note_tables = NoteTableCache()
+
+# Device lists are scanned in the background (on hotplug or a timer) and served from memory
+device_registry = DeviceRegistry(is_busy=lambda: recorder.is_recording)
+warmup_errors = {}
+
+def warm_up():
+    # Capture and analysis libraries load here, off the request path, once the server is already answering
+    for subsystem in ("analysis", "capture"):
+        warmup_errors.update(lazy.warm(subsystem))
+
+# Render workers are spawned processes that re-import this module as __mp_main__, so anything beyond
+# constructing lazy objects belongs in startup, which only the serving process runs
+@app.on_event("startup")
+def start_background_work():
+    catalog.reconcile()
+    device_registry.start()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
 
 class StartRecordRequest(BaseModel):
     video_device_index: Optional[int] = None
     audio_device_index: Optional[int] = None
+    audio_device_indices: Optional[List[int]] = None # Several interfaces at once; overrides audio_device_index
+    audio_format: Optional[str] = None # "int16", "int24" or "float32"
     midi_port_name: Optional[str] = None
 
 class ConfigRequest(BaseModel):
     video_device_index: Optional[str] = None # Using str to match frontend state, or int? Frontend sends strings for Select. Let's use str and cast.
     audio_device_index: Optional[str] = None
     midi_port_name: Optional[str] = None
+    video_encoder: Optional[str] = None # "ffmpeg" (libx264) or "opencv" (mp4v)
+    video_preset: Optional[str] = None
+    video_crf: Optional[int] = None
+    video_threads: Optional[int] = None
+    video_lossless: Optional[bool] = None
+
+def not_modified(request: Request, response: Response, etag: str):
+    """Sets the ETag and reports whether the client's cached copy is still current."""
+    response.headers["ETag"] = etag
+    return request.headers.get("if-none-match") == etag
 
 @app.get("/recordings/latest")
-def get_latest_recording():
-    try:
-        files = glob.glob("recordings/*")
-        if not files:
-            return {"video": None, "audio": None, "midi": None}
-            
-        latest_file = max(files, key=os.path.getctime)
-        basename = os.path.basename(latest_file)
-        parts = basename.split('_')
-        if len(parts) >= 3:
-            session_id = f"{parts[0]}_{parts[1]}_{parts[2]}"
-        else:
-            return {"video": None, "audio": None, "midi": None}
-
-        midi_path = f"recordings/{session_id}_midi.mid"
-        midi_url = f"http://localhost:8000/files/{session_id}_midi.mid" if os.path.exists(midi_path) else None
-
-        return {
-            "video": f"http://localhost:8000/files/{session_id}_video.mp4",
-            "audio": f"http://localhost:8000/files/{session_id}_audio.wav",
-            "midi": midi_url
-        }
-    except Exception as e:
-        print(f"Error getting latest: {e}")
+def get_latest_recording(request: Request, response: Response):
+    etag = f'W/"latest-{catalog.version}"'
+    if not_modified(request, response, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    session = catalog.latest()
+    if not session:
         return {"video": None, "audio": None, "midi": None}
 
+    def url(column):
+        return f"http://localhost:8000/files/{session[column]}" if session[column] else None
+
+    return {
+        "video": url("video"),
+        "audio": url("audio"),
+        "midi": url("midi")
+    }
+
 @app.get("/recordings/list")
-def list_recordings():
+def list_recordings(request: Request, response: Response, offset: int = 0, limit: Optional[int] = None,
+                    sort: str = "timestamp", order: str = "desc"):
+    etag = f'W/"list-{catalog.version}-{offset}-{limit}-{sort}-{order}"'
+    if not_modified(request, response, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    total, sessions = catalog.list_sessions(offset=max(offset, 0), limit=limit, sort=sort,
+                                            descending=(order != "asc"))
+    response.headers["X-Total-Count"] = str(total)
+    return [
+        {
+            "id": session["id"],
+            "name": session["video"],
+            "size": f"{session['video_size'] / (1024*1024):.1f} MB",
+            "timestamp": session["video_mtime"]
+        }
+        for session in sessions
+    ]
+
+@app.get("/recordings/{session_id}/peaks")
+def get_peaks(session_id: str, request: Request, response: Response, start: float = 0.0,
+              end: Optional[float] = None, width: int = 1000, samples_per_bin: Optional[int] = None):
+    """
+    Waveform min/max bins for the window [start, end) in seconds. Without
+    `samples_per_bin` the coarsest level that still gives `width` bins is used.
+    """
+    if catalog.get(session_id) is None:
+        return JSONResponse({"status": "error", "message": "Unknown session"}, status_code=404)
+    path = ensure_peaks(session_id, catalog.record_dir)
+    if path is None:
+        return JSONResponse({"status": "error", "message": "Session has no audio"}, status_code=404)
+
+    peaks = PeakFile(path)
+    start_frame = max(int(start * peaks.sample_rate), 0)
+    end_frame = int(end * peaks.sample_rate) if end is not None else peaks.frames
+    if samples_per_bin is None:
+        samples_per_bin = peaks.pick_level(start_frame, end_frame, max(width, 1))
+    elif samples_per_bin not in peaks.levels:
+        return JSONResponse({"status": "error", "message": f"samples_per_bin must be one of {sorted(peaks.levels)}"},
+                            status_code=400)
+
+    etag = f'W/"peaks-{os.path.getmtime(path)}-{start_frame}-{end_frame}-{samples_per_bin}"'
+    if not_modified(request, response, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    first_bin, mins, maxs = peaks.query(start_frame, end_frame, samples_per_bin)
+    return {
+        "sample_rate": peaks.sample_rate,
+        "channels": peaks.channels,
+        "frames": peaks.frames,
+        "samples_per_bin": samples_per_bin,
+        "start": first_bin * samples_per_bin / peaks.sample_rate,
+        "min": np.round(mins, 4).tolist(),
+        "max": np.round(maxs, 4).tolist(),
+    }
+
+@app.get("/recordings/{session_id}/thumbnails")
+def get_thumbnails(session_id: str, start: float = 0.0, end: Optional[float] = None, count: int = 8):
+    """
+    Sprite-sheet tiles covering [start, end) in seconds, from the coarsest
+    density that still gives `count` thumbnails. Sheets are plain files under /files.
+    """
+    if catalog.get(session_id) is None:
+        return JSONResponse({"status": "error", "message": "Unknown session"}, status_code=404)
     try:
-        # List sessions (using video files as the anchor)
-        files = glob.glob("recordings/*_video.mp4")
-        recordings = []
-        for f in files:
-            stat = os.stat(f)
-            # Extract session ID from filename: session_YYYYMMDD_HHMMSS_video.mp4
-            basename = os.path.basename(f)
-            session_id = basename.replace("_video.mp4", "")
-            
-            recordings.append({
-                "id": session_id,
-                "name": basename,
-                "size": f"{stat.st_size / (1024*1024):.1f} MB",
-                "timestamp": stat.st_mtime
-            })
-        
-        # Sort by timestamp descending (newest first)
-        recordings.sort(key=lambda x: x["timestamp"], reverse=True)
-        return recordings
-    except Exception as e:
-        print(f"Error listing recordings: {e}")
-        return []
+        index = ensure_thumbnails(session_id, catalog.record_dir)
+    except RuntimeError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+    if index is None:
+        return JSONResponse({"status": "error", "message": "Session has no video"}, status_code=404)
+
+    density, tiles = thumbnails_in_range(index, max(start, 0.0), index["duration"] if end is None else end,
+                                         max(count, 1))
+    base = f"http://localhost:8000/files/{os.path.basename(thumbnails_dir(catalog.record_dir, session_id))}"
+    # The version query keeps browsers from showing sheets from before a rebuild
+    version = int(index["video_mtime"])
+    for tile in tiles:
+        tile["sheet"] = f"{base}/{tile['sheet']}?v={version}"
+    return {
+        "duration": index["duration"],
+        "interval": density["interval"],
+        "thumb_width": index["thumb_width"],
+        "thumb_height": index["thumb_height"],
+        "tiles": tiles,
+    }
+
+@app.get("/recordings/{session_id}/notes")
+def get_notes(session_id: str, request: Request, response: Response, start: float = 0.0,
+              end: Optional[float] = None, sustain: bool = True):
+    """Columnar notes sounding in [start, end) seconds; `sustain` applies the sustain pedal to note ends."""
+    session = catalog.get(session_id)
+    if session is None or not session["midi"]:
+        return JSONResponse({"status": "error", "message": "Session has no MIDI"}, status_code=404)
+    path = os.path.join(catalog.record_dir, session["midi"])
+
+    try:
+        etag = f'W/"notes-{os.stat(path).st_mtime_ns}-{start}-{end}-{sustain}"'
+        if not_modified(request, response, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        table = note_tables.get(path)
+    except FileNotFoundError:
+        # The catalog row outlived the file
+        return JSONResponse({"status": "error", "message": "Session has no MIDI"}, status_code=404)
+    idx = table.query(start, table.duration if end is None else end, sustain=sustain)
+    ends = table.end if sustain else table.release
+    return {
+        "duration": table.duration,
+        "count": len(idx),
+        "start": np.round(table.start[idx], 4).tolist(),
+        "end": np.round(ends[idx], 4).tolist(),
+        "pitch": table.pitch[idx].tolist(),
+        "velocity": table.velocity[idx].tolist(),
+        "channel": table.channel[idx].tolist(),
+    }
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
+@app.get("/ready")
+def readiness():
+    # /health only says the server is up; this says whether recording will start without a cold import
+    subsystems = lazy.status()
+    subsystems["devices"] = {"warm": device_registry.ready}
+    ready = all(subsystems[name]["warm"] for name in ("analysis", "capture", "devices"))
+    body = {"ready": ready, "subsystems": subsystems, "errors": warmup_errors}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+def get_metrics():
+    # Prometheus text format; per-take summaries are saved as {session_id}_metrics.json
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/record/start")
 def start_recording(req: StartRecordRequest, background_tasks: BackgroundTasks):
     if recorder.is_recording:
         return {"status": "error", "message": "Already recording"}
+    if req.audio_format is not None:
+        if req.audio_format not in SAMPLE_FORMATS:
+            return {"status": "error", "message": f"Unknown audio format: {req.audio_format}"}
+        recorder.audio_format = req.audio_format
+    recorder.video_encoder = encoder_settings(load_config())
     
     # Start recording in background (though the recorder spawns threads anyway)
     recorder.start_recording(
         video_device_index=req.video_device_index,
         audio_device_index=req.audio_device_index,
-        midi_port_name=req.midi_port_name
+        midi_port_name=req.midi_port_name,
+        audio_device_indices=req.audio_device_indices,
     )
     return {"status": "started"}
 
@@ -127,15 +284,37 @@ def stop_recording():
         return {"status": "error", "message": "Not recording"}
     
     session_id = recorder.stop_recording()
-    return {"status": "stopped", "session_id": session_id}
+    return {"status": "stopped", "session_id": session_id, "video_stats": recorder.video_stats}
+
+@app.websocket("/ws/live")
+async def live_updates(websocket: WebSocket):
+    # Meter frames (~30 Hz), MIDI activity and record start/stop while a take is running
+    await websocket.accept()
+    updates = live_feed.subscribe()
+    await websocket.send_json({"type": "status", "recording": recorder.is_recording,
+                               "session_id": getattr(recorder, "session_id", None)})
+
+    async def forward():
+        while True:
+            await websocket.send_text(await updates.get())
+
+    sender = asyncio.create_task(forward())
+    try:
+        # Viewers never send anything; reading just notices when they go away
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
+        live_feed.unsubscribe(updates)
 
 @app.get("/ports")
 def get_ports():
-    return {
-        "audio_devices": recorder.get_audio_devices(),
-        "midi_ports": recorder.get_midi_ports(),
-        "video_devices": recorder.get_video_devices()
-    }
+    return device_registry.snapshot()
+
+@app.post("/ports/refresh")
+def refresh_ports():
+    device_registry.request_refresh()
+    return {"status": "refreshing"}
 
 @app.get("/config")
 def get_config():
@@ -151,34 +330,192 @@ def update_config(cfg: ConfigRequest):
         current["audioDeviceIndex"] = cfg.audio_device_index
     if cfg.midi_port_name is not None:
         current["midiPortName"] = cfg.midi_port_name
+    if cfg.video_encoder is not None:
+        if cfg.video_encoder not in VIDEO_ENCODERS:
+            return {"status": "error", "message": f"Unknown video encoder: {cfg.video_encoder}"}
+        current["videoEncoder"] = cfg.video_encoder
+    if cfg.video_preset is not None:
+        if cfg.video_preset not in X264_PRESETS:
+            return {"status": "error", "message": f"Unknown x264 preset: {cfg.video_preset}"}
+        current["videoPreset"] = cfg.video_preset
+    if cfg.video_crf is not None:
+        if not 0 <= cfg.video_crf <= 51:
+            return {"status": "error", "message": "CRF must be between 0 and 51"}
+        current["videoCrf"] = cfg.video_crf
+    if cfg.video_threads is not None:
+        current["videoThreads"] = max(cfg.video_threads, 0)
+    if cfg.video_lossless is not None:
+        current["videoLossless"] = cfg.video_lossless
     
     save_config(current)
     return {"status": "saved", "config": current}
 
-from .renderer import render_project
+from .jobs import ExportJobManager
+from .render_cache import RenderCache
+from .workers import RenderWorkers
+
+RENDER_CACHE_CONFIG = {"cache_dir": "render_cache", "max_bytes": 2 * 1024 ** 3}
+render_cache = RenderCache(**RENDER_CACHE_CONFIG)
+
+# Exports and batch renders share one process pool, so a long render never ties up a request worker and
+# the number of loaded plugin hosts (and their memory) has a single limit. It uses every core unless
+# DAW_RENDER_WORKERS says otherwise; the plugin memory budget is split between however many there are.
+RENDER_WORKERS = int(os.environ.get("DAW_RENDER_WORKERS", "0")) or os.cpu_count() or 1
+render_workers = RenderWorkers(max_workers=RENDER_WORKERS, plugin_max_bytes=4 * 1024 ** 3)
+export_jobs = ExportJobManager(
+    record_dir="recordings",
+    workers=render_workers,
+    on_done=lambda job: catalog.add_file(os.path.join("recordings", job.output)),
+    cache_config=RENDER_CACHE_CONFIG,
+)
+metrics.REGISTRY.gauge("export_jobs_pending", "Exports queued or running",
+                       fn=lambda: sum(1 for job in list(export_jobs.jobs.values()) if not job.is_finished))
 
 class ExportRequest(BaseModel):
     session_id: str
     vst_path: str
 
+def job_response(job):
+    data = job.to_dict()
+    data["url"] = f"http://localhost:8000/files/{job.output}" if job.output else None
+    return data
+
 @app.post("/export")
-def export_session(req: ExportRequest, background_tasks: BackgroundTasks):
+def export_session(req: ExportRequest):
     # Verify session exists (simple check)
     if not os.path.exists(f"recordings/{req.session_id}_midi.mid"):
         return {"status": "error", "message": "Session MIDI not found"}
-        
-    # Run export (blocking for now for simplicity, or background?)
-    # Prompt suggestion: "Processing..." status or block.
-    # Let's block for now as it's easier to handle "success" in frontend without polling.
-    # But rendering takes 5-10s.
-    
+
     try:
-        output_filename = render_project(req.session_id, req.vst_path)
-        output_url = f"http://localhost:8000/files/{output_filename}"
-        return {"status": "done", "url": output_url}
+        job = export_jobs.submit(req.session_id, req.vst_path)
     except Exception as e:
         print(f"Export failed: {e}")
         return {"status": "error", "message": str(e)}
+    return {"status": "queued", "job_id": job.id}
+
+@app.get("/export/jobs")
+def list_export_jobs():
+    export_jobs.prune()
+    return [job_response(job) for job in export_jobs.jobs.values()]
+
+@app.get("/export/jobs/{job_id}")
+def get_export_job(job_id: str):
+    job = export_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"status": "error", "message": "Unknown job"}, status_code=404)
+    return job_response(job)
+
+@app.get("/export/jobs/{job_id}/events")
+def stream_export_job(job_id: str):
+    job = export_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"status": "error", "message": "Unknown job"}, status_code=404)
+
+    async def events():
+        # Server-Sent Events: one message per state change, ending once the job is finished
+        while True:
+            version = job.version
+            yield f"data: {json.dumps(job_response(job))}\n\n"
+            if job.is_finished:
+                return
+            while await export_jobs.wait_for_change(job, version) == version:
+                # Nothing new within the wait window; keep the connection alive
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.post("/export/jobs/{job_id}/cancel")
+def cancel_export_job(job_id: str):
+    job = export_jobs.cancel(job_id)
+    if job is None:
+        return JSONResponse({"status": "error", "message": "Unknown job"}, status_code=404)
+    return job_response(job)
+
+@app.get("/export/jobs/{job_id}/log")
+def get_export_job_log(job_id: str):
+    log = export_jobs.read_log(job_id)
+    if log is None:
+        return JSONResponse({"status": "error", "message": "No log for job"}, status_code=404)
+    return PlainTextResponse(log)
+
+from .batch import BatchExportManager
+
+# Batches draw on the same workers as single exports; each batch can ask for fewer slots. Their outputs
+# are named per plugin, which the catalog has no column for, so they are only served from /files.
+batch_exports = BatchExportManager(record_dir="recordings", cache_config=RENDER_CACHE_CONFIG, workers=render_workers)
+
+class BatchExportRequest(BaseModel):
+    session_ids: List[str]
+    vst_paths: List[str]
+    concurrency: Optional[int] = None
+
+@app.post("/export/batch")
+def export_batch(req: BatchExportRequest):
+    missing = [s for s in req.session_ids if not os.path.exists(f"recordings/{s}_midi.mid")]
+    if missing:
+        return {"status": "error", "message": f"Session MIDI not found: {', '.join(missing)}"}
+    try:
+        batch = batch_exports.submit(req.session_ids, req.vst_paths, req.concurrency)
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+    return {"status": "queued", "batch_id": batch.id, "total": len(batch.items),
+            "concurrency": batch.concurrency}
+
+@app.get("/export/batch/{batch_id}")
+def get_export_batch(batch_id: str):
+    batch = batch_exports.get(batch_id)
+    if batch is None:
+        return JSONResponse({"status": "error", "message": "Unknown batch"}, status_code=404)
+    return batch.to_dict()
+
+@app.post("/export/batch/{batch_id}/cancel")
+def cancel_export_batch(batch_id: str):
+    batch = batch_exports.cancel(batch_id)
+    if batch is None:
+        return JSONResponse({"status": "error", "message": "Unknown batch"}, status_code=404)
+    return batch.to_dict()
+
+from .preview import PreviewRenderer
+
+# Scrub previews get their own cache so they never push full renders out of the export cache
+preview_renderer = PreviewRenderer(record_dir="recordings",
+                                   cache=RenderCache(cache_dir="render_cache/previews", max_bytes=256 * 1024 ** 2))
+
+@app.get("/recordings/{session_id}/preview")
+def get_preview(session_id: str, vst_path: str, t0: float, t1: float, request: Request):
+    """
+    AAC audio of [t0, t1) seconds rendered with the plugin, for scrubbing.
+    The window is widened to a half-second grid; the X-Preview-Start/End
+    headers say which stretch the audio actually covers.
+    """
+    try:
+        preview = preview_renderer.get(session_id, vst_path, t0, t1)
+    except FileNotFoundError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=404)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    except Exception as e:
+        print(f"Preview failed: {e}")
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+    headers = {"ETag": f'"{preview["key"]}"', "X-Preview-Start": f"{preview['start']:g}",
+               "X-Preview-End": f"{preview['end']:g}"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(preview["path"], media_type="audio/mp4", headers=headers)
+
+@app.get("/export/cache")
+def get_render_cache_stats():
+    return render_cache.stats()
+
+@app.on_event("shutdown")
+def shutdown_export_jobs():
+    export_jobs.shutdown()
+    batch_exports.shutdown()
+    render_workers.shutdown()
+    preview_renderer.shutdown()
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("DAW_BACKEND_PORT", "8000")))
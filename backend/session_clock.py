@@ -0,0 +1,82 @@
+import json
+import os
+import threading
+import time
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(record_dir, session_id):
+    return os.path.join(record_dir, f"{session_id}_manifest.json")
+
+
+def load_manifest(session_id, record_dir="recordings"):
+    """Returns the sync manifest for a session, or None for takes recorded before manifests existed."""
+    path = manifest_path(record_dir, session_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class SessionClock:
+    """
+    Single monotonic time base shared by every capture thread of a take.
+
+    Threads stamp their data with SessionClock.now_ns() and report the time
+    of their first sample/frame/event via mark_first(); the offsets relative
+    to the session start are what the renderer needs to line tracks up.
+    """
+
+    def __init__(self):
+        self.start_ns = None
+        self.wall_start = None
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def now_ns():
+        return time.perf_counter_ns()
+
+    def start(self):
+        with self._lock:
+            self._streams = {}
+        self.wall_start = time.time()
+        self.start_ns = self.now_ns()
+        return self.start_ns
+
+    def seconds(self, timestamp_ns):
+        return (timestamp_ns - self.start_ns) / 1e9
+
+    def mark_first(self, stream, timestamp_ns, **info):
+        """Records the first-sample time of a stream; later calls for the same stream are ignored."""
+        with self._lock:
+            if stream in self._streams:
+                return
+            self._streams[stream] = dict(info, offset_seconds=self.seconds(timestamp_ns))
+
+    def update(self, stream, **info):
+        with self._lock:
+            self._streams.setdefault(stream, {}).update(info)
+
+    def offset(self, stream):
+        with self._lock:
+            entry = self._streams.get(stream)
+            return entry.get("offset_seconds") if entry else None
+
+    def write_manifest(self, record_dir, session_id):
+        with self._lock:
+            streams = {name: dict(info) for name, info in self._streams.items()}
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "session_id": session_id,
+            "clock": "perf_counter_ns",
+            "wall_start": self.wall_start,
+            "streams": streams,
+        }
+        path = manifest_path(record_dir, session_id)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_path, path)
+        return path
@@ -0,0 +1,247 @@
+import json
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
+
+from .keyed_locks import KeyedLocks
+from .lazy import LazyModule
+from .session_clock import load_manifest
+
+np = LazyModule("numpy")
+
+THUMB_WIDTH = 160
+THUMB_HEIGHT = 90
+SHEET_COLUMNS = 10
+SHEET_ROWS = 10
+# Seconds of video per thumbnail, one sprite set per density
+THUMB_INTERVALS = (1, 5, 30)
+INDEX_VERSION = 1
+
+_build_locks = KeyedLocks()
+
+
+def thumbnails_dir(record_dir, session_id):
+    return os.path.join(record_dir, f"{session_id}_thumbs")
+
+
+def load_index(record_dir, session_id):
+    try:
+        with open(os.path.join(thumbnails_dir(record_dir, session_id), "index.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_pts(stderr, timestamps, info):
+    # showinfo logs every frame it passes, before the frame reaches the output
+    for line in stderr:
+        match = re.search(r"Parsed_showinfo.*\bpts_time:\s*(-?[\d.]+)", line)
+        if match:
+            timestamps.put(float(match.group(1)))
+            continue
+        match = re.search(r"Duration: (\d+):(\d+):([\d.]+)", line)
+        if match and "duration" not in info:
+            h, m, sec = match.groups()
+            info["duration"] = int(h) * 3600 + int(m) * 60 + float(sec)
+    timestamps.put(None)
+
+
+def keyframes(video_path, info=None):
+    """
+    Yields (seconds, frame) for every keyframe of the video, scaled and
+    letterboxed to THUMB_WIDTH x THUMB_HEIGHT BGR. Only keyframes are
+    decoded (`-skip_frame nokey`), so the cost follows the GOP count rather
+    than the frame count. The container duration is stored in `info`.
+    """
+    vf = (f"showinfo,scale={THUMB_WIDTH}:{THUMB_HEIGHT}:force_original_aspect_ratio=decrease,"
+          f"pad={THUMB_WIDTH}:{THUMB_HEIGHT}:(ow-iw)/2:(oh-ih)/2")
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats",
+        "-skip_frame", "nokey", "-i", video_path,
+        "-an", "-vf", vf, "-vsync", "passthrough",
+        "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1",
+    ]
+    try:
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, text=False)
+    except OSError as e:
+        # Usually ffmpeg missing from PATH; callers only expect RuntimeError
+        raise RuntimeError(f"Could not run ffmpeg: {e}")
+    timestamps = queue.Queue()
+    reader = threading.Thread(target=_read_pts,
+                              args=((line.decode(errors="replace") for line in process.stderr), timestamps,
+                                    {} if info is None else info),
+                              daemon=True)
+    reader.start()
+
+    frame_bytes = THUMB_WIDTH * THUMB_HEIGHT * 3
+    produced = 0
+    try:
+        while True:
+            data = process.stdout.read(frame_bytes)
+            if len(data) < frame_bytes:
+                break
+            seconds = timestamps.get()
+            if seconds is None:
+                break
+            produced += 1
+            yield seconds, np.frombuffer(data, dtype=np.uint8).reshape(THUMB_HEIGHT, THUMB_WIDTH, 3)
+    finally:
+        # Closing stdout also stops ffmpeg if the caller gave up early
+        process.stdout.close()
+        process.wait()
+        reader.join()
+    # A take cut short by a crash can end in a broken packet; that is fine as long as frames came out
+    if process.returncode != 0 and not produced:
+        raise RuntimeError(f"ffmpeg could not read keyframes from {video_path}")
+
+
+class _SpriteSet:
+    """Packs thumbnails for one density into sheets, writing each sheet as soon as it fills."""
+
+    def __init__(self, out_dir, interval):
+        self.out_dir = out_dir
+        self.interval = interval
+        self.per_sheet = SHEET_COLUMNS * SHEET_ROWS
+        self.sheets = []
+        self.count = 0
+        self._sheet = None
+        self._used = 0
+        self._last = None
+
+    def add_until(self, seconds, frame):
+        """Shows the previous keyframe in every slot that starts before `seconds`."""
+        while self.count * self.interval < seconds and self._last is not None:
+            self._place(self._last)
+        self._last = frame
+        if self.count == 0:
+            # The first keyframe also stands in for anything before it
+            self._place(frame)
+
+    def finish(self, duration):
+        while self._last is not None and self.count * self.interval < duration:
+            self._place(self._last)
+        self._flush()
+
+    def _place(self, frame):
+        slot = self.count % self.per_sheet
+        if slot == 0:
+            self._flush()
+            self._sheet = np.zeros((SHEET_ROWS * THUMB_HEIGHT, SHEET_COLUMNS * THUMB_WIDTH, 3), dtype=np.uint8)
+        row, col = divmod(slot, SHEET_COLUMNS)
+        self._sheet[row * THUMB_HEIGHT:(row + 1) * THUMB_HEIGHT, col * THUMB_WIDTH:(col + 1) * THUMB_WIDTH] = frame
+        self._used = slot + 1
+        self.count += 1
+
+    def _flush(self):
+        import cv2
+
+        if self._sheet is None:
+            return
+        # Trim unused rows off the last sheet
+        rows = -(-self._used // SHEET_COLUMNS)
+        name = f"{self.interval}s_{len(self.sheets)}.jpg"
+        cv2.imwrite(os.path.join(self.out_dir, name), self._sheet[:rows * THUMB_HEIGHT],
+                    [cv2.IMWRITE_JPEG_QUALITY, 80])
+        self.sheets.append(name)
+        self._sheet = None
+
+
+def build_thumbnails(session_id, record_dir="recordings"):
+    """
+    Decodes the session video's keyframes once and writes a sprite set per
+    density in THUMB_INTERVALS plus an index.json describing the layout.
+    Thumbnail k of a density shows the last keyframe at or before k * interval.
+    """
+    video_path = os.path.join(record_dir, f"{session_id}_video.mp4")
+    out_dir = thumbnails_dir(record_dir, session_id)
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    sets = [_SpriteSet(tmp_dir, interval) for interval in THUMB_INTERVALS]
+    info = {}
+    last_keyframe = 0.0
+    count = 0
+    for seconds, frame in keyframes(video_path, info):
+        for sprites in sets:
+            sprites.add_until(seconds, frame)
+        last_keyframe = seconds
+        count += 1
+
+    video = (load_manifest(session_id, record_dir) or {}).get("streams", {}).get("video") or {}
+    if video.get("fps") and video.get("frames"):
+        duration = video["frames"] / video["fps"]
+    else:
+        duration = info.get("duration", last_keyframe)
+    for sprites in sets:
+        sprites.finish(duration)
+
+    stat = os.stat(video_path)
+    index = {
+        "version": INDEX_VERSION,
+        "video_size": stat.st_size,
+        "video_mtime": stat.st_mtime,
+        "duration": duration,
+        "keyframes": count,
+        "thumb_width": THUMB_WIDTH,
+        "thumb_height": THUMB_HEIGHT,
+        "columns": SHEET_COLUMNS,
+        "rows": SHEET_ROWS,
+        "densities": [
+            {"interval": sprites.interval, "count": sprites.count, "sheets": sprites.sheets}
+            for sprites in sets
+        ],
+    }
+    with open(os.path.join(tmp_dir, "index.json"), "w") as f:
+        json.dump(index, f, indent=2)
+
+    # Swap the finished set in whole so readers never see half a rebuild
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return index
+
+
+def ensure_thumbnails(session_id, record_dir="recordings"):
+    """Returns the session's thumbnail index, (re)building it if missing or stale. None without video."""
+    video_path = os.path.join(record_dir, f"{session_id}_video.mp4")
+    if not os.path.exists(video_path):
+        return None
+
+    with _build_locks.get((record_dir, session_id)):
+        index = load_index(record_dir, session_id)
+        stat = os.stat(video_path)
+        if (index is None or index.get("version") != INDEX_VERSION
+                or index.get("video_size") != stat.st_size or index.get("video_mtime") != stat.st_mtime):
+            index = build_thumbnails(session_id, record_dir)
+    return index
+
+
+def thumbnails_in_range(index, start, end, count):
+    """
+    Picks the coarsest density that still gives `count` thumbnails over
+    [start, end) and returns it with the tiles covering that window.
+    """
+    span = max(end - start, 1e-6)
+    densities = sorted(index["densities"], key=lambda d: d["interval"])
+    fitting = [d for d in densities if span / d["interval"] >= count]
+    density = fitting[-1] if fitting else densities[0]
+
+    interval = density["interval"]
+    per_sheet = index["columns"] * index["rows"]
+    first = max(int(start // interval), 0)
+    last = min(int(-(-end // interval)), density["count"])
+    tiles = []
+    for k in range(first, last):
+        sheet, slot = divmod(k, per_sheet)
+        row, col = divmod(slot, index["columns"])
+        tiles.append({
+            "time": k * interval,
+            "sheet": density["sheets"][sheet],
+            "x": col * index["thumb_width"],
+            "y": row * index["thumb_height"],
+        })
+    return density, tiles
@@ -0,0 +1,150 @@
+import collections
+import functools
+import shutil
+import subprocess
+import threading
+
+from .lazy import LazyModule
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+
+X264_PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow")
+VIDEO_ENCODERS = ("ffmpeg", "opencv")
+
+# Recorder defaults, overridden by the saved config (see encoder_settings)
+DEFAULT_SETTINGS = {
+    "backend": "ffmpeg",
+    "preset": "veryfast",
+    "crf": 20,
+    "threads": 0, # 0 lets x264 pick from the core count
+    "lossless": False,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_has_encoder(name):
+    if shutil.which("ffmpeg") is None:
+        return False
+    try:
+        result = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True,
+                                timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return any(line.split()[1:2] == [name] for line in result.stdout.splitlines())
+
+
+def encoder_settings(config):
+    """Recorder encoder settings from the saved config.json keys, falling back to DEFAULT_SETTINGS."""
+    settings = dict(DEFAULT_SETTINGS)
+    for key, config_key in (("backend", "videoEncoder"), ("preset", "videoPreset"), ("crf", "videoCrf"),
+                            ("threads", "videoThreads"), ("lossless", "videoLossless")):
+        if config.get(config_key) is not None:
+            settings[key] = config[config_key]
+    return settings
+
+
+class OpenCVEncoder:
+    """cv2.VideoWriter with the mp4v fourcc: MPEG-4 Part 2, single-threaded, no external dependencies."""
+
+    def __init__(self, filename, fps, width, height):
+        self.filename = filename
+        self._writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+
+    def describe(self):
+        return {"encoder": "mpeg4"}
+
+    def write(self, frame):
+        self._writer.write(frame)
+
+    def close(self):
+        self._writer.release()
+
+
+class FfmpegEncoder:
+    """
+    Pipes raw BGR frames into an ffmpeg subprocess encoding H.264 with
+    libx264, which spreads the encode over `threads` cores (0 = auto).
+
+    The regular mode is yuv420p at constant quality `crf` with a keyframe
+    every two seconds, so the file plays anywhere and render_project can
+    stream-copy it. `lossless` switches to libx264rgb at qp 0 with every
+    frame a keyframe: bit-exact BGR, frame-accurate cuts, large files,
+    and not playable in most browsers.
+
+    write() blocks while ffmpeg's pipe is full, which is how a slow encode
+    shows up as queue depth (and eventually dropped frames) in the recorder.
+    """
+
+    def __init__(self, filename, fps, width, height, preset="veryfast", crf=20, threads=0, lossless=False):
+        self.filename = filename
+        self.preset = preset
+        self.crf = crf
+        self.threads = threads
+        self.lossless = lossless
+        self.frame_shape = (height, width, 3)
+
+        cmd = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-framerate", str(fps),
+            "-i", "pipe:0", "-an",
+        ]
+        if lossless:
+            cmd += ["-c:v", "libx264rgb", "-preset", preset, "-qp", "0", "-g", "1", "-pix_fmt", "bgr24"]
+        else:
+            cmd += ["-c:v", "libx264", "-preset", preset, "-crf", str(crf),
+                    "-g", str(max(int(round(fps * 2)), 1)), "-pix_fmt", "yuv420p"]
+        cmd += ["-threads", str(threads), filename]
+
+        self._process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.PIPE)
+        # Drained continuously so a chatty ffmpeg can never block on a full stderr pipe
+        self._errors = collections.deque(maxlen=20)
+        self._stderr_thread = threading.Thread(target=self._read_stderr, daemon=True)
+        self._stderr_thread.start()
+
+    def _read_stderr(self):
+        for line in self._process.stderr:
+            self._errors.append(line.decode(errors="replace").rstrip())
+
+    def describe(self):
+        if self.lossless:
+            return {"encoder": "libx264rgb", "preset": self.preset, "lossless": True}
+        return {"encoder": "libx264", "preset": self.preset, "crf": self.crf}
+
+    def write(self, frame):
+        if frame.shape != self.frame_shape:
+            # The camera changed mode mid-take; rawvideo has no way to carry that
+            frame = cv2.resize(frame, (self.frame_shape[1], self.frame_shape[0]))
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, ValueError):
+            raise RuntimeError(f"ffmpeg encoder exited: {self._error_text()}")
+
+    def close(self):
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._process.wait()
+        self._stderr_thread.join()
+        if self._process.returncode != 0:
+            raise RuntimeError(f"ffmpeg encoder failed ({self._process.returncode}): {self._error_text()}")
+
+    def _error_text(self):
+        return " / ".join(self._errors) or "no output"
+
+
+def open_video_encoder(filename, fps, width, height, settings=None):
+    """
+    Opens the encoder chosen in `settings` (see encoder_settings). Falls
+    back to OpenCV when ffmpeg or the x264 encoder it needs is missing.
+    """
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    if settings["backend"] == "ffmpeg":
+        needed = "libx264rgb" if settings["lossless"] else "libx264"
+        if ffmpeg_has_encoder(needed):
+            return FfmpegEncoder(filename, fps, width, height, preset=settings["preset"], crf=settings["crf"],
+                                 threads=settings["threads"], lossless=settings["lossless"])
+        print(f"ffmpeg with {needed} not found, recording video with OpenCV instead")
+    return OpenCVEncoder(filename, fps, width, height)
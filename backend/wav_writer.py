@@ -0,0 +1,203 @@
+import os
+import struct
+import threading
+import time
+
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+
+
+def _wav_header(channels, sample_width, rate, data_bytes, format_tag=WAVE_FORMAT_PCM):
+    # Canonical 44-byte header; sizes are patched in place as data lands
+    block_align = channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_bytes, b"WAVE",
+        b"fmt ", 16, format_tag, channels, rate, rate * block_align, block_align, sample_width * 8,
+        b"data", data_bytes,
+    )
+
+
+class FloatWavWriter:
+    """
+    Synchronous 32-bit float WAV writer for audio that arrives in blocks
+    (frames x channels, or 1-D for mono), so a whole render never has to be
+    held in memory just to save it.
+    """
+
+    def __init__(self, filename, channels, rate):
+        self.channels = channels
+        self.rate = rate
+        self.data_bytes = 0
+        self._file = open(filename, "wb")
+        self._file.write(_wav_header(channels, 4, rate, 0, WAVE_FORMAT_IEEE_FLOAT))
+
+    def write(self, block):
+        data = memoryview(block).cast("B")
+        self._file.write(data)
+        self.data_bytes += len(data)
+
+    def close(self):
+        """Patches the header and closes the file. Returns the number of frames written."""
+        self._file.seek(0)
+        self._file.write(_wav_header(self.channels, 4, self.rate, self.data_bytes, WAVE_FORMAT_IEEE_FLOAT))
+        self._file.close()
+        return self.data_bytes // (4 * self.channels)
+
+
+class StreamingWavWriter:
+    """
+    Writes PCM audio to a WAV file from a background thread.
+
+    Producers call write() with raw sample bytes; the data is copied into a
+    fixed-size ring buffer and drained to disk by the writer thread, so memory
+    use does not grow with the length of the take. The RIFF/data sizes in the
+    header are rewritten every `header_interval` seconds, which keeps a
+    partially written file playable if the process dies mid-recording.
+    Pass format_tag=WAVE_FORMAT_IEEE_FLOAT for 32-bit float samples.
+    """
+
+    def __init__(self, filename, channels, sample_width, rate,
+                 buffer_seconds=10.0, header_interval=1.0, format_tag=WAVE_FORMAT_PCM):
+        self.filename = filename
+        self.channels = channels
+        self.sample_width = sample_width
+        self.rate = rate
+        self.header_interval = header_interval
+        self.format_tag = format_tag
+
+        frame_bytes = channels * sample_width
+        capacity = int(rate * buffer_seconds) * frame_bytes
+        self._buffer = bytearray(max(capacity, frame_bytes))
+        self._view = memoryview(self._buffer)
+        self._capacity = len(self._buffer)
+        self._read_pos = 0
+        self._size = 0
+
+        self._cond = threading.Condition()
+        self._closed = False
+        self.bytes_written = 0
+
+        self._file = open(filename, "wb")
+        self._file.write(_wav_header(channels, sample_width, rate, 0, format_tag))
+        self._file.flush()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, data):
+        """Queue raw PCM bytes. Blocks only if the ring buffer is full."""
+        data = memoryview(data).cast("B")
+        offset = 0
+        with self._cond:
+            while offset < len(data):
+                while self._size == self._capacity and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    raise ValueError("write to closed StreamingWavWriter")
+
+                write_pos = (self._read_pos + self._size) % self._capacity
+                n = min(len(data) - offset, self._capacity - self._size, self._capacity - write_pos)
+                self._view[write_pos:write_pos + n] = data[offset:offset + n]
+                self._size += n
+                offset += n
+                self._cond.notify_all()
+
+    def try_write(self, data):
+        """
+        Non-blocking write for real-time callers: queues all of `data` and
+        returns True, or queues nothing and returns False if it does not fit.
+        """
+        data = memoryview(data).cast("B")
+        with self._cond:
+            if self._closed:
+                raise ValueError("write to closed StreamingWavWriter")
+            if self._capacity - self._size < len(data):
+                return False
+            offset = 0
+            while offset < len(data):
+                write_pos = (self._read_pos + self._size) % self._capacity
+                n = min(len(data) - offset, self._capacity - write_pos)
+                self._view[write_pos:write_pos + n] = data[offset:offset + n]
+                self._size += n
+                offset += n
+            self._cond.notify_all()
+        return True
+
+    def try_write_silence(self, frames):
+        """
+        Non-blocking: queues up to `frames` frames of silence, as many as
+        fit right now, and returns how many were queued. Zero bytes are
+        silence for signed PCM and float samples alike.
+        """
+        frame_bytes = self.channels * self.sample_width
+        with self._cond:
+            if self._closed:
+                raise ValueError("write to closed StreamingWavWriter")
+            frames = min(frames, (self._capacity - self._size) // frame_bytes)
+            count = frames * frame_bytes
+            while count:
+                write_pos = (self._read_pos + self._size) % self._capacity
+                n = min(count, self._capacity - write_pos)
+                self._view[write_pos:write_pos + n] = bytes(n)
+                self._size += n
+                count -= n
+            self._cond.notify_all()
+        return frames
+
+    @property
+    def buffered_bytes(self):
+        """Bytes accepted by write() that have not reached the file yet."""
+        return self._size
+
+    def close(self):
+        """Drain everything still buffered, finalize the header and close the file."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        last_patch = time.monotonic()
+        while True:
+            with self._cond:
+                while self._size == 0 and not self._closed:
+                    self._cond.wait(timeout=self.header_interval)
+                    if time.monotonic() - last_patch >= self.header_interval:
+                        break
+                if self._size == 0 and self._closed:
+                    break
+                start = self._read_pos
+                n = min(self._size, self._capacity - start)
+
+            # Write outside the lock so producers are never blocked on disk I/O
+            if n:
+                self._file.write(self._view[start:start + n])
+                self.bytes_written += n
+                with self._cond:
+                    self._read_pos = (self._read_pos + n) % self._capacity
+                    self._size -= n
+                    self._cond.notify_all()
+
+            now = time.monotonic()
+            if now - last_patch >= self.header_interval:
+                self._patch_header()
+                last_patch = now
+
+        self._patch_header()
+        self._file.close()
+
+    def _patch_header(self):
+        # Only whole frames count towards the data chunk
+        frame_bytes = self.channels * self.sample_width
+        data_bytes = self.bytes_written - (self.bytes_written % frame_bytes)
+        self._file.flush()
+        pos = self._file.tell()
+        self._file.seek(0)
+        self._file.write(_wav_header(self.channels, self.sample_width, self.rate, data_bytes, self.format_tag))
+        self._file.seek(pos)
+        self._file.flush()
+        os.fsync(self._file.fileno())
@@ -0,0 +1,59 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+def init_worker(plugin_max_bytes=None):
+    """
+    initializer= for every spawn process pool. A spawned worker starts as a
+    fresh interpreter with no logging handlers, so renderer and ffmpeg
+    messages would otherwise be dropped. `plugin_max_bytes` caps the
+    memory this worker's PluginHostPool may keep loaded.
+    """
+    logging.basicConfig(level=logging.INFO)
+    if plugin_max_bytes:
+        from . import renderer
+
+        if renderer.plugin_pool is not None:
+            renderer.plugin_pool.max_bytes = plugin_max_bytes
+
+
+class RenderWorkers:
+    """
+    The spawn process pool that export jobs and batch renders share.
+
+    Every worker hosts its own PluginHostPool, so the worker count is what
+    bounds plugin memory: each worker gets an equal share of
+    `plugin_max_bytes`, which makes that the limit across all renders no
+    matter who submitted them. The pool and the manager process (for the
+    cross-process queues and cancel flags) start on first use.
+    """
+
+    def __init__(self, max_workers=2, plugin_max_bytes=4 * 1024 ** 3):
+        self.max_workers = max_workers
+        self.plugin_max_bytes = plugin_max_bytes
+        self.manager = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._executor is None:
+                ctx = multiprocessing.get_context("spawn")
+                self.manager = ctx.Manager()
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx,
+                                                     initializer=init_worker,
+                                                     initargs=(self.plugin_max_bytes // self.max_workers,))
+        return self
+
+    def submit(self, fn, *args):
+        return self.start()._executor.submit(fn, *args)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is None:
+                return
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self.manager.shutdown()
+            self._executor = None
@@ -0,0 +1,363 @@
+"""
+Synthetic stand-ins for the recording hardware and the plugin host, so the
+recorder and renderer can be driven headlessly by bench.harness.
+
+Each fake keeps real-time pacing the way the device would: the audio
+stream hands out a chunk only once its samples "exist" (on a device clock
+that drifts a little per device) and overflows when the reader falls too
+far behind, the camera drops frames nobody read in time, and the MIDI
+port fires its callback from its own thread on a fixed schedule. What
+each fake observed is collected in STATS.
+"""
+import threading
+import time
+import types
+
+import numpy as np
+
+STATS = {}
+PA_INPUT_OVERFLOWED = -9981 # Error code of a blocking read that overflowed
+PA_INPUT_OVERFLOW = 0x2 # Status flag passed to stream callbacks
+
+
+def reset_stats():
+    STATS.clear()
+    STATS.update({
+        "audio_chunks": 0,
+        "audio_overflows": 0,
+        "audio_frames_lost": 0,
+        "video_frames": 0,
+        "video_source_drops": 0,
+        "midi_sent": [], # (scheduled_ns, sent_ns) per message
+    })
+
+
+reset_stats()
+
+
+def _wait_until(deadline_ns):
+    remaining = deadline_ns - time.perf_counter_ns()
+    if remaining > 0:
+        time.sleep(remaining / 1e9)
+
+
+# --- Audio -----------------------------------------------------------------
+
+class FakeInputStream:
+    """
+    Input stream in blocking-read or callback mode. Chunk k is ready at
+    start + (k + 1) * chunk / rate, with the device clock running
+    `skew_ppm` fast or slow; if the reader falls more than `buffer_chunks`
+    behind, the oldest chunks are lost, as with a real driver's input overflow.
+    """
+
+    def __init__(self, channels, rate, frames_per_buffer, sample_size=2, callback=None, skew_ppm=0.0,
+                 buffer_chunks=4):
+        self.channels = channels
+        self.rate = rate
+        self.chunk = frames_per_buffer
+        self.buffer_chunks = buffer_chunks
+        self.callback = callback
+        self._true_rate = rate * (1 + skew_ppm / 1e6)
+        self._start_ns = time.perf_counter_ns()
+        self._consumed = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+        # A few seconds of tone with a little noise, replayed in a loop
+        t = np.arange(rate * 2) / rate
+        signal = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.01 * np.random.default_rng(0).standard_normal(len(t))
+        signal = np.repeat(signal[:, None], channels, axis=1)
+        if sample_size == 4:
+            self._loop = signal.astype("<f4").tobytes()
+        elif sample_size == 3:
+            packed = (signal * 8388607).astype("<i4").view(np.uint8).reshape(-1, channels, 4)
+            self._loop = packed[..., :3].tobytes()
+        else:
+            self._loop = (signal * 32767).astype("<i2").tobytes()
+        self._frame_bytes = channels * sample_size
+
+    def _ready(self, k):
+        return self._start_ns + int((k + 1) * self.chunk * 1e9 / self._true_rate)
+
+    def _next_chunk(self):
+        """Waits for the next chunk; returns (data, overflowed)."""
+        available = int((time.perf_counter_ns() - self._start_ns) * self._true_rate / 1e9) // self.chunk
+        behind = available - self._consumed
+        overflowed = behind > self.buffer_chunks
+        if overflowed:
+            lost = behind - self.buffer_chunks
+            self._consumed += lost
+            STATS["audio_overflows"] += 1
+            STATS["audio_frames_lost"] += lost * self.chunk
+        _wait_until(self._ready(self._consumed))
+
+        size = self.chunk * self._frame_bytes
+        offset = (self._consumed * size) % (len(self._loop) - size)
+        offset -= offset % self._frame_bytes
+        self._consumed += 1
+        STATS["audio_chunks"] += 1
+        return self._loop[offset:offset + size], overflowed
+
+    def read(self, num_frames, exception_on_overflow=True):
+        data, overflowed = self._next_chunk()
+        if overflowed and exception_on_overflow:
+            # Like PyAudio: the chunk that overflowed is discarded along with the lost ones
+            STATS["audio_frames_lost"] += self.chunk
+            raise OSError(PA_INPUT_OVERFLOWED, "Input overflowed")
+        return data
+
+    def start_stream(self):
+        if self.callback is None or self._thread is not None:
+            return
+        self._start_ns = time.perf_counter_ns()
+        self._thread = threading.Thread(target=self._run_callback, name="fake-audio-device", daemon=True)
+        self._thread.start()
+
+    def _run_callback(self):
+        while not self._stop.is_set():
+            data, overflowed = self._next_chunk()
+            if self._stop.is_set():
+                break
+            # When the chunk's first sample was converted, on the device's own clock
+            adc_time = (self._start_ns + (self._consumed - 1) * self.chunk * 1e9 / self._true_rate) / 1e9
+            _, flag = self.callback(data, self.chunk, {"input_buffer_adc_time": adc_time},
+                                    PA_INPUT_OVERFLOW if overflowed else 0)
+            if flag:
+                break
+
+    def get_input_latency(self):
+        return self.chunk / self.rate
+
+    def stop_stream(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def close(self):
+        pass
+
+
+class FakePyAudio:
+    """`devices` identical interfaces; device k's clock runs k * `drift_ppm` fast."""
+
+    channels = 2
+    devices = 1
+    drift_ppm = 20.0
+    sample_sizes = {8: 2, 4: 3, 1: 4} # paInt16, paInt24, paFloat32
+
+    def get_host_api_info_by_index(self, index):
+        return {"deviceCount": self.devices}
+
+    def get_device_info_by_host_api_device_index(self, host_api, index):
+        return {"name": f"Bench Audio {index}", "maxInputChannels": self.channels, "defaultSampleRate": 44100.0}
+
+    def get_default_input_device_info(self):
+        return self.get_device_info_by_host_api_device_index(0, 0)
+
+    def get_sample_size(self, fmt):
+        return self.sample_sizes[fmt]
+
+    def open(self, format, channels, rate, input=True, input_device_index=None, frames_per_buffer=1024,
+             stream_callback=None, start=True, **kwargs):
+        stream = FakeInputStream(channels, rate, frames_per_buffer, sample_size=self.sample_sizes[format],
+                                 callback=stream_callback, skew_ppm=(input_device_index or 0) * self.drift_ppm)
+        if start:
+            stream.start_stream()
+        return stream
+
+    def terminate(self):
+        pass
+
+
+def fake_pyaudio_module():
+    module = types.ModuleType("pyaudio")
+    module.paFloat32 = 1
+    module.paInt24 = 4
+    module.paInt16 = 8
+    module.paContinue = 0
+    module.paInputOverflow = PA_INPUT_OVERFLOW
+    module.paInputOverflowed = PA_INPUT_OVERFLOWED
+    module.PyAudio = FakePyAudio
+    return module
+
+
+# --- Video -----------------------------------------------------------------
+
+class FakeVideoCapture:
+    """Camera delivering frames at `fps`; frames not read within one period are dropped at the source."""
+
+    width = 1280
+    height = 720
+    fps = 30.0
+
+    def __init__(self, index, *args):
+        self._period_ns = int(1e9 / self.fps)
+        self._start_ns = time.perf_counter_ns()
+        self._next = 0
+        # A handful of distinct images so the encoder sees motion
+        base = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        self._frames = []
+        for i in range(8):
+            frame = base.copy()
+            x = i * self.width // 8
+            frame[:, x:x + self.width // 8] = (30 * i, 255 - 30 * i, 128)
+            self._frames.append(frame)
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        import cv2
+        return {cv2.CAP_PROP_FRAME_WIDTH: self.width, cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+                cv2.CAP_PROP_FPS: self.fps}.get(prop, 0)
+
+    def read(self):
+        due = self._start_ns + self._next * self._period_ns
+        late = time.perf_counter_ns() - due
+        if late > self._period_ns:
+            skipped = late // self._period_ns
+            self._next += skipped
+            STATS["video_source_drops"] += skipped
+            due += skipped * self._period_ns
+        _wait_until(due)
+        frame = self._frames[self._next % len(self._frames)]
+        self._next += 1
+        STATS["video_frames"] += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+
+# --- MIDI ------------------------------------------------------------------
+
+class FakeMidiInput:
+    """
+    Input port playing a fixed pattern at `rate` messages per second,
+    delivering each one from a sender thread via the callback, or queueing
+    it for iter_pending() when opened without one.
+    """
+
+    rate = 20.0
+
+    def __init__(self, name=None, callback=None, **kwargs):
+        import mido
+
+        self.callback = callback
+        self._pending = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._messages = [mido.Message("note_on" if i % 2 == 0 else "note_off", note=48 + (i // 2) % 24,
+                                       velocity=64 + i % 32) for i in range(48)]
+        self._thread = threading.Thread(target=self._play, name="fake-midi-port", daemon=True)
+        self._thread.start()
+
+    def _play(self):
+        period_ns = int(1e9 / self.rate)
+        start = time.perf_counter_ns()
+        i = 0
+        while not self._stop.is_set():
+            scheduled = start + i * period_ns
+            _wait_until(scheduled)
+            if self._stop.is_set():
+                break
+            msg = self._messages[i % len(self._messages)]
+            STATS["midi_sent"].append((scheduled, time.perf_counter_ns()))
+            if self.callback:
+                self.callback(msg)
+            else:
+                with self._lock:
+                    self._pending.append(msg)
+            i += 1
+
+    def iter_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return iter(pending)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def fake_mido_module():
+    """The real mido, except that open_input returns a FakeMidiInput."""
+    import mido
+
+    module = types.ModuleType("mido")
+    module.open_input = FakeMidiInput
+    module.__getattr__ = lambda name: getattr(mido, name)
+    return module
+
+
+# --- Render engine ----------------------------------------------------------
+
+class FakePlugin:
+    def clear_midi(self):
+        pass
+
+
+class FakeRenderEngine:
+    """
+    Mimics the slice of DawDreamer's RenderEngine the renderer uses. Renders
+    a tone and paces itself to `speed` x real time, like a plugin of that cost.
+    """
+
+    speed = 50.0
+
+    def __init__(self, sample_rate, block_size):
+        self.sample_rate = sample_rate
+        self._audio = None
+
+    def make_plugin_processor(self, name, path):
+        return FakePlugin()
+
+    def load_midi(self, path, clear_previous=True, map_to_processor=None, **kwargs):
+        pass
+
+    def load_graph(self, graph):
+        pass
+
+    def render(self, seconds):
+        start = time.perf_counter()
+        t = np.arange(int(seconds * self.sample_rate)) / self.sample_rate
+        tone = (0.1 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+        self._audio = np.stack((tone, tone))
+        time.sleep(max(seconds / self.speed - (time.perf_counter() - start), 0))
+
+    def get_audio(self):
+        return self._audio
+
+
+def install(engine_speed=None):
+    """
+    Points the backend at the fakes: pyaudio in the audio capture, the
+    camera and MIDI input in the recorder, and the DawDreamer engine in the
+    renderer. Real cv2 is still used for video encoding, and real ffmpeg
+    for muxing.
+    """
+    if engine_speed is not None:
+        FakeRenderEngine.speed = engine_speed
+
+    import cv2
+    from backend import audio_capture, recorder, renderer
+    from backend.plugin_pool import PluginHostPool
+
+    audio_capture.pyaudio = fake_pyaudio_module()
+    recorder.mido = fake_mido_module()
+    camera = types.ModuleType("cv2")
+    camera.__getattr__ = lambda name: getattr(cv2, name)
+    camera.VideoCapture = FakeVideoCapture
+    recorder.cv2 = camera
+
+    daw = types.SimpleNamespace(RenderEngine=FakeRenderEngine)
+    renderer.daw = daw
+    renderer.DAW_AVAILABLE = True
+    renderer.plugin_pool = PluginHostPool(daw)
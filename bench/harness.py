@@ -0,0 +1,326 @@
+"""
+Hardware-free benchmark of a full recording and the exports that follow.
+
+Drives MultiTrackRecorder against synthetic audio, camera and MIDI devices
+(see bench.fakes) for a multi-minute take, then renders it with a mock
+plugin engine, once on its own and as a batch, and reports:
+
+  recording: audio dropouts and clock drift per device, video frame
+             drops/duplicates, MIDI timestamp jitter, peak RSS and CPU
+             seconds per thread
+  export:    real-time factor of a single export and of the batch
+
+Results are written as JSON; pass --compare with an earlier result to see
+how each number moved.
+
+    python -m bench.harness --seconds 120 --output bench_results.json
+    python -m bench.harness --seconds 120 --compare bench_results.json
+
+Needs cv2 for video encoding and ffmpeg on PATH for the exports.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+from bench import fakes
+
+# Batch exports run in spawned workers, which re-import this module as their
+# main module; installing the fakes at import time puts them there as well.
+fakes.install(engine_speed=float(os.environ.get("BENCH_ENGINE_SPEED", "50")))
+
+from backend.plugin_pool import _rss_bytes
+from backend.recorder import MultiTrackRecorder
+from backend.session_clock import load_manifest
+
+
+class ResourceSampler:
+    """Samples process RSS and per-thread CPU time (Linux /proc) on a background thread."""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_rss = 0
+        self.thread_cpu = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-sampler", daemon=True)
+        self._ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        rss = _rss_bytes()
+        if rss:
+            self.peak_rss = max(self.peak_rss, rss)
+        for thread in threading.enumerate():
+            cpu = self._thread_cpu(thread.native_id)
+            if cpu is not None:
+                # Keyed by name + id so short-lived threads with the same name don't overwrite each other
+                key = f"{thread.name}#{thread.native_id}"
+                self.thread_cpu[key] = max(self.thread_cpu.get(key, 0.0), cpu)
+
+    def _thread_cpu(self, tid):
+        try:
+            with open(f"/proc/self/task/{tid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            return None
+        # utime and stime are fields 14 and 15 of stat, i.e. 11 and 12 after the command name
+        return (int(fields[11]) + int(fields[12])) / self._ticks
+
+    def per_thread(self):
+        # Collapse thread ids, summing threads that share a name
+        totals = {}
+        for key, cpu in self.thread_cpu.items():
+            # "Thread-6 (_encode_video)" -> "_encode_video", so names line up between runs
+            name = re.sub(r"^Thread-\d+ \((.*)\)$", r"\1", key.rsplit("#", 1)[0])
+            totals[name] = round(totals.get(name, 0.0) + cpu, 3)
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else None
+
+
+def run_recording(record_dir, seconds, midi_mode, audio_devices=1, audio_format="int24", video_encoder=None):
+    fakes.reset_stats()
+    recorder = MultiTrackRecorder(recordings_dir=record_dir)
+    recorder.midi_mode = midi_mode
+    recorder.audio_format = audio_format
+    recorder.video_encoder.update(video_encoder or {})
+
+    cpu_start = time.process_time()
+    with ResourceSampler() as sampler:
+        recorder.start_recording(video_device_index=0, midi_port_name="bench",
+                                 audio_device_indices=list(range(audio_devices)))
+        time.sleep(seconds)
+        recorder.stop_recording()
+    cpu = time.process_time() - cpu_start
+
+    # Lateness of each recorded MIDI timestamp against the instant the "device" was due to send it
+    received = [ts for ts, _ in recorder.midi_messages]
+    scheduled = [sched for sched, _ in fakes.STATS["midi_sent"]][:len(received)]
+    lateness_us = [(r - s) / 1000 for s, r in zip(scheduled, received)]
+
+    video = recorder.video_stats
+    expected_chunks = seconds * recorder.rate / recorder.chunk * audio_devices
+    streams = (load_manifest(recorder.session_id, record_dir) or {}).get("streams", {})
+    video_path = os.path.join(record_dir, f"{recorder.session_id}_video.mp4")
+    return recorder.session_id, {
+        "seconds": seconds,
+        "audio": {
+            "devices": audio_devices,
+            "format": audio_format,
+            "chunks": fakes.STATS["audio_chunks"],
+            "expected_chunks": round(expected_chunks),
+            "dropouts": fakes.STATS["audio_overflows"],
+            "frames_lost": fakes.STATS["audio_frames_lost"],
+            # Measured against the fakes' known skew of n * drift_ppm for device n
+            "drift_ppm": {name: stream.get("drift_ppm") for name, stream in streams.items()
+                          if name.startswith("audio")},
+            "relative_drift_ppm": {name: stream["relative_drift_ppm"] for name, stream in streams.items()
+                                   if "relative_drift_ppm" in stream},
+        },
+        "video": {
+            "encoder": streams.get("video", {}).get("encoder"),
+            "file_mb": round(os.path.getsize(video_path) / 2 ** 20, 1) if os.path.exists(video_path) else None,
+            "fps": video.get("fps"),
+            "frames_captured": video.get("frames_captured"),
+            "frames_written": video.get("frames_written"),
+            "frames_dropped": video.get("frames_dropped"),
+            "frames_duplicated": video.get("frames_duplicated"),
+            "source_drops": fakes.STATS["video_source_drops"],
+        },
+        "midi": {
+            "mode": midi_mode,
+            "sent": len(fakes.STATS["midi_sent"]),
+            "received": len(received),
+            "lateness_mean_us": statistics.mean(lateness_us) if lateness_us else None,
+            "lateness_p99_us": percentile(lateness_us, 0.99),
+            "lateness_max_us": max(lateness_us) if lateness_us else None,
+            "jitter_stdev_us": statistics.pstdev(lateness_us) if lateness_us else None,
+        },
+        "peak_rss_mb": round(sampler.peak_rss / 2 ** 20, 1),
+        "cpu_seconds": round(cpu, 3),
+        "cpu_percent": round(100.0 * cpu / seconds, 1),
+        "thread_cpu_seconds": sampler.per_thread(),
+    }
+
+
+def run_single_export(record_dir, session_id, plugin):
+    from backend.renderer import render_project
+
+    start = time.perf_counter()
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    with ResourceSampler() as sampler:
+        render_project(session_id, plugin, record_dir=record_dir)
+    elapsed = time.perf_counter() - start
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    duration = _media_seconds(record_dir, session_id)
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "audio_seconds": duration,
+        "real_time_factor": round(duration / elapsed, 2) if elapsed else None,
+        "peak_rss_mb": round(sampler.peak_rss / 2 ** 20, 1),
+        "ffmpeg_cpu_seconds": round((children.ru_utime + children.ru_stime)
+                                    - (children_start.ru_utime + children_start.ru_stime), 3),
+    }
+
+
+def run_batch_export(record_dir, session_id, plugins, sessions):
+    from backend.batch import BatchExportManager
+
+    # Same take under several session ids, so the batch has a real sessions x plugins matrix
+    session_ids = [session_id]
+    for i in range(1, sessions):
+        copy_id = f"{session_id}{i:02d}"
+        for suffix in ("video.mp4", "midi.mid", "manifest.json", "audio.wav"):
+            src = os.path.join(record_dir, f"{session_id}_{suffix}")
+            if os.path.exists(src):
+                shutil.copyfile(src, os.path.join(record_dir, f"{copy_id}_{suffix}"))
+        session_ids.append(copy_id)
+
+    manager = BatchExportManager(record_dir=record_dir)
+    try:
+        batch = manager.submit(session_ids, plugins)
+        while batch.status not in ("done", "cancelled"):
+            time.sleep(0.1)
+        stats = batch.to_dict()
+    finally:
+        manager.shutdown()
+    return {
+        "items": stats["total"],
+        "completed": stats["completed"],
+        "failed": stats["failed"],
+        "concurrency": stats["concurrency"],
+        "elapsed_seconds": round(stats["elapsed_seconds"], 3),
+        "audio_seconds": round(stats["audio_seconds"], 3),
+        "real_time_factor": round(stats["real_time_factor"], 2) if stats["real_time_factor"] else None,
+    }
+
+
+def _media_seconds(record_dir, session_id):
+    video = (load_manifest(session_id, record_dir) or {}).get("streams", {}).get("video") or {}
+    return round(video["frames"] / video["fps"], 3) if video.get("frames") and video.get("fps") else None
+
+
+def compare(previous, current, path=""):
+    """Prints every numeric value that changed between two result files."""
+    for key, value in current.items():
+        old = previous.get(key) if isinstance(previous, dict) else None
+        name = f"{path}.{key}" if path else key
+        if isinstance(value, dict):
+            compare(old or {}, value, name)
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old != value:
+            change = f" ({100.0 * (value - old) / old:+.1f}%)" if old else ""
+            print(f"{name}: {old} -> {value}{change}")
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=120.0, help="length of the recorded take")
+    parser.add_argument("--midi-mode", choices=("callback", "poll"), default="callback")
+    parser.add_argument("--midi-rate", type=float, default=20.0, help="MIDI messages per second")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--video-encoder", choices=("ffmpeg", "opencv"), default="ffmpeg")
+    parser.add_argument("--x264-preset", default="veryfast")
+    parser.add_argument("--lossless", action="store_true", help="lossless intra-only x264")
+    parser.add_argument("--channels", type=int, default=2, help="input channels per audio device")
+    parser.add_argument("--audio-devices", type=int, default=1)
+    parser.add_argument("--audio-format", choices=("int16", "int24", "float32"), default="int24")
+    parser.add_argument("--engine-speed", type=float, default=50.0,
+                        help="how many times faster than real time the mock plugin renders")
+    parser.add_argument("--plugins", type=int, default=2, help="plugins in the batch export")
+    parser.add_argument("--sessions", type=int, default=2, help="sessions in the batch export")
+    parser.add_argument("--no-export", action="store_true")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier result file to diff against")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary recordings directory")
+    args = parser.parse_args()
+
+    fakes.FakeVideoCapture.width = args.width
+    fakes.FakeVideoCapture.height = args.height
+    fakes.FakeVideoCapture.fps = args.fps
+    fakes.FakeMidiInput.rate = args.midi_rate
+    fakes.FakePyAudio.channels = args.channels
+    fakes.FakePyAudio.devices = args.audio_devices
+    fakes.FakeRenderEngine.speed = args.engine_speed
+    os.environ["BENCH_ENGINE_SPEED"] = str(args.engine_speed) # For the batch workers
+
+    record_dir = tempfile.mkdtemp(prefix="daw-bench-")
+    try:
+        video_encoder = {"backend": args.video_encoder, "preset": args.x264_preset, "lossless": args.lossless}
+        session_id, recording = run_recording(record_dir, args.seconds, args.midi_mode, args.audio_devices,
+                                              args.audio_format, video_encoder)
+        results = {
+            "revision": git_revision(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+            "recording": recording,
+        }
+
+        if args.no_export:
+            pass
+        elif shutil.which("ffmpeg") is None:
+            results["export"] = {"skipped": "ffmpeg not found on PATH"}
+        else:
+            plugins = []
+            for i in range(args.plugins):
+                plugin = os.path.join(record_dir, f"bench-plugin-{i}.vst3")
+                with open(plugin, "w") as f:
+                    f.write(f"fake plugin {i}\n")
+                plugins.append(plugin)
+            results["export"] = {
+                "single": run_single_export(record_dir, session_id, plugins[0]),
+                "batch": run_batch_export(record_dir, session_id, plugins, args.sessions),
+            }
+    finally:
+        if args.keep:
+            print(f"Recordings kept in {record_dir}")
+        else:
+            shutil.rmtree(record_dir, ignore_errors=True)
+
+    print(json.dumps(results, indent=4))
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        for section in ("recording", "export"):
+            compare(previous.get(section, {}), results.get(section, {}), section)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compares the callback and polling MIDI capture modes of MultiTrackRecorder.
+
+Sends notes through a virtual rtmidi port at a fixed rate and measures, for
+each mode, the arrival latency/jitter of the recorded timestamps and the CPU
+time the process burns while capturing.
+
+    python -m bench.midi_capture --notes 2000 --interval-ms 5
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import threading
+import time
+
+import mido
+
+from backend.recorder import MultiTrackRecorder
+
+PORT_NAME = "daw-dashboard-bench"
+
+
+def run_mode(mode, notes, interval_s):
+    recorder = MultiTrackRecorder(recordings_dir=tempfile.mkdtemp())
+    recorder.midi_mode = mode
+    recorder.midi_messages.clear()
+    recorder.stop_event.clear()
+    recorder.is_recording = True
+    recorder.clock.start()
+
+    with mido.open_output(PORT_NAME, virtual=True) as out:
+        capture = threading.Thread(target=recorder._record_midi, args=(PORT_NAME,))
+        capture.start()
+        time.sleep(0.5) # Let the input connect
+
+        sent = []
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        next_send = time.perf_counter()
+        for i in range(notes):
+            while time.perf_counter() < next_send:
+                pass
+            sent.append(time.perf_counter_ns())
+            out.send(mido.Message('note_on', note=60 + i % 12, velocity=64))
+            next_send += interval_s
+        time.sleep(0.2) # Drain in-flight messages
+        cpu_used = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+
+        recorder.is_recording = False
+        recorder.stop_event.set()
+        capture.join()
+
+    received = [ts for ts, _ in recorder.midi_messages]
+    latencies_us = [(r - s) / 1000 for s, r in zip(sent, received)]
+    latencies_us.sort()
+    return {
+        "mode": mode,
+        "sent": len(sent),
+        "received": len(received),
+        "latency_mean_us": statistics.mean(latencies_us) if latencies_us else None,
+        "latency_p99_us": latencies_us[int(len(latencies_us) * 0.99) - 1] if latencies_us else None,
+        "jitter_stdev_us": statistics.pstdev(latencies_us) if latencies_us else None,
+        "cpu_seconds": cpu_used,
+        "cpu_percent": 100.0 * cpu_used / wall,
+    }
+
+
+def baseline_cpu(notes, interval_s):
+    # CPU cost of the sender loop alone, with nothing capturing
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    next_send = time.perf_counter()
+    for _ in range(notes):
+        while time.perf_counter() < next_send:
+            pass
+        next_send += interval_s
+    time.sleep(0.2)
+    cpu_used = time.process_time() - cpu_start
+    return {"cpu_seconds": cpu_used, "cpu_percent": 100.0 * cpu_used / (time.perf_counter() - wall_start)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument("--interval-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    interval_s = args.interval_ms / 1000
+    results = {
+        "baseline": baseline_cpu(args.notes, interval_s),
+        "poll": run_mode("poll", args.notes, interval_s),
+        "callback": run_mode("callback", args.notes, interval_s),
+    }
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Cold-start budget for the backend.
+
+Measures, in fresh interpreters, how long `import backend.server` takes
+and which heavy libraries it drags in, then starts the real server and
+times how long until /health answers and until /ready reports the capture
+stack warm. Exits non-zero if the import or /health goes over budget, or
+if a library that should load lazily is imported at startup.
+
+    python -m bench.startup --runs 5 --import-budget 0.8 --health-budget 2.0
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+# Must not be imported by `import backend.server`; they load on first use or in the warm-up thread
+LAZY_MODULES = ("cv2", "pyaudio", "mido", "numpy", "scipy", "dawdreamer", "backend.renderer")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import backend.server
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def _env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def measure_import(workdir):
+    # The server creates recordings/, config.json and catalog.db in its working directory
+    result = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=workdir, env=_env(),
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return None, None
+
+
+def measure_server(workdir, timeout=30.0):
+    """Seconds from launching `python -m backend.server` until /health answers and until /ready is 200."""
+    port = _free_port()
+    env = _env()
+    env["DAW_BACKEND_PORT"] = str(port)
+    process = subprocess.Popen([sys.executable, "-m", "backend.server"], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    start = time.perf_counter()
+    health = ready = None
+    readiness = None
+    try:
+        while time.perf_counter() - start < timeout and process.poll() is None:
+            if health is None and _get(f"http://127.0.0.1:{port}/health")[0] == 200:
+                health = time.perf_counter() - start
+            if health is not None:
+                status, readiness = _get(f"http://127.0.0.1:{port}/ready")
+                if status == 200:
+                    ready = time.perf_counter() - start
+                    break
+                if readiness and readiness.get("errors"):
+                    break # A capture library is missing; it will never be ready
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait()
+    return {"health_seconds": health, "ready_seconds": ready,
+            "ready_errors": (readiness or {}).get("errors")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=0.8, help="median seconds for the import")
+    parser.add_argument("--health-budget", type=float, default=2.0,
+                        help="median seconds from launch until /health answers")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="daw-startup-")
+    try:
+        imports = [measure_import(workdir) for _ in range(args.runs)]
+        servers = [measure_server(workdir) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    health = [s["health_seconds"] for s in servers if s["health_seconds"] is not None]
+    ready = [s["ready_seconds"] for s in servers if s["ready_seconds"] is not None]
+    results = {
+        "import_seconds": round(statistics.median(i["seconds"] for i in imports), 3),
+        "eagerly_loaded": sorted({m for i in imports for m in i["loaded"]}),
+        "health_seconds": round(statistics.median(health), 3) if health else None,
+        "ready_seconds": round(statistics.median(ready), 3) if ready else None,
+        "ready_errors": servers[-1]["ready_errors"] or None,
+    }
+    print(json.dumps(results, indent=4))
+
+    failures = []
+    if results["import_seconds"] > args.import_budget:
+        failures.append(f"import took {results['import_seconds']}s (budget {args.import_budget}s)")
+    if results["eagerly_loaded"]:
+        failures.append(f"imported at startup: {', '.join(results['eagerly_loaded'])}")
+    if results["health_seconds"] is None or results["health_seconds"] > args.health_budget:
+        failures.append(f"/health after {results['health_seconds']}s (budget {args.health_budget}s)")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
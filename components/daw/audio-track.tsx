@@ -3,48 +3,39 @@
 import { Music, Volume2, Headphones, Lock } from "lucide-react";
 import { useState, useEffect } from "react";
 
-function generateWaveform(width: number, seed: number) {
-  const points: string[] = [];
-  const midY = 24;
-  for (let x = 0; x <= width; x++) {
-    const noise =
-      Math.sin(x * 0.15 + seed) * 8 +
-      Math.sin(x * 0.05 + seed * 2) * 12 +
-      Math.sin(x * 0.3 + seed * 0.5) * 4 +
-      Math.cos(x * 0.08 + seed) * 6;
-    const envelope = Math.sin((x / width) * Math.PI) * 0.7 + 0.3;
-    const y = Math.round((midY - noise * envelope) * 100) / 100;
-    points.push(`${x},${y}`);
-  }
-  const mirrorPoints: string[] = [];
-  for (let x = width; x >= 0; x--) {
-    const noise =
-      Math.sin(x * 0.15 + seed) * 8 +
-      Math.sin(x * 0.05 + seed * 2) * 12 +
-      Math.sin(x * 0.3 + seed * 0.5) * 4 +
-      Math.cos(x * 0.08 + seed) * 6;
-    const envelope = Math.sin((x / width) * Math.PI) * 0.7 + 0.3;
-    const y = Math.round((midY + noise * envelope) * 100) / 100;
-    mirrorPoints.push(`${x},${y}`);
-  }
-  return [...points, ...mirrorPoints].join(" ");
+const PEAK_BINS = 1000; // Enough columns for the widest track; the backend picks the matching level
+
+interface AudioTrackProps {
+  sessionId: string | null;
 }
 
-const waveformSegments = [
-  { start: 0, width: 40, seed: 1 },
-  { start: 45, width: 55, seed: 7 },
-];
+interface PeakWindow {
+  min: number[];
+  max: number[];
+}
 
-export default function AudioTrack() {
-  const [waveforms, setWaveforms] = useState<Record<number, string>>({});
+// Closed outline of the min/max envelope in a viewBox `bins` wide and 48 high
+function peakPolygon(peaks: PeakWindow) {
+  const midY = 24;
+  const top = peaks.max.map((v, i) => `${i},${Math.round((midY - v * midY) * 100) / 100}`);
+  const bottom = peaks.min
+    .map((v, i) => `${i},${Math.round((midY - v * midY) * 100) / 100}`)
+    .reverse();
+  return [...top, ...bottom].join(" ");
+}
+
+export default function AudioTrack({ sessionId }: AudioTrackProps) {
+  const [peaks, setPeaks] = useState<PeakWindow | null>(null);
 
   useEffect(() => {
-    const generated: Record<number, string> = {};
-    for (const seg of waveformSegments) {
-      generated[seg.seed] = generateWaveform(200, seg.seed);
-    }
-    setWaveforms(generated);
-  }, []);
+    setPeaks(null);
+    if (!sessionId) return;
+    // Precomputed min/max bins instead of downloading and decoding the whole WAV
+    fetch(`http://localhost:8000/recordings/${sessionId}/peaks?width=${PEAK_BINS}`)
+      .then((res) => (res.ok ? res.json() : null))
+      .then((data) => setPeaks(data && data.min.length ? data : null))
+      .catch(() => setPeaks(null));
+  }, [sessionId]);
 
   return (
     <div className="flex border-b border-border group">
@@ -110,33 +101,29 @@ export default function AudioTrack() {
         {/* Center line */}
         <div className="absolute left-0 right-0 top-1/2 h-px bg-accent/10" />
 
-        {/* Waveform segments */}
-        {waveformSegments.map((seg, i) => (
-          <div
-            key={i}
-            className="absolute top-1 bottom-1 cursor-pointer group/wave"
-            style={{
-              left: `${seg.start}%`,
-              width: `${seg.width}%`,
-            }}
-          >
+        {/* Waveform */}
+        {peaks ? (
+          <div className="absolute top-1 bottom-1 left-0 right-0 cursor-pointer group/wave">
             <svg
-              viewBox="0 0 200 48"
+              viewBox={`0 0 ${Math.max(peaks.min.length - 1, 1)} 48`}
               preserveAspectRatio="none"
               className="w-full h-full"
             >
-              {waveforms[seg.seed] && (
-                <polygon
-                  points={waveforms[seg.seed]}
-                  fill="hsl(var(--accent) / 0.25)"
-                  stroke="hsl(var(--accent) / 0.6)"
-                  strokeWidth="0.5"
-                  className="group-hover/wave:fill-[hsl(var(--accent)/0.35)] transition-all"
-                />
-              )}
+              <polygon
+                points={peakPolygon(peaks)}
+                fill="hsl(var(--accent) / 0.25)"
+                stroke="hsl(var(--accent) / 0.6)"
+                strokeWidth="0.5"
+                vectorEffect="non-scaling-stroke"
+                className="group-hover/wave:fill-[hsl(var(--accent)/0.35)] transition-all"
+              />
             </svg>
           </div>
-        ))}
+        ) : (
+          <div className="absolute inset-0 flex items-center justify-center text-xs text-muted-foreground/30 font-mono">
+            NO AUDIO
+          </div>
+        )}
       </div>
     </div>
   );
@@ -1,11 +1,12 @@
 "use client";
 
-import { useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogFooter, DialogDescription } from "@/components/ui/dialog";
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
 import { Label } from "@/components/ui/label";
-import { Loader2, Download, Video } from "lucide-react";
+import { Progress } from "@/components/ui/progress";
+import { Loader2, Download, Video, X } from "lucide-react";
 import { useProject } from "@/hooks/use-project";
 import { toast } from "sonner";
 
@@ -19,6 +20,13 @@ export function ExportModal({ open, onOpenChange }: ExportModalProps) {
     const [vstPath, setVstPath] = useState("");
     const [isRendering, setIsRendering] = useState(false);
     const [resultUrl, setResultUrl] = useState<string | null>(null);
+    const [jobId, setJobId] = useState<string | null>(null);
+    const [phase, setPhase] = useState<string | null>(null);
+    const [progress, setProgress] = useState(0);
+    const eventsRef = useRef<EventSource | null>(null);
+
+    // Close the progress stream if the modal unmounts mid-export
+    useEffect(() => () => eventsRef.current?.close(), []);
 
     // Extract session ID from video URL
     // URL format: http://localhost:8000/files/session_DATE_TIME_video.mp4
@@ -44,6 +52,8 @@ export function ExportModal({ open, onOpenChange }: ExportModalProps) {
 
         setIsRendering(true);
         setResultUrl(null);
+        setPhase(null);
+        setProgress(0);
 
         try {
             const response = await fetch("http://localhost:8000/export", {
@@ -57,20 +67,65 @@ export function ExportModal({ open, onOpenChange }: ExportModalProps) {
 
             const data = await response.json();
 
-            if (data.status === "done") {
-                setResultUrl(data.url);
-                toast.success("Export complete!");
-            } else {
+            if (data.status !== "queued") {
                 throw new Error(data.message || "Export failed");
             }
+            setJobId(data.job_id);
+            followJob(data.job_id);
         } catch (err: any) {
             console.error(err);
             toast.error(`Export failed: ${err.message}`);
-        } finally {
             setIsRendering(false);
         }
     };
 
+    // Stream job progress from the backend until it finishes
+    const followJob = (id: string) => {
+        eventsRef.current?.close();
+        const events = new EventSource(`http://localhost:8000/export/jobs/${id}/events`);
+        eventsRef.current = events;
+
+        events.onmessage = (e) => {
+            const job = JSON.parse(e.data);
+            setPhase(job.phase);
+            // Render is the bulk of the work; muxing fills the last stretch of the bar
+            const overall = job.phase === "mux" ? 70 + job.progress * 30 : job.progress * 70;
+            setProgress(job.status === "done" ? 100 : overall);
+
+            if (job.status === "done" || job.status === "error" || job.status === "cancelled") {
+                events.close();
+                eventsRef.current = null;
+                setIsRendering(false);
+                setJobId(null);
+                if (job.status === "done") {
+                    setResultUrl(job.url);
+                    toast.success("Export complete!");
+                } else if (job.status === "error") {
+                    toast.error(`Export failed: ${job.message}`);
+                } else {
+                    toast("Export cancelled");
+                }
+            }
+        };
+        events.onerror = () => {
+            // EventSource reconnects on its own; only give up once the stream is closed for good
+            if (events.readyState === EventSource.CLOSED) {
+                setIsRendering(false);
+                setJobId(null);
+                toast.error("Lost connection to export job");
+            }
+        };
+    };
+
+    const handleCancel = async () => {
+        if (!jobId) return;
+        try {
+            await fetch(`http://localhost:8000/export/jobs/${jobId}/cancel`, { method: "POST" });
+        } catch (err) {
+            console.error(err);
+        }
+    };
+
     return (
         <Dialog open={open} onOpenChange={onOpenChange}>
             <DialogContent className="sm:max-w-md">
@@ -97,6 +152,15 @@ export function ExportModal({ open, onOpenChange }: ExportModalProps) {
                                 Paste the absolute path to a .vst3 file on your system.
                             </p>
                         </div>
+                        {isRendering && (
+                            <div className="flex flex-col gap-2">
+                                <Progress value={progress} />
+                                <p className="text-[10px] text-muted-foreground">
+                                    {phase === "mux" ? "Merging with video" : phase === "render" ? "Rendering audio" : "Waiting for a free worker"}
+                                    {" "}({Math.round(progress)}%)
+                                </p>
+                            </div>
+                        )}
                     </div>
                 ) : (
                     <div className="flex flex-col gap-4 py-4">
@@ -118,19 +182,27 @@ export function ExportModal({ open, onOpenChange }: ExportModalProps) {
                             </a>
                         </Button>
                     ) : (
-                        <Button type="button" onClick={handleExport} disabled={isRendering || !vstPath}>
-                            {isRendering ? (
-                                <>
-                                    <Loader2 className="mr-2 h-4 w-4 animate-spin" />
-                                    Rendering...
-                                </>
-                            ) : (
-                                <>
-                                    <Video className="mr-2 h-4 w-4" />
-                                    Render Video
-                                </>
+                        <>
+                            {isRendering && (
+                                <Button type="button" variant="ghost" onClick={handleCancel} disabled={!jobId}>
+                                    <X className="mr-2 h-4 w-4" />
+                                    Cancel
+                                </Button>
                             )}
-                        </Button>
+                            <Button type="button" onClick={handleExport} disabled={isRendering || !vstPath}>
+                                {isRendering ? (
+                                    <>
+                                        <Loader2 className="mr-2 h-4 w-4 animate-spin" />
+                                        Rendering...
+                                    </>
+                                ) : (
+                                    <>
+                                        <Video className="mr-2 h-4 w-4" />
+                                        Render Video
+                                    </>
+                                )}
+                            </Button>
+                        </>
                     )}
                 </DialogFooter>
             </DialogContent>
@@ -70,7 +70,15 @@ const ROW_HEIGHT = 24;
 const PX_PER_SEC = 50; // 1 second = 50px (Visual resolution) 
 const SNAP_GRID = 0.25; // Snap to quarter seconds (approx 16th at 120)
 
-import { Midi } from "@tonejs/midi";
+const PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"];
+const pitchName = (pitch: number) => `${PITCH_CLASSES[pitch % 12]}${Math.floor(pitch / 12) - 1}`;
+
+interface NoteColumns {
+  start: number[];
+  end: number[];
+  pitch: number[];
+  velocity: number[];
+}
 
 interface PianoRollProps {
   midiUrl: string | null;
@@ -107,28 +115,31 @@ export default function PianoRoll({ midiUrl, currentTime, isRecording }: PianoRo
     async function loadMidi() {
       if (!midiUrl) return;
       try {
-        const midi = await Midi.fromUrl(midiUrl);
+        // The roll draws the whole timeline at once, so it asks for all of it; the backend answers from its
+        // parsed note table with just the notes in that span, instead of the browser parsing the .mid.
+        // Key-release ends (sustain=false), the same durations use-playback schedules.
+        const sessionId = midiUrl.split("/").pop()?.replace(/_midi\.mid$/, "");
+        const res = await fetch(
+          `http://localhost:8000/recordings/${sessionId}/notes?start=0&end=${TOTAL_SECONDS}&sustain=false`
+        );
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        const columns: NoteColumns = await res.json();
         const newNotes: MidiNote[] = [];
 
-        midi.tracks.forEach(track => {
-          track.notes.forEach((note, index) => {
-            const rowIndex = NOTE_NAMES.indexOf(note.name);
-            if (rowIndex === -1) return;
-
-            // Use absolute pixel positioning
-            const left = note.time * PX_PER_SEC;
-            const width = Math.max(2, note.duration * PX_PER_SEC);
-
-            newNotes.push({
-              id: `n-${index}-${note.time}`,
-              row: rowIndex,
-              col: left, // abusing 'col' to store px position for dragging logic, or convert?
-              // Let's keep strict types. We should update MidiNote interface or just cast.
-              // Actually, let's keep 'col' as 'time' mapping for compatibility or just refactor.
-              // To minimize diff, let's say: col = pixels.
-              width: width,
-              velocity: note.velocity
-            });
+        columns.start.forEach((start, index) => {
+          const rowIndex = NOTE_NAMES.indexOf(pitchName(columns.pitch[index]));
+          if (rowIndex === -1) return;
+
+          // Use absolute pixel positioning
+          const left = start * PX_PER_SEC;
+          const width = Math.max(2, (columns.end[index] - start) * PX_PER_SEC);
+
+          newNotes.push({
+            id: `n-${index}-${start}`,
+            row: rowIndex,
+            col: left, // col = pixels
+            width: width,
+            velocity: columns.velocity[index] / 127
           });
         });
         setNotes(newNotes);
@@ -18,6 +18,8 @@ export default function Timeline({ videoUrl, midiUrl, currentTime, isRecording =
   // Use pixel based positioning
   const playheadLeft = currentTime * PX_PER_SEC;
   const totalWidth = TOTAL_SECONDS * PX_PER_SEC;
+  // Every file of a take is named {session_id}_{kind}
+  const sessionId = videoUrl?.split("/").pop()?.replace(/_video\.mp4$/, "") ?? null;
 
   return (
     <div className="flex flex-col h-full bg-card">
@@ -73,7 +75,7 @@ export default function Timeline({ videoUrl, midiUrl, currentTime, isRecording =
                 We should strip PianoRoll's internal horizontal scroll and let this parent div handle it.
             */}
               <VideoTrack videoUrl={videoUrl} />
-              <AudioTrack />
+              <AudioTrack sessionId={sessionId} />
 
               {/* Piano Roll - Global Scroll handled by parent, internal scroll removed */}
               <div className="relative border-t border-border">
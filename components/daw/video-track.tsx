@@ -1,6 +1,7 @@
 "use client";
 
 import { Video, Volume2, Eye, Lock } from "lucide-react";
+import { useEffect, useState } from "react";
 
 const videoClips = [
   { start: 2, width: 18, label: "Intro.mp4" },
@@ -13,7 +14,28 @@ interface VideoTrackProps {
   videoUrl: string | null;
 }
 
+interface ThumbnailStrip {
+  duration: number;
+  interval: number;
+  thumb_width: number;
+  thumb_height: number;
+  tiles: { time: number; sheet: string; x: number; y: number }[];
+}
+
 export default function VideoTrack({ videoUrl }: VideoTrackProps) {
+  const [thumbnails, setThumbnails] = useState<ThumbnailStrip | null>(null);
+
+  useEffect(() => {
+    setThumbnails(null);
+    const sessionId = videoUrl?.split("/").pop()?.replace(/_video\.mp4$/, "");
+    if (!sessionId) return;
+    // Only the sprite tiles for the visible strip are fetched, never the video itself
+    fetch(`http://localhost:8000/recordings/${sessionId}/thumbnails?count=8`)
+      .then((res) => (res.ok ? res.json() : null))
+      .then((data) => setThumbnails(data))
+      .catch(() => setThumbnails(null));
+  }, [videoUrl]);
+
   return (
     <div className="flex border-b border-border group">
       {/* Track header */}
@@ -75,15 +97,28 @@ export default function VideoTrack({ videoUrl }: VideoTrackProps) {
               width: `100%`, // Spanning full width for now as "one take"
             }}
           >
-            {/* Thumbnail lines */}
+            {/* Thumbnails */}
             <div className="absolute inset-0 overflow-hidden rounded-sm">
-              {Array.from({ length: 8 }).map((_, j) => (
-                <div
-                  key={j}
-                  className="absolute top-0 bottom-0 w-px bg-[hsl(210,100%,55%)]/10"
-                  style={{ left: `${(j + 1) * 12}%` }}
-                />
-              ))}
+              {thumbnails && thumbnails.duration > 0
+                ? thumbnails.tiles.map((tile) => (
+                    <div
+                      key={tile.time}
+                      className="absolute top-0 bottom-0 opacity-60 bg-no-repeat"
+                      style={{
+                        left: `${(tile.time / thumbnails.duration) * 100}%`,
+                        width: `${(thumbnails.interval / thumbnails.duration) * 100}%`,
+                        backgroundImage: `url(${tile.sheet})`,
+                        backgroundPosition: `-${tile.x}px -${tile.y}px`,
+                      }}
+                    />
+                  ))
+                : Array.from({ length: 8 }).map((_, j) => (
+                    <div
+                      key={j}
+                      className="absolute top-0 bottom-0 w-px bg-[hsl(210,100%,55%)]/10"
+                      style={{ left: `${(j + 1) * 12}%` }}
+                    />
+                  ))}
             </div>
             <div className="absolute top-1 left-1.5 text-[9px] font-mono text-[hsl(210,100%,70%)] truncate max-w-[calc(100%-12px)]">
               {videoUrl.split('/').pop()}
@@ -25,7 +25,16 @@ fi
 python3 -m backend.server &
 BACKEND_PID=$!
 
-sleep 2
+# /health answers as soon as the server is listening; capture libraries keep loading in the background
+echo "Waiting for backend on port 8000..."
+until curl -sf http://localhost:8000/health > /dev/null; do
+  if ! kill -0 $BACKEND_PID 2>/dev/null; then
+    echo "Backend exited during startup"
+    exit 1
+  fi
+  sleep 0.1
+done
+echo "Backend is up!"
 
 # 2. Start Frontend (Force Port)
 echo "Starting Next.js Frontend..."